@@ -0,0 +1,292 @@
+"""Benchmarks for the rename engine on synthetic directory trees
+
+Builds a tree of empty files (on tmpfs and/or on disk), then times name
+generation, collision resolution, the preflight check, the renames and
+undoing them. Each case runs in a fresh process so peak RSS is its own.
+Results are appended as JSON lines, one per case:
+
+    python benchmarks/bench_rename.py --counts 1000,100000 --collisions 0.1 --output results.jsonl
+    python benchmarks/bench_rename.py --compare old.jsonl new.jsonl
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from dirindex import DirectoryIndex  # noqa: E402
+from renamer import FileRenamer  # noqa: E402
+from rules import RenamePlan  # noqa: E402
+from selection import FileSelection  # noqa: E402
+
+# Filesystem calls counted while a phase runs; pathlib goes through these too
+COUNTED_CALLS = ("rename", "replace", "stat", "lstat", "scandir", "listdir", "access", "open")
+PREVIEW_ROWS = 15
+LEGACY_SAMPLE = 10000
+
+
+class SyscallCounter:
+    """Count calls to the os functions in COUNTED_CALLS while active"""
+
+    def __init__(self):
+        self.counts = dict.fromkeys(COUNTED_CALLS, 0)
+        self._saved = {}
+
+    def __enter__(self):
+        for name in COUNTED_CALLS:
+            original = getattr(os, name)
+            self._saved[name] = original
+            setattr(os, name, self._wrap(name, original))
+        return self
+
+    def __exit__(self, *exc):
+        for name, original in self._saved.items():
+            setattr(os, name, original)
+
+    def _wrap(self, name, original):
+        counts = self.counts
+
+        def counted(*args, **kwargs):
+            counts[name] += 1
+            return original(*args, **kwargs)
+        return counted
+
+    def total(self):
+        return sum(self.counts.values())
+
+
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def build_tree(base, count, fanout, collision_rate):
+    """Create count files spread over folders of fanout files each
+
+    Files are named orig_NNNNNNN.dat and will be renamed to fileNNNNNNN.dat;
+    collision_rate of the targets already exist as other files, so the
+    renamer has to pick name_N variants for them.
+    """
+    files = []
+    for i in range(count):
+        folder = base / f"dir{i // fanout:05d}"
+        if i % fanout == 0:
+            folder.mkdir(parents=True)
+        path = folder / f"orig_{i:07d}.dat"
+        path.touch()
+        files.append(path)
+    if collision_rate > 0:
+        step = max(1, round(1 / collision_rate))
+        for i in range(0, count, step):
+            (base / f"dir{i // fanout:05d}" / f"file{i + 1:07d}.dat").touch()
+    return files
+
+
+def timed(phase, results, func, *args, items=None, **kwargs):
+    with SyscallCounter() as counter:
+        start = time.perf_counter()
+        value = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    results[phase] = {
+        "seconds": round(elapsed, 6),
+        "per_second": round(items / elapsed, 1) if items and elapsed > 0 else None,
+        "syscalls": counter.total(),
+        "calls": {name: n for name, n in counter.counts.items() if n},
+    }
+    return value
+
+
+def run_case(case):
+    """Run one benchmark case and return its result record"""
+    count = case["count"]
+    base = Path(tempfile.mkdtemp(prefix="qr-bench-", dir=case["root"]))
+    try:
+        files = build_tree(base, count, case["fanout"], case["collisions"])
+        renamer = FileRenamer()
+        plan = RenamePlan.from_options(use_sequential=True, base_name="file", number_padding="7")
+        phases = {}
+
+        # What add_files/update_preview do: fill the selection, draw one screen of rows
+        selection = timed("add_files", phases, FileSelection, files, items=count)
+        timed("preview_rows", phases,
+              lambda: [plan.name_for(selection[i], i) for i in range(min(PREVIEW_ROWS, count))],
+              items=min(PREVIEW_ROWS, count))
+
+        names = timed("generate_names", phases, plan.apply, selection, items=count)
+        sample = list(selection)[:LEGACY_SAMPLE]
+        timed("generate_new_name", phases,
+              lambda: [renamer.generate_new_name(path, i, True, "file", "1", "7", False, "", False, "")
+                       for i, path in enumerate(sample)],
+              items=len(sample))
+
+        index = DirectoryIndex()
+        timed("get_safe_filename", phases,
+              lambda: [renamer.get_safe_filename(path.parent, name, index)
+                       for path, name in zip(selection, names)],
+              items=count)
+
+        report = timed("preflight", phases, renamer.preflight, selection, names, items=count)
+        current = list(report.files)
+        result = timed("rename_files", phases, renamer.rename_files, current, report.names,
+                       workers=case["workers"], items=len(current))
+        history = result[3]
+        timed("undo", phases,
+              lambda: [new_path.rename(old_path) for old_path, new_path in reversed(history)],
+              items=len(history))
+
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "fs": case["fs"],
+            "count": count,
+            "fanout": case["fanout"],
+            "collisions": case["collisions"],
+            "workers": case["workers"],
+            "errors": result[1],
+            "peak_rss_kb": peak_rss_kb(),
+            "phases": phases,
+        }
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+def _case_worker(case, queue):
+    try:
+        queue.put(run_case(case))
+    except Exception as e:
+        queue.put({"error": repr(e), **case})
+
+
+def run_isolated(case):
+    """Run a case in a fresh process so its peak RSS is not inflated by earlier cases"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_case_worker, args=(case, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def mount_type(path):
+    """Filesystem type of the mount holding path, from /proc/mounts; None where unknown"""
+    try:
+        with open("/proc/mounts", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best = None
+    for mount_point, fs_type in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        inside = path == mount_point or path.startswith(mount_point.rstrip("/") + "/")
+        if inside and (best is None or len(mount_point) > len(best[0])):
+            best = (mount_point, fs_type)
+    return best[1] if best else None
+
+
+def filesystem_roots(kinds, disk_root):
+    roots = {}
+    for kind in kinds:
+        if kind == "tmpfs":
+            if os.path.isdir("/dev/shm"):
+                roots[kind] = "/dev/shm"
+            else:
+                print("Skipping tmpfs: /dev/shm not available", file=sys.stderr)
+        else:
+            if mount_type(disk_root) in ("tmpfs", "ramfs"):
+                print(f"Warning: '{disk_root}' is in memory ({mount_type(disk_root)}), so the disk "
+                      f"numbers will not measure a disk; pass --disk-root", file=sys.stderr)
+            roots[kind] = disk_root
+    return roots
+
+
+def case_key(record):
+    return (record.get("fs"), record.get("count"), record.get("fanout"),
+            record.get("collisions"), record.get("workers"))
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        return {case_key(record): record for record in map(json.loads, f) if "phases" in record}
+
+
+def compare(old_path, new_path):
+    """Print the per-phase throughput change between two result files"""
+    old = load_results(old_path)
+    new = load_results(new_path)
+    for key in sorted(set(old) & set(new), key=str):
+        fs, count, fanout, collisions, workers = key
+        print(f"{fs} count={count} fanout={fanout} collisions={collisions} workers={workers}")
+        for phase, after in new[key]["phases"].items():
+            before = old[key]["phases"].get(phase)
+            if not before or not before["per_second"] or not after["per_second"]:
+                continue
+            change = (after["per_second"] / before["per_second"] - 1) * 100
+            print(f"  {phase:18} {before['per_second']:>12.0f} -> {after['per_second']:>12.0f}/s  {change:+6.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", default="1000,10000,100000",
+                        help="comma-separated file counts (default: 1000,10000,100000)")
+    parser.add_argument("--collisions", default="0,0.1",
+                        help="comma-separated fractions of targets that already exist (default: 0,0.1)")
+    parser.add_argument("--fanout", default="1000",
+                        help="comma-separated files per folder (default: 1000)")
+    parser.add_argument("--fs", default="tmpfs,disk", help="where to build trees: tmpfs, disk or both")
+    parser.add_argument("--disk-root", default=os.curdir,
+                        help="folder for on-disk trees (default: the current folder; the temp "
+                             "folder is often tmpfs)")
+    parser.add_argument("--workers", type=int, default=8, help="rename_files workers (default: 8)")
+    parser.add_argument("--output", help="append JSON lines results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    roots = filesystem_roots([kind.strip() for kind in args.fs.split(",")], args.disk_root)
+    output = open(args.output, "a", encoding="utf-8") if args.output else None
+    try:
+        for fs, root in roots.items():
+            for count in map(int, args.counts.split(",")):
+                for fanout in map(int, args.fanout.split(",")):
+                    for collisions in map(float, args.collisions.split(",")):
+                        case = {"fs": fs, "root": root, "count": count, "fanout": fanout,
+                                "collisions": collisions, "workers": args.workers}
+                        record = run_isolated(case)
+                        if "error" in record:
+                            print(f"{fs} count={count}: failed: {record['error']}", file=sys.stderr)
+                            continue
+                        print(f"{fs} count={count} fanout={fanout} collisions={collisions} "
+                              f"peak RSS {record['peak_rss_kb']} KB")
+                        for phase, stats in record["phases"].items():
+                            rate = f"{stats['per_second']:>12.0f}/s" if stats["per_second"] else " " * 14
+                            print(f"  {phase:18} {stats['seconds']:>9.3f}s {rate} {stats['syscalls']:>9} syscalls")
+                        if output is not None:
+                            output.write(json.dumps(record) + "\n")
+                            output.flush()
+    finally:
+        if output is not None:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
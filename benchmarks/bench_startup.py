@@ -0,0 +1,108 @@
+"""Startup time of the GUI against an import budget
+
+Measures how long importing gui takes (with the slowest modules from
+python -X importtime) and, when a display is available, how long main.py
+takes to show its window and to finish loading the optional parts:
+
+    python benchmarks/bench_startup.py --runs 5 --budget-ms 120
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+STARTUP_REPORT_ENV = "QUICKRENAMER_STARTUP_REPORT"
+DEFAULT_BUDGET_MS = 150
+
+
+def import_profile(module):
+    """Return (total_ms, {module: cumulative_ms}) for one cold import of module"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    modules = {}
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # The header line
+        ms = int(cumulative) / 1000
+        modules[name.strip()] = ms
+        if name.strip() == module:
+            total = ms
+    return total, modules
+
+
+def window_times(timeout):
+    """Startup stages of main.py in ms, or None if no window could be opened"""
+    handle, report = tempfile.mkstemp(suffix=".json")
+    os.close(handle)
+    try:
+        env = dict(os.environ, **{STARTUP_REPORT_ENV: report})
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, str(ROOT / "main.py")], cwd=ROOT, env=env,
+                                capture_output=True, text=True, timeout=timeout)
+        elapsed = (time.perf_counter() - start) * 1000
+        if result.returncode != 0 or os.path.getsize(report) == 0:
+            return None
+        with open(report, encoding="utf-8") as f:
+            stages = json.load(f)
+        stages["process"] = round(elapsed, 1)
+        return stages
+    finally:
+        os.remove(report)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="runs to take the median of (default: 5)")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help=f"fail if importing gui takes longer than this (default: {DEFAULT_BUDGET_MS})")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list (default: 10)")
+    parser.add_argument("--no-window", action="store_true", help="only measure imports")
+    parser.add_argument("--output", help="append a JSON line with the results to this file")
+    args = parser.parse_args(argv)
+
+    profiles = [import_profile("gui") for _ in range(args.runs)]
+    import_ms = statistics.median(total for total, _ in profiles)
+    profiles.sort(key=lambda profile: profile[0])
+    slowest = profiles[(len(profiles) - 1) // 2][1]
+    print(f"import gui: {import_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, ms in sorted(slowest.items(), key=lambda item: -item[1])[1:args.top + 1]:
+        print(f"  {name:30} {ms:8.1f} ms")
+
+    record = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "import_ms": round(import_ms, 1),
+        "budget_ms": args.budget_ms,
+    }
+    if not args.no_window:
+        runs = [window_times(timeout=30) for _ in range(args.runs)]
+        runs = [stages for stages in runs if stages is not None]
+        if runs:
+            stages = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+            record["stages_ms"] = stages
+            print("main.py: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in stages.items()))
+        else:
+            print("main.py: could not open a window (no display?)", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    if import_ms > args.budget_ms:
+        print(f"Over budget by {import_ms - args.budget_ms:.1f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+"""Command-line entry point for QuickRenamer
+
+Runs the same rename engine as the GUI without importing tkinter, so it can
+be used on servers, from cron jobs and in pipelines:
+
+    python main.py --sequential --base-name img_ --padding 4 photos/ --apply
+"""
+import argparse
+import glob
+import os
+import sys
+
+from ingest import iter_files, parse_patterns
+from journal import RenameJournal
+from manifest import apply_manifest, manifest_format, write_manifest
+from presets import PresetStore
+from renamer import FileRenamer
+from rules import RenamePlan
+from selection import FileSelection
+from sorting import SortKeyCache, parse_sort_keys
+from stats import RenameStats
+from watch import PollingWatcher, WatchConfig, WatchDaemon, open_watcher
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="quickrenamer",
+        description="Batch rename files. Without --apply only the planned names are printed.")
+    parser.add_argument("paths", nargs="*", metavar="PATH",
+                        help="files, glob patterns or folders to rename")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="include files in subfolders of the given folders")
+    parser.add_argument("--filter", default="", metavar="PATTERNS",
+                        help='only take files matching these globs from folders, e.g. "*.jpg;*.png"')
+    parser.add_argument("--sort", metavar="KEYS",
+                        help='order files before numbering, e.g. "date,name" or "-size"; '
+                             "keys: name, path, mtime, ctime, size, date (natural order for names)")
+
+    naming = parser.add_argument_group("rename options")
+    naming.add_argument("--sequential", action="store_true", help="sequential rename")
+    naming.add_argument("--base-name", default="file", help="base name for sequential rename (default: file)")
+    naming.add_argument("--start", default="1", help="start number (default: 1)")
+    naming.add_argument("--padding", default="2", help="number padding (default: 2)")
+    naming.add_argument("--prefix", default="", help="text to add before the name")
+    naming.add_argument("--suffix", default="", help="text to add after the name")
+    naming.add_argument("--template", default="",
+                        help='build names from tokens, e.g. "{date:%%Y%%m%%d}_{seq:04}"; '
+                             "tokens: name, seq, date, mtime, ctime, size, hash")
+    naming.add_argument("--find", default="", help="text to replace in the names")
+    naming.add_argument("--replace", default="", help="replacement for --find (regex: \\1, \\g<name>)")
+    naming.add_argument("--regex", action="store_true", help="treat --find as a regular expression")
+    naming.add_argument("--ignore-case", action="store_true", help="match --find ignoring case")
+    naming.add_argument("--preset", metavar="NAME",
+                        help="use the rename options saved under NAME (in the GUI or with --save-preset)")
+    naming.add_argument("--save-preset", metavar="NAME",
+                        help="save the rename options given here under NAME")
+    naming.add_argument("--hash-names", action="store_true",
+                        help="name files after their content hash (overrides the other options)")
+    naming.add_argument("--duplicates", choices=("report", "skip"),
+                        help="find files with identical content; report them, or skip all but "
+                             "the first copy of each when renaming")
+
+    run = parser.add_argument_group("execution")
+    run.add_argument("--apply", action="store_true", help="rename the files (default is a dry run)")
+    run.add_argument("--move-to", metavar="FOLDER",
+                     help="move the renamed files into this folder (created if needed), "
+                          "copying them when it is on another drive")
+    run.add_argument("--copy-workers", type=int, default=4,
+                     help="with --move-to, files copied at once between drives (default: 4)")
+    run.add_argument("--workers", type=int, default=8, help="folders renamed in parallel (default: 8)")
+    run.add_argument("--journal", metavar="FILE",
+                     help="log renames to this journal so an interrupted run can be recovered")
+    run.add_argument("--recover", choices=("resume", "rollback"),
+                     help="finish or roll back interrupted batches in --journal, then exit")
+    run.add_argument("--export-manifest", metavar="FILE",
+                     help="write the checked plan to a .csv or .jsonl manifest (path,new_name) "
+                          "that can be edited and applied later with --manifest")
+    run.add_argument("--manifest", metavar="FILE",
+                     help="rename the files listed in a .csv or .jsonl manifest instead of "
+                          "using rename options; an interrupted --apply continues where it stopped")
+    run.add_argument("--restart", action="store_true",
+                     help="with --manifest, ignore the checkpoint of an earlier run and start over")
+    run.add_argument("--stats", metavar="FILE",
+                     help="write timings, syscall counts and rename latencies to this JSON file")
+    run.add_argument("--trace", metavar="FILE",
+                     help="write a trace-event file for chrome://tracing or Perfetto")
+    run.add_argument("--watch", metavar="CONFIG",
+                     help="keep running and rename files as they arrive in the given folders; "
+                          "the rename options and sequence position are saved to CONFIG, "
+                          "so later runs only need --watch CONFIG")
+    run.add_argument("--settle", type=float, default=2.0,
+                     help="with --watch, seconds a new file must stay unchanged (default: 2)")
+    run.add_argument("--poll", action="store_true",
+                     help="with --watch, poll the folders instead of using inotify")
+    run.add_argument("-q", "--quiet", action="store_true", help="only print errors and the summary")
+    return parser
+
+
+def collect_files(paths, recursive=False, patterns=None):
+    """Expand files, glob patterns and folders into a de-duplicated list of files"""
+    files = FileSelection()
+
+    for arg in paths:
+        if any(char in arg for char in "*?["):
+            matches = sorted(glob.iglob(arg, recursive=recursive))
+        else:
+            matches = [arg]
+
+        for match in matches:
+            if os.path.isdir(match):
+                files.extend(iter_files([match], recursive, patterns))
+            elif os.path.isfile(match):
+                files.add(match)
+            else:
+                print(f"Skipping {match}: not a file or folder", file=sys.stderr)
+    return files
+
+
+def recover(renamer, journal, rollback):
+    batches = journal.interrupted_batches()
+    total_errors = 0
+    for batch in batches:
+        success_count, error_count, errors = renamer.recover_batch(journal, batch, rollback=rollback)
+        for error in errors:
+            print(f"Error: {error}", file=sys.stderr)
+        action = "Rolled back" if rollback else "Finished"
+        print(f"{action} batch {batch}: {success_count} files, {error_count} errors")
+        total_errors += error_count
+    if not batches:
+        print("No interrupted batches.")
+    return 1 if total_errors else 0
+
+
+def rule_options(args):
+    """RenamePlan.from_options arguments for the rename options on the command line"""
+    return {
+        "use_sequential": args.sequential,
+        "base_name": args.base_name,
+        "start_number": args.start,
+        "number_padding": args.padding,
+        "use_prefix": bool(args.prefix),
+        "prefix_text": args.prefix,
+        "use_suffix": bool(args.suffix),
+        "suffix_text": args.suffix,
+        "use_template": bool(args.template),
+        "template_text": args.template,
+        "use_replace": bool(args.find),
+        "find_text": args.find,
+        "replace_text": args.replace,
+        "use_regex": args.regex,
+        "ignore_case": args.ignore_case,
+    }
+
+
+def watch(args, parser, renamer, journal, options):
+    """Run as a daemon renaming new files; folders on the command line (re)write the config"""
+    if args.paths:
+        directories = [path for path in args.paths if os.path.isdir(path)]
+        if len(directories) != len(args.paths):
+            parser.error("--watch takes folders only")
+        next_index = 0
+        if os.path.exists(args.watch):
+            next_index = WatchConfig.load(args.watch).next_index
+        config = WatchConfig(args.watch, directories, options, args.filter, next_index)
+        config.save()
+    elif os.path.exists(args.watch):
+        config = WatchConfig.load(args.watch)
+    else:
+        parser.error(f"{args.watch} does not exist; give the folders to watch to create it")
+    try:
+        config.plan()
+    except (TypeError, ValueError) as e:
+        parser.error(f"invalid rename options in {args.watch}: {e}")
+
+    watcher = open_watcher(config.directories, poll=args.poll)
+    daemon = WatchDaemon(renamer, config, watcher, journal=journal, settle=args.settle)
+    method = "polling" if isinstance(watcher, PollingWatcher) else "inotify"
+    print(f"Watching {len(config.directories)} folders ({method}), Ctrl+C to stop", file=sys.stderr)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    print(f"Renamed {daemon.renamed} files", file=sys.stderr)
+    return 0
+
+
+def run_manifest(args, parser, renamer, journal, out):
+    """Check, and with --apply rename, the files in args.manifest chunk by chunk"""
+    if args.paths:
+        parser.error("--manifest takes no paths; the files are listed in the manifest")
+    if not os.path.isfile(args.manifest):
+        parser.error(f"{args.manifest} does not exist")
+    if args.move_to and args.apply:
+        os.makedirs(args.move_to, exist_ok=True)
+    rows = renamed = skipped = error_count = 0
+    chunks = apply_manifest(renamer, args.manifest, args.apply, args.move_to, args.workers, journal,
+                            resume=not args.restart)
+    try:
+        for chunk in chunks:
+            report = chunk.report
+            rows += len(chunk.files) + len(chunk.repeated)
+            skipped += chunk.skipped
+            for line, issue in chunk.issues():
+                print(f"Warning: line {line}: {issue}", file=sys.stderr)
+            if chunk.result is None:
+                renamed += len(report.files)
+                if not args.quiet:
+                    for file_path, new_name in zip(report.files, report.names):
+                        if args.move_to:
+                            new_name = os.path.join(args.move_to, new_name)
+                        out.write(f"{file_path} -> {new_name}\n")
+                continue
+            success_count, chunk_errors, errors, _ = chunk.result
+            renamed += success_count
+            error_count += chunk_errors
+            if not args.quiet:
+                for i, new_path in zip(report.indices, report.files):
+                    old_path = chunk.files[i]
+                    if old_path != new_path:
+                        out.write(f"{old_path} -> {new_path if args.move_to else new_path.name}\n")
+            for error in errors:
+                print(f"Error: {error}", file=sys.stderr)
+    except ValueError as e:
+        print(f"Error: {args.manifest}: {e}", file=sys.stderr)
+        return 1
+    if args.apply:
+        out.write(f"Renamed {renamed} files, {error_count} errors, {skipped} skipped\n")
+    else:
+        out.write(f"Dry run: {rows} rows, {renamed} files would be renamed, {skipped} skipped. "
+                  f"Use --apply to rename them.\n")
+    return 1 if error_count or skipped else 0
+
+
+def write_stats(args, stats):
+    if args.stats:
+        stats.dump_json(args.stats)
+    if args.trace:
+        stats.dump_trace(args.trace)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    stats = RenameStats(trace=bool(args.trace)) if args.stats or args.trace else None
+    renamer = FileRenamer(stats=stats)
+    journal = RenameJournal(args.journal) if args.journal else None
+
+    if args.recover:
+        if journal is None:
+            parser.error("--recover needs --journal")
+        return recover(renamer, journal, args.recover == "rollback")
+    for manifest in (args.manifest, args.export_manifest):
+        if manifest:
+            try:
+                manifest_format(manifest)
+            except ValueError as e:
+                parser.error(str(e))
+    if args.manifest:
+        code = run_manifest(args, parser, renamer, journal, sys.stdout)
+        if stats is not None:
+            write_stats(args, stats)
+        return code
+
+    options = rule_options(args)
+    if args.preset or args.save_preset:
+        presets = PresetStore()
+        if args.save_preset:
+            presets.save(args.save_preset, options)
+            print(f"Saved preset '{args.save_preset}'", file=sys.stderr)
+            if not args.paths and not args.watch:
+                return 0
+        if args.preset:
+            try:
+                options = renamer.load_preset(args.preset, presets)
+            except KeyError:
+                parser.error(f"no preset named '{args.preset}'")
+    if args.watch:
+        return watch(args, parser, renamer, journal, options)
+    if not args.paths:
+        parser.error("no files given")
+
+    files = collect_files(args.paths, args.recursive, parse_patterns(args.filter))
+    if not files:
+        print("No files to rename.", file=sys.stderr)
+        return 1
+    if args.sort:
+        try:
+            keys = parse_sort_keys(args.sort)
+        except ValueError as e:
+            parser.error(str(e))
+        files.reorder(SortKeyCache().sort_order(files, keys))
+
+    try:
+        plan = RenamePlan.from_options(**options)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.duplicates:
+        groups = renamer.find_duplicates(files)
+        for group in groups:
+            print("Duplicates:", file=sys.stderr)
+            for file_path in group:
+                print(f"  {file_path}", file=sys.stderr)
+        extra = sum(len(group) - 1 for group in groups)
+        print(f"{extra} duplicate files in {len(groups)} groups", file=sys.stderr)
+        if args.duplicates == "report":
+            return 0
+        drop = {file_path for group in groups for file_path in group[1:]}
+        files.remove_indices([i for i, file_path in enumerate(files) if file_path in drop])
+
+    if args.hash_names:
+        preview_names = renamer.hash_names(files)
+    else:
+        preview_names = plan.apply(files)
+
+    counts = plan.match_counts(files)
+    report = renamer.preflight(files, preview_names, args.move_to)
+    for issue in report.issues:
+        print(f"Warning: {issue}", file=sys.stderr)
+    if args.export_manifest:
+        count = write_manifest(args.export_manifest, zip(report.files, report.names))
+        print(f"Wrote {count} renames to {args.export_manifest}", file=sys.stderr)
+
+    out = sys.stdout
+    if not args.apply:
+        if not args.quiet:
+            for file_path, new_name in zip(report.files, report.names):
+                if args.move_to:
+                    new_name = os.path.join(args.move_to, new_name)
+                out.write(f"{file_path} -> {new_name}\n")
+        if counts is not None:
+            matched = sum(1 for count in counts if count)
+            out.write(f"--find matches {matched} of {len(counts)} files ({sum(counts)} matches)\n")
+        out.write(f"Dry run: {len(report.files)} files would be renamed, {len(report.skipped)} skipped. "
+                  f"Use --apply to rename them.\n")
+        if stats is not None:
+            write_stats(args, stats)
+        return 0
+
+    files = report.files
+    original_files = list(files)
+    if args.move_to:
+        os.makedirs(args.move_to, exist_ok=True)
+    success_count, error_count, errors, rename_history = renamer.rename_files(
+        files, report.names, workers=args.workers, journal=journal,
+        target_dir=args.move_to, copy_workers=args.copy_workers
+    )
+    if not args.quiet:
+        for old_path, new_path in zip(original_files, files):
+            if old_path != new_path:
+                out.write(f"{old_path} -> {new_path if args.move_to else new_path.name}\n")
+    for error in errors:
+        print(f"Error: {error}", file=sys.stderr)
+    out.write(f"Renamed {success_count} files, {error_count} errors, {len(report.skipped)} skipped\n")
+    if stats is not None:
+        write_stats(args, stats)
+    return 1 if error_count or report.skipped else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import hashlib
+import mmap
+import os
+from pathlib import Path
+
+BLOCK_SIZE = 64 * 1024
+HASH_CHUNK = 8 * 1024 * 1024
+MMAP_THRESHOLD = 4 * 1024 * 1024
+# Below this many files a process pool costs more to start than it saves
+POOL_THRESHOLD = 32
+
+
+def partial_hash(path):
+    """Hash of the first and last BLOCK_SIZE bytes; the whole file if it is smaller"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        digest.update(f.read(BLOCK_SIZE))
+        if size > 2 * BLOCK_SIZE:
+            f.seek(-BLOCK_SIZE, os.SEEK_END)
+        digest.update(f.read(BLOCK_SIZE))
+    return digest.hexdigest()
+
+
+def file_hash(path):
+    """SHA-1 of the whole file, memory-mapped when large so it is never read into memory at once"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    if hasattr(mapped, "madvise"):
+                        mapped.madvise(mmap.MADV_SEQUENTIAL)
+                    with memoryview(mapped) as view:
+                        for start in range(0, size, HASH_CHUNK):
+                            digest.update(view[start:start + HASH_CHUNK])
+                return digest.hexdigest()
+            except (OSError, ValueError, OverflowError):
+                # Address space too small or mapping not supported: stream instead
+                digest = hashlib.sha1()
+                f.seek(0)
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Top-level so they can be sent to pool workers; unreadable files hash to None
+
+def _partial_or_none(path):
+    try:
+        return partial_hash(path)
+    except OSError:
+        return None
+
+
+def _full_or_none(path):
+    try:
+        return file_hash(path)
+    except OSError:
+        return None
+
+
+def hash_many(func, paths, workers=None, job=None):
+    """Run func over paths, in a process pool when there are enough of them
+
+    Returns one result per path (None where the file could not be read), or
+    None if the job was cancelled.
+    """
+    paths = list(paths)
+    results = []
+    if workers == 1 or len(paths) < POOL_THRESHOLD:
+        for path in paths:
+            if job is not None and not job.checkpoint():
+                return None
+            results.append(func(path))
+            if job is not None:
+                job.advance()
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        chunksize = max(1, min(256, len(paths) // ((workers or os.cpu_count() or 1) * 4)))
+        for result in executor.map(func, paths, chunksize=chunksize):
+            if job is not None and not job.checkpoint():
+                return None
+            results.append(result)
+            if job is not None:
+                job.advance()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return results
+
+
+def hash_files(paths, workers=None, job=None):
+    """Full content hash of every path (None where unreadable), or None if cancelled"""
+    paths = list(paths)
+    if job is not None:
+        job.report(0, len(paths))
+    return hash_many(_full_or_none, paths, workers, job)
+
+
+def _regroup(groups, func, workers, job):
+    """Split every group by func(path); only groups with 2+ members survive"""
+    paths = [path for group in groups for path in group]
+    if job is not None:
+        job.report(0, len(paths))
+    hashes = hash_many(func, paths, workers, job)
+    if hashes is None:
+        return None
+
+    split = {}
+    position = 0
+    for number, group in enumerate(groups):
+        for path in group:
+            digest = hashes[position]
+            position += 1
+            if digest is not None:
+                split.setdefault((number, digest), []).append(path)
+    return [group for group in split.values() if len(group) > 1]
+
+
+def find_duplicates(paths, workers=None, job=None):
+    """Group files with identical content
+
+    Files are bucketed by size first, so most of them are never opened.
+    Same-size files are compared by a hash of their first and last block,
+    and only files that still collide are hashed in full. Returns lists of
+    duplicate paths (two or more each, in input order), or None if the job
+    was cancelled.
+    """
+    order = {}
+    sizes = {}
+    by_size = {}
+    for path in paths:
+        path = Path(path)
+        if path in order:
+            continue
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            continue
+        order[path] = len(order)
+        sizes[path] = size
+        by_size.setdefault(size, []).append(path)
+
+    candidates = [group for group in by_size.values() if len(group) > 1]
+    groups = _regroup(candidates, _partial_or_none, workers, job)
+    if groups is None:
+        return None
+
+    # The partial hash already covers small files completely
+    done = [group for group in groups if sizes[group[0]] <= 2 * BLOCK_SIZE]
+    pending = [group for group in groups if sizes[group[0]] > 2 * BLOCK_SIZE]
+    if pending:
+        pending = _regroup(pending, _full_or_none, workers, job)
+        if pending is None:
+            return None
+
+    duplicates = done + pending
+    duplicates.sort(key=lambda group: order[group[0]])
+    return duplicates
@@ -0,0 +1,124 @@
+import os
+import sys
+import threading
+
+
+def _default_case_insensitive():
+    return os.name == "nt" or sys.platform == "darwin"
+
+
+class DirectoryIndex:
+    """Snapshot of the names in each folder, used to resolve name collisions
+
+    Each folder is listed once with os.scandir the first time it is needed.
+    After that, claims and releases keep the snapshot in step with the renames
+    so collision checks never touch the disk again.
+    """
+
+    def __init__(self, case_insensitive=None):
+        self.case_insensitive = case_insensitive
+        self._names = {}      # folder -> set of name keys
+        self._folding = {}    # folder -> True if names compare case-insensitively
+        self._counters = {}   # (folder, stem key, extension key) -> next counter to try
+        self._lock = threading.Lock()
+        self.listings = 0     # folders listed so far
+
+    def _detect_case_insensitive(self, directory, listed):
+        if self.case_insensitive is not None:
+            return self.case_insensitive
+        # One lstat per folder: look up one of its own entries under the
+        # swapped-case name. Asking inside the folder gets the rules of the
+        # volume it is on, even when it is itself the mount point of a
+        # case-insensitive volume (a NAS share, a USB stick), and nothing is
+        # written. A folder with no names containing letters can't tell.
+        for name in listed:
+            swapped = name.swapcase()
+            if swapped == name or swapped.swapcase() != name:
+                continue
+            if swapped in listed:
+                return False
+            try:
+                os.lstat(os.path.join(directory, swapped))
+                return True
+            except OSError:
+                return False
+        return _default_case_insensitive()
+
+    def _entry(self, directory):
+        names = self._names.get(directory)
+        if names is not None:
+            return names, self._folding[directory]
+
+        with self._lock:
+            names = self._names.get(directory)
+            if names is None:
+                self.listings += 1
+                try:
+                    with os.scandir(directory) as entries:
+                        listed = {entry.name for entry in entries}
+                except FileNotFoundError:
+                    listed = set()
+                folding = self._detect_case_insensitive(directory, listed)
+                names = {name.casefold() for name in listed} if folding else listed
+                self._folding[directory] = folding
+                self._names[directory] = names
+        return names, self._folding[directory]
+
+    def relist(self, directory):
+        """List directory again and return the names that were not in the snapshot
+
+        Names gone from the folder are dropped from the snapshot. A folder
+        not listed before is just listed, with nothing new. Raises OSError
+        if the folder cannot be listed.
+        """
+        if directory not in self._names:
+            self._entry(directory)
+            return []
+        folding = self._folding[directory]
+        with os.scandir(directory) as entries:
+            listed = {entry.name for entry in entries}
+        with self._lock:
+            known = self._names[directory]
+            new = [name for name in listed if (name.casefold() if folding else name) not in known]
+            self._names[directory] = {name.casefold() for name in listed} if folding else listed
+            self.listings += 1
+        return new
+
+    def key(self, directory, name):
+        """Return the comparison key of name inside directory"""
+        _, folding = self._entry(directory)
+        return name.casefold() if folding else name
+
+    def contains(self, directory, name):
+        names, folding = self._entry(directory)
+        return (name.casefold() if folding else name) in names
+
+    def add(self, directory, name):
+        names, folding = self._entry(directory)
+        names.add(name.casefold() if folding else name)
+
+    def release(self, directory, name):
+        names, folding = self._entry(directory)
+        names.discard(name.casefold() if folding else name)
+
+    def claim(self, directory, desired_name):
+        """Reserve and return desired_name, or the first free name_N variant"""
+        names, folding = self._entry(directory)
+        key = desired_name.casefold() if folding else desired_name
+        if key not in names:
+            names.add(key)
+            return desired_name
+
+        stem, extension = os.path.splitext(desired_name)
+        counter_key = (directory, stem.casefold() if folding else stem,
+                       extension.casefold() if folding else extension)
+        counter = self._counters.get(counter_key, 1)
+        while True:
+            safe_name = f"{stem}_{counter}{extension}"
+            counter += 1
+            key = safe_name.casefold() if folding else safe_name
+            if key not in names:
+                break
+        self._counters[counter_key] = counter
+        names.add(key)
+        return safe_name
@@ -0,0 +1,133 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class VirtualFileList:
+    """Treeview that only materializes the rows currently on screen
+
+    The data stays in Python: row_values(index) returns the values of one row.
+    A fixed pool of Treeview items is reused while scrolling, so Tk memory and
+    redraw time stay the same whether the list holds 100 or 500k files.
+    Selection is tracked by data index, not by Treeview item.
+    """
+
+    def __init__(self, parent, columns, height=15, row_values=None):
+        self.height = height
+        self.row_values = row_values or (lambda index: ())
+        self.count = 0
+        self.offset = 0
+        self.selected = set()
+        self.anchor = None
+        self._pool = []
+        self._shown = []
+
+        self.tree = ttk.Treeview(parent, columns=columns, show='headings', height=height)
+        self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self._on_scrollbar)
+
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+        self.tree.bind('<ButtonRelease-1>', self._on_click)
+        self.tree.bind('<MouseWheel>', self._on_mousewheel)
+        self.tree.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll(3))
+        self.tree.bind('<Up>', lambda event: self._on_key(-1, event))
+        self.tree.bind('<Down>', lambda event: self._on_key(1, event))
+        self.tree.bind('<Prior>', lambda event: self._on_key(-self.height, event))
+        self.tree.bind('<Next>', lambda event: self._on_key(self.height, event))
+        self.tree.bind('<Home>', lambda event: self._on_key(-self.count, event))
+        self.tree.bind('<End>', lambda event: self._on_key(self.count, event))
+
+    # ---------------- Data ----------------
+
+    def set_count(self, count):
+        """Set the number of rows and redraw the visible window"""
+        self.count = count
+        self.selected = {index for index in self.selected if index < count}
+        self.offset = max(0, min(self.offset, count - self.height))
+        self.render()
+
+    def selection(self):
+        return sorted(self.selected)
+
+    def set_selection(self, indices):
+        self.selected = set(indices)
+        self.render()
+
+    def see(self, index):
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + self.height:
+            self.offset = index - self.height + 1
+        self.render()
+
+    def scroll(self, rows):
+        offset = max(0, min(self.offset + rows, self.count - self.height))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+        return "break"
+
+    # ---------------- Drawing ----------------
+
+    def render(self):
+        """Fill the row pool from the data, touching only rows whose values changed"""
+        visible = max(0, min(self.height, self.count - self.offset))
+        while len(self._pool) < visible:
+            self._pool.append(self.tree.insert("", "end"))
+            self._shown.append(None)
+        while len(self._pool) > visible:
+            self.tree.delete(self._pool.pop())
+            self._shown.pop()
+
+        for slot in range(visible):
+            values = self.row_values(self.offset + slot)
+            if self._shown[slot] != values:
+                self.tree.item(self._pool[slot], values=values)
+                self._shown[slot] = values
+
+        self.tree.selection_set([self._pool[slot] for slot in range(visible)
+                                 if self.offset + slot in self.selected])
+        if self.count:
+            self.scrollbar.set(self.offset / self.count, (self.offset + visible) / self.count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    # ---------------- Events ----------------
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.scroll(int(float(amount) * self.count) - self.offset)
+        elif unit == 'pages':
+            self.scroll(int(amount) * self.height)
+        else:
+            self.scroll(int(amount))
+
+    def _on_mousewheel(self, event):
+        return self.scroll(-3 if event.delta > 0 else 3)
+
+    def _on_select(self, event):
+        chosen = set(self.tree.selection())
+        for slot, iid in enumerate(self._pool):
+            if iid in chosen:
+                self.selected.add(self.offset + slot)
+            else:
+                self.selected.discard(self.offset + slot)
+
+    def _on_click(self, event):
+        focus = self.tree.focus()
+        if focus in self._pool:
+            self.anchor = self.offset + self._pool.index(focus)
+
+    def _on_key(self, step, event):
+        if not self.count:
+            return "break"
+        current = self.anchor if self.anchor is not None else self.offset
+        target = max(0, min(current + step, self.count - 1))
+        if event.state & 0x0001:  # Shift extends the selection
+            low, high = sorted((current, target))
+            self.selected.update(range(low, high + 1))
+        else:
+            self.selected = {target}
+        self.anchor = target
+        self.see(target)
+        self.tree.focus(self._pool[target - self.offset])
+        return "break"
@@ -1,20 +1,42 @@
+import os
+import queue
+import time
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-from pathlib import Path
-
+from array import array
+from tkinter import ttk, messagebox
+
+from filelist import VirtualFileList
+from ingest import FileIngestor, parse_patterns
+from jobs import Job, JobRunner
+from journal import PLANNED, RenameJournal
+from manifest import manifest_format, write_manifest
+from metadata import MetadataCache
+from mover import move_file
+from planner import TEMP_SUFFIX
+from presets import LAST_USED, ListFingerprint, PlanCache, PresetStore, file_signatures, options_hash
 from renamer import FileRenamer
-from utils import resource_path, check_drag_drop, DRAG_DROP_AVAILABLE, DND_FILES
+from rules import RenamePlan
+from selection import FileSelection, NameTable
+from sorting import SortKeyCache, parse_sort_keys
+from stats import RenameStats
+from utils import resource_path, app_data_dir, load_drag_drop
+
+PREVIEW_DELAY_MS = 150
+INGEST_POLL_MS = 50
+JOURNAL_KEEP_BATCHES = 100
+JOB_POLL_MS = 250
+METADATA_POLL_MS = 50
+MATCH_CHUNK = 5000
+# When set, startup timings are written to this JSON file and the app quits once ready
+STARTUP_REPORT_ENV = "QUICKRENAMER_STARTUP_REPORT"
 
 
 class BatchRenamer:
     """Main application class for the Batch File Renamer"""
 
-    def __init__(self):
-        if DRAG_DROP_AVAILABLE:
-            from tkinterdnd2 import TkinterDnD
-            self.root = TkinterDnD.Tk()
-        else:
-            self.root = tk.Tk()
+    def __init__(self, started=None):
+        self.startup = {"started": started if started is not None else time.perf_counter()}
+        self.root = tk.Tk()
 
         try:
             icon_file = resource_path("myicon.ico")
@@ -26,25 +48,83 @@ class BatchRenamer:
         self.center_window(800, 600)
         self.root.resizable(False, False)
 
-        # Start with dark mode -
-        # Theme Management
+        # Theme Management; the theme itself is applied once the window is up
         self.style = ttk.Style(self.root)
         self.theme_var = tk.StringVar(value="dark")
-        self.style.theme_use("xpnative")
 
         # State
-        self.selected_files = []
-        self.preview_names = []
+        self.selected_files = FileSelection()
         self.undo_stack = []
         self.redo_stack = []
-        self.renamer = FileRenamer()
+        self.renamer = FileRenamer(stats=RenameStats())
+        self.journal = None
+        self.dnd_files = None
+        self.rename_workers = 8
+        self.busy = False
+        self.jobs = JobRunner()
+        self.current_job = None
+        self.preview_plan = RenamePlan()
+        self.preview_options = None
+        self.presets = self.open_presets()
+        self.plan_cache = self.open_plan_cache()
+        self._fingerprint = None
+        self._cached_preview = None
+        self.metadata = MetadataCache()
+        self.sort_keys = SortKeyCache()
+        self._metadata_wanted = set()
+        self._metadata_pending = []
+        self._metadata_job = None
+        self.ingestors = []
+        self._ingest_added = 0
+        self._ingest_cancelled = False
+        self._ingest_job = None
+        self._preview_job = None
+        self._count_job = None
+        self._cache_job = None
 
         # Setup GUI
         self.setup_gui()
+        self.restore_options()
+        self.startup["built"] = time.perf_counter()
 
-        # Drag & Drop
-        if DRAG_DROP_AVAILABLE:
+        # Show the window first, then load the optional parts
+        self.root.after_idle(self.load_optional)
+
+    def load_optional(self):
+        """Load the theme, drag and drop and the rename journal after the window is drawn"""
+        self.root.update_idletasks()
+        self.startup["window"] = time.perf_counter()
+        try:
+            self.style.theme_use("xpnative")
+        except tk.TclError:
+            pass  # Only available on Windows
+        self.startup["theme"] = time.perf_counter()
+        self.dnd_files = load_drag_drop(self.root)
+        if self.dnd_files is not None:
             self.setup_drag_drop()
+        else:
+            self.drop_label.config(text="Drag and drop not available (install tkinterdnd2)")
+        self.startup["drag_drop"] = time.perf_counter()
+        self.journal = self.open_journal()
+        self.startup["ready"] = time.perf_counter()
+
+        report = os.environ.get(STARTUP_REPORT_ENV)
+        if report:
+            self.write_startup_report(report)
+            self.root.quit()
+            return
+        # Offer to finish or roll back a batch a previous session did not complete,
+        # once the window is up and handling events
+        self.root.after(JOB_POLL_MS, self.check_interrupted_batches)
+
+    def write_startup_report(self, path):
+        """Milliseconds from startup to each stage, for benchmarks/bench_startup.py"""
+        import json
+        started = self.startup["started"]
+        stages = {name: round((when - started) * 1000, 1)
+                  for name, when in self.startup.items() if name != "started"}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(stages, f)
 
     # ---------------- GUI Setup ----------------
 
@@ -66,19 +146,24 @@ class BatchRenamer:
     def setup_file_selection(self, parent):
         file_frame = ttk.LabelFrame(parent, text="File Selection", padding="5")
         file_frame.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
-        file_frame.columnconfigure(1, weight=1)
+        file_frame.columnconfigure(3, weight=1)
 
-        ttk.Button(file_frame, text="Browse Files", command=self.browse_files).grid(row=0, column=0, padx=(0, 10))
+        ttk.Button(file_frame, text="Browse Files", command=self.browse_files).grid(row=0, column=0, padx=(0, 5))
+        ttk.Button(file_frame, text="Add Folder", command=self.browse_folder).grid(row=0, column=1, padx=(0, 10))
 
-        if DRAG_DROP_AVAILABLE:
-            drop_text = "Or drag and drop files here"
-        else:
-            drop_text = "Drag and drop not available (install tkinterdnd2)"
+        self.drop_label = ttk.Label(file_frame, text="Or drag and drop files or folders here", foreground="gray")
+        self.drop_label.grid(row=0, column=3, sticky=tk.W)
 
-        self.drop_label = ttk.Label(file_frame, text=drop_text, foreground="gray")
-        self.drop_label.grid(row=0, column=1, sticky=tk.W)
+        # Folder scanning options
+        self.include_subfolders = tk.BooleanVar(value=True)
+        ttk.Checkbutton(file_frame, text="Subfolders", variable=self.include_subfolders).grid(row=0, column=4, padx=(5, 5))
+        ttk.Label(file_frame, text="Filter:").grid(row=0, column=5, sticky=tk.W)
+        self.filter_text = tk.StringVar()
+        ttk.Entry(file_frame, textvariable=self.filter_text, width=10).grid(row=0, column=6, padx=(5, 10))
 
-        ttk.Button(file_frame, text="Clear All", command=self.clear_files).grid(row=0, column=2)
+        self.cancel_button = ttk.Button(file_frame, text="Cancel", command=self.cancel_ingest, state=tk.DISABLED)
+        self.cancel_button.grid(row=0, column=7, padx=(0, 5))
+        ttk.Button(file_frame, text="Clear All", command=self.clear_files).grid(row=0, column=8)
 
     def setup_rename_options(self, parent):
         options_frame = ttk.LabelFrame(parent, text="Rename Options", padding="5")
@@ -127,7 +212,63 @@ class BatchRenamer:
         self.suffix_text = tk.StringVar()
         ttk.Entry(prefix_frame, textvariable=self.suffix_text, width=20).grid(row=0, column=3, padx=(5, 0), sticky=(tk.W, tk.E))
 
-        for var in [self.base_name, self.start_number, self.number_padding, self.prefix_text, self.suffix_text]:
+        # Token template, e.g. {date:%Y%m%d}_{seq:04}
+        template_frame = ttk.Frame(options_frame)
+        template_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(5, 0))
+        template_frame.columnconfigure(1, weight=1)
+
+        self.use_template = tk.BooleanVar()
+        ttk.Checkbutton(template_frame, text="Template:", variable=self.use_template,
+                        command=self.update_preview).grid(row=0, column=0, sticky=tk.W)
+        self.template_text = tk.StringVar(value="{date:%Y%m%d}_{seq:04}")
+        ttk.Entry(template_frame, textvariable=self.template_text).grid(row=0, column=1, padx=(5, 10), sticky=(tk.W, tk.E))
+        ttk.Label(template_frame, text="{name} {seq} {date} {mtime} {ctime} {size} {hash}").grid(row=0, column=2, sticky=tk.W)
+
+        # Search and replace, plain text or regex
+        replace_frame = ttk.Frame(options_frame)
+        replace_frame.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(5, 0))
+        replace_frame.columnconfigure(1, weight=1)
+        replace_frame.columnconfigure(3, weight=1)
+
+        self.use_replace = tk.BooleanVar()
+        ttk.Checkbutton(replace_frame, text="Replace:", variable=self.use_replace,
+                        command=self.update_preview).grid(row=0, column=0, sticky=tk.W)
+        self.find_text = tk.StringVar()
+        ttk.Entry(replace_frame, textvariable=self.find_text, width=20).grid(row=0, column=1, padx=(5, 5), sticky=(tk.W, tk.E))
+        ttk.Label(replace_frame, text="with:").grid(row=0, column=2, sticky=tk.W)
+        self.replace_text = tk.StringVar()
+        ttk.Entry(replace_frame, textvariable=self.replace_text, width=20).grid(row=0, column=3, padx=(5, 10), sticky=(tk.W, tk.E))
+        self.use_regex = tk.BooleanVar()
+        ttk.Checkbutton(replace_frame, text="Regex", variable=self.use_regex,
+                        command=self.update_preview).grid(row=0, column=4, sticky=tk.W)
+        self.ignore_case = tk.BooleanVar()
+        ttk.Checkbutton(replace_frame, text="Ignore case", variable=self.ignore_case,
+                        command=self.update_preview).grid(row=0, column=5, sticky=tk.W, padx=(5, 0))
+
+        # Named presets of all the options above
+        preset_frame = ttk.Frame(options_frame)
+        preset_frame.grid(row=5, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(5, 0))
+        ttk.Label(preset_frame, text="Preset:").grid(row=0, column=0, sticky=tk.W)
+        self.preset_name = tk.StringVar()
+        self.preset_box = ttk.Combobox(preset_frame, textvariable=self.preset_name, width=25, state="readonly")
+        self.preset_box.grid(row=0, column=1, padx=(5, 5))
+        self.preset_box.bind("<<ComboboxSelected>>", lambda event: self.load_preset())
+        ttk.Button(preset_frame, text="Save Preset", command=self.save_preset).grid(row=0, column=2, padx=(0, 5))
+        ttk.Button(preset_frame, text="Delete", command=self.delete_preset).grid(row=0, column=3)
+
+        # Move the renamed files into another folder, possibly on another drive
+        move_frame = ttk.Frame(options_frame)
+        move_frame.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(5, 0))
+        move_frame.columnconfigure(1, weight=1)
+
+        self.use_move = tk.BooleanVar()
+        ttk.Checkbutton(move_frame, text="Move to folder:", variable=self.use_move).grid(row=0, column=0, sticky=tk.W)
+        self.move_folder = tk.StringVar()
+        ttk.Entry(move_frame, textvariable=self.move_folder).grid(row=0, column=1, padx=(5, 5), sticky=(tk.W, tk.E))
+        ttk.Button(move_frame, text="Browse", command=self.browse_move_folder).grid(row=0, column=2)
+
+        for var in [self.base_name, self.start_number, self.number_padding, self.prefix_text, self.suffix_text,
+                    self.template_text, self.find_text, self.replace_text]:
             var.trace('w', lambda *args: self.update_preview())
 
     def setup_file_list(self, parent):
@@ -144,6 +285,15 @@ class BatchRenamer:
         ttk.Button(button_toolbar, text="▲ Move Up", command=self.move_item_up).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(button_toolbar, text="▼ Move Down", command=self.move_item_down).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(button_toolbar, text="Remove", command=self.remove_selected).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(button_toolbar, text="Find Duplicates", command=self.find_duplicates).pack(side=tk.LEFT, padx=(0, 5))
+
+        # Sort keys, most significant first; "-" sorts descending
+        ttk.Label(button_toolbar, text="Sort by:").pack(side=tk.LEFT, padx=(10, 5))
+        self.sort_text = tk.StringVar(value="name")
+        ttk.Combobox(button_toolbar, textvariable=self.sort_text, width=14,
+                     values=("name", "path", "date, name", "mtime, name", "-mtime", "size, name", "-size")
+                     ).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(button_toolbar, text="Sort", command=self.sort_files).pack(side=tk.LEFT, padx=(0, 5))
 
         # --- Theame ---
         self.theme_switch = ttk.Checkbutton(
@@ -153,19 +303,20 @@ class BatchRenamer:
         )
         self.theme_switch.pack(side=tk.RIGHT, padx=(5, 0))
 
+        # Only the visible rows exist in Tk; the list itself stays in selected_files
         columns = ('original', 'preview')
-        self.file_tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=15)
+        self.file_list = VirtualFileList(list_frame, columns, height=15, row_values=self.row_values)
+        self.file_tree = self.file_list.tree
         self.file_tree.heading('original', text='Original Name')
         self.file_tree.heading('preview', text='New Name (Preview)')
         self.file_tree.column('original', width=300)
         self.file_tree.column('preview', width=300)
 
-        v_scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.file_tree.yview)
         h_scrollbar = ttk.Scrollbar(list_frame, orient=tk.HORIZONTAL, command=self.file_tree.xview)
-        self.file_tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
+        self.file_tree.configure(xscrollcommand=h_scrollbar.set)
 
         self.file_tree.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        v_scrollbar.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        self.file_list.scrollbar.grid(row=1, column=1, sticky=(tk.N, tk.S))
         h_scrollbar.grid(row=2, column=0, sticky=(tk.W, tk.E))
 
     def setup_action_buttons(self, parent):
@@ -179,6 +330,11 @@ class BatchRenamer:
         self.update_action_buttons_state()
 
         ttk.Button(button_frame, text="Rename Files", command=self.rename_files).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(button_frame, text="Export Plan", command=self.export_plan).pack(side=tk.LEFT, padx=(0, 10))
+        self.pause_button = ttk.Button(button_frame, text="Pause", command=self.toggle_pause_job, state=tk.DISABLED)
+        self.pause_button.pack(side=tk.LEFT, padx=(0, 10))
+        self.stop_button = ttk.Button(button_frame, text="Stop", command=self.cancel_job, state=tk.DISABLED)
+        self.stop_button.pack(side=tk.LEFT, padx=(0, 10))
         ttk.Button(button_frame, text="Exit", command=self.root.quit).pack(side=tk.LEFT)
 
     def setup_status_bar(self, parent):
@@ -187,7 +343,7 @@ class BatchRenamer:
         status_bar.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E))
 
     def setup_drag_drop(self):
-        self.file_tree.drop_target_register(DND_FILES)
+        self.file_tree.drop_target_register(self.dnd_files)
         self.file_tree.dnd_bind('<<Drop>>', self.on_drop)
 
     def apply_theme(self):
@@ -292,259 +448,923 @@ class BatchRenamer:
         # Set the geometry
         self.root.geometry(f"{win_w}x{win_h}+{x}+{y}")
 
+    # ---------------- Rename Journal ----------------
+
+    def open_journal(self):
+        """Open the on-disk rename journal; without it undo history is kept in memory"""
+        try:
+            journal = RenameJournal(os.path.join(app_data_dir(), "journal.sqlite3"))
+            journal.prune(keep=JOURNAL_KEEP_BATCHES)
+            return journal
+        except Exception as e:
+            print(f"Rename journal unavailable, undo history will not survive a restart. ({e})")
+            return None
+
+    def check_interrupted_batches(self, batches=None):
+        """Offer to finish or roll back each interrupted batch; recovery runs as a job, one batch at a time"""
+        if self.journal is None:
+            return
+        if batches is None:
+            batches = self.journal.interrupted_batches()
+        if batches and self.busy:
+            self.root.after(JOB_POLL_MS, self.check_interrupted_batches, batches)
+            return
+        while batches:
+            batch = batches.pop(0)
+            # Done marks are written in groups, so a few finished files may still count
+            pending = self.journal.count_steps(batch, [PLANNED], skip_suffix=TEMP_SUFFIX)
+            answer = messagebox.askyesnocancel(
+                "Interrupted Rename",
+                f"A previous rename did not finish; up to {pending} files were not renamed yet.\n\n"
+                "Yes: finish the remaining renames\n"
+                "No: roll back to the original names\n"
+                "Cancel: decide next time"
+            )
+            if answer is None:
+                continue
+
+            def work(job, batch=batch, rollback=not answer):
+                return self.renamer.recover_batch(self.journal, batch, rollback=rollback)
+
+            def done(job, action="Finished" if answer else "Rolled back"):
+                success_count, error_count, errors = job.result
+                self.status_var.set(f"{action} interrupted rename: {success_count} files, {error_count} errors")
+                if errors:
+                    self.show_errors("Recovery Errors", success_count, errors)
+                self.check_interrupted_batches(batches)
+
+            label = "Finishing interrupted rename" if answer else "Rolling back interrupted rename"
+            self.run_job(Job(label, work), done)
+            return
+
+    # ---------------- Presets ----------------
+
+    def open_presets(self):
+        try:
+            return PresetStore()
+        except Exception as e:
+            print(f"Presets unavailable, options will not be saved. ({e})")
+            return None
+
+    def open_plan_cache(self):
+        try:
+            return PlanCache()
+        except Exception as e:
+            print(f"Plan cache unavailable, previews are always computed. ({e})")
+            return None
+
+    def option_vars(self):
+        """The tk variables behind each RenamePlan.from_options argument"""
+        return {
+            "use_sequential": self.use_sequential,
+            "base_name": self.base_name,
+            "start_number": self.start_number,
+            "number_padding": self.number_padding,
+            "use_prefix": self.use_prefix,
+            "prefix_text": self.prefix_text,
+            "use_suffix": self.use_suffix,
+            "suffix_text": self.suffix_text,
+            "use_template": self.use_template,
+            "template_text": self.template_text,
+            "use_replace": self.use_replace,
+            "find_text": self.find_text,
+            "replace_text": self.replace_text,
+            "use_regex": self.use_regex,
+            "ignore_case": self.ignore_case,
+        }
+
+    def current_options(self):
+        return {name: var.get() for name, var in self.option_vars().items()}
+
+    def set_options(self, options):
+        for name, var in self.option_vars().items():
+            if name in options:
+                var.set(options[name])
+        self.refresh_preview()
+
+    def restore_options(self):
+        """Pick up the options of the last session"""
+        if self.presets is None:
+            return
+        self.preset_box.config(values=self.presets.names())
+        if LAST_USED in self.presets:
+            self.set_options(self.presets.get(LAST_USED))
+
+    def load_preset(self):
+        name = self.preset_name.get()
+        if self.presets is not None and name in self.presets:
+            self.set_options(self.presets.get(name))
+            self.status_var.set(f"Loaded preset '{name}'")
+
+    def save_preset(self):
+        if self.presets is None:
+            messagebox.showwarning("Presets Unavailable", "Presets cannot be saved on this system.")
+            return
+        from tkinter import simpledialog
+        name = simpledialog.askstring("Save Preset", "Preset name:", initialvalue=self.preset_name.get(),
+                                      parent=self.root)
+        name = (name or "").strip()
+        if not name or name == LAST_USED:
+            return
+        self.presets.save(name, self.current_options())
+        self.preset_box.config(values=self.presets.names())
+        self.preset_name.set(name)
+        self.status_var.set(f"Saved preset '{name}'")
+
+    def delete_preset(self):
+        name = self.preset_name.get()
+        if self.presets is None or name not in self.presets:
+            return
+        if messagebox.askyesno("Delete Preset", f"Delete the preset '{name}'?"):
+            self.presets.delete(name)
+            self.preset_box.config(values=self.presets.names())
+            self.preset_name.set("")
+
+    def known_fingerprint(self):
+        """Fingerprint of the current file list if one has been worked out, else None"""
+        state = self._fingerprint
+        if state is not None and state[0] == self.selected_files.version:
+            return state[2].hexdigest()
+        return None
+
+    def load_cached_preview(self, options):
+        """Look for names a plan that reads metadata produced for this list before
+
+        The fingerprint of the list, the cache file and the files' sizes and
+        mtimes are all read on the job thread, from a snapshot of the list.
+        The fingerprint is kept between calls and, while files are only added
+        at the end, just extended with the new ones. Files that changed since
+        their names were cached are left out of the cached preview.
+        """
+        if self._cache_job is not None:
+            self._cache_job.cancel()
+            self._cache_job = None
+        if self.plan_cache is None or not self.selected_files:
+            return
+        files = self.selected_files.snapshot()
+        version = files.version
+        edits = files.edits
+        state = self._fingerprint
+        running = None
+        if state is not None and state[1] == edits and state[2].count <= len(files):
+            running = state[2].copy()
+
+        def work(job):
+            fingerprint = running or ListFingerprint()
+            while fingerprint.count < len(files):
+                if not job.checkpoint():
+                    return None
+                fingerprint.update(files[fingerprint.count:fingerprint.count + MATCH_CHUNK])
+            cached = self.plan_cache.get(options_hash(options), fingerprint.hexdigest(), len(files))
+            if cached is None or cached[1] is None:
+                return fingerprint, None, None
+            names, signatures = cached
+            stale = set()
+            for start in range(0, len(files), MATCH_CHUNK):
+                if not job.checkpoint():
+                    return fingerprint, None, None
+                now = file_signatures(files[start:start + MATCH_CHUNK])
+                stale.update(start + i for i, signature in enumerate(now)
+                             if signature != signatures[start + i])
+            return fingerprint, NameTable(names), stale
+
+        job = self._cache_job = self.jobs.submit(Job("Loading cached names", work, total=len(files)))
+        self.root.after(JOB_POLL_MS, self._poll_cached_preview, job, version, edits, options)
+
+    def _poll_cached_preview(self, job, version, edits, options):
+        if job is not self._cache_job:
+            return
+        if not job.is_finished:
+            self.root.after(JOB_POLL_MS, self._poll_cached_preview, job, version, edits, options)
+            return
+        self._cache_job = None
+        if job.result is None:
+            return
+        fingerprint, names, stale = job.result
+        self._fingerprint = (version, edits, fingerprint)
+        if names is not None and version == self.selected_files.version \
+                and options == self.preview_options:
+            self._cached_preview = (version, names, stale)
+            self.file_list.render()
+
     # ---------------- File Handling ----------------
 
     def browse_files(self):
+        from tkinter import filedialog
         files = filedialog.askopenfilenames(title="Select files to rename", filetypes=[("All files", "*.*")])
         if files:
             self.add_files(files)
 
+    def browse_folder(self):
+        from tkinter import filedialog
+        folder = filedialog.askdirectory(title="Select a folder to rename")
+        if folder:
+            self.add_files([folder])
+
+    def browse_move_folder(self):
+        from tkinter import filedialog
+        folder = filedialog.askdirectory(title="Move renamed files to")
+        if folder:
+            self.move_folder.set(folder)
+            self.use_move.set(True)
+
     def on_drop(self, event):
         files = self.file_tree.tk.splitlist(event.data)
         self.add_files(files)
 
     def add_files(self, file_paths):
-        new_files = []
-        for file_path in file_paths:
-            path = Path(file_path)
-            if path.is_file() and str(path) not in [str(f) for f in self.selected_files]:
-                new_files.append(path)
-
-        self.selected_files.extend(new_files)
+        """Scan file_paths on a worker thread; found files are added as they stream in"""
+        ingestor = FileIngestor(file_paths, recursive=self.include_subfolders.get(),
+                                patterns=parse_patterns(self.filter_text.get()))
+        self.ingestors.append(ingestor)
+        ingestor.start()
+        self.cancel_button.config(state=tk.NORMAL)
+        if len(self.ingestors) == 1:
+            self._ingest_added = 0
+            self._ingest_cancelled = False
+            self._ingest_job = self.root.after(INGEST_POLL_MS, self._poll_ingest)
+
+    def _poll_ingest(self):
+        """Drain scanned batches for a bounded slice of time, then yield back to Tk"""
+        if self.busy:
+            # Jobs such as Sort work on a snapshot of the list; files wait until they finish
+            self._ingest_job = self.root.after(INGEST_POLL_MS, self._poll_ingest)
+            return
+        deadline = time.perf_counter() + 0.03
+        added = self._ingest_added
+        for ingestor in list(self.ingestors):
+            while time.perf_counter() < deadline:
+                try:
+                    batch = ingestor.batches.get_nowait()
+                except queue.Empty:
+                    break
+                if batch is None:
+                    self.ingestors.remove(ingestor)
+                    break
+                for path in batch:
+                    if self.selected_files.add(path):
+                        self._ingest_added += 1
+
+        if self._ingest_added != added:
+            # Undo entries hold positions in the list as it was before these files
+            self.drop_list_changes()
         self.update_file_list()
-        self.update_preview()
+        if self.ingestors:
+            self.status_var.set(f"Adding files... {self._ingest_added} added. Total: {len(self.selected_files)} files")
+            self._ingest_job = self.root.after(INGEST_POLL_MS, self._poll_ingest)
+            return
+
+        self._ingest_job = None
+
+        self.cancel_button.config(state=tk.DISABLED)
+        if self._ingest_cancelled:
+            self.status_var.set(f"Cancelled. Added {self._ingest_added} files. Total: {len(self.selected_files)} files")
+        else:
+            self.status_var.set(f"Added {self._ingest_added} files. Total: {len(self.selected_files)} files")
 
-        if new_files:
-            self.status_var.set(f"Added {len(new_files)} files. Total: {len(self.selected_files)} files")
+    def cancel_ingest(self):
+        """Stop scanning; files already added stay in the list"""
+        self._ingest_cancelled = True
+        for ingestor in self.ingestors:
+            ingestor.cancel()
 
     def clear_files(self):
         """Clear all selected files and previews"""
+        if self.busy:
+            return
+        # Drop any scan in progress along with whatever it has queued
+        self.cancel_ingest()
+        self.ingestors.clear()
+        if self._ingest_job is not None:
+            self.root.after_cancel(self._ingest_job)
+            self._ingest_job = None
+        self.cancel_button.config(state=tk.DISABLED)
         self.selected_files.clear()
-        self.preview_names.clear()
-        self.update_file_list()
+        self.drop_list_changes()
+        self.sort_keys.clear()
+        self.refresh_preview()
         self.status_var.set("Cleared all files")
-        self.update_preview()
 
     def update_file_list(self):
-        """Update the file list display"""
-        # Clear existing items
-        self.file_tree.delete(*self.file_tree.get_children())
-        
-        # Add current files
-        for idx, file_path in enumerate(self.selected_files):
-            preview_name = self.preview_names[idx] if idx < len(self.preview_names) else ""
-            self.file_tree.insert("", "end", values=(file_path.name, preview_name))
+        """Redraw the visible rows of the file list"""
+        self.file_list.set_count(len(self.selected_files))
+
+    def row_values(self, idx):
+        """Values of one file list row; only called for rows on screen"""
+        file_path = self.selected_files[idx]
+        cached = self._cached_preview
+        if cached is not None and cached[0] == self.selected_files.version and idx not in cached[2]:
+            return (file_path.name, cached[1][idx])
+        fields = self.preview_plan.fields
+        if fields and not self.metadata.has(file_path, fields):
+            # Never read metadata on the Tk thread: fetch it and redraw later
+            self.request_metadata(file_path)
+            return (file_path.name, "…")
+        return (file_path.name, self.preview_plan.name_for(file_path, idx))
+
+    def request_metadata(self, file_path):
+        if file_path in self._metadata_wanted:
+            return
+        self._metadata_wanted.add(file_path)
+        self._metadata_pending.extend(self.metadata.prefetch([file_path], self.preview_plan.fields))
+        if self._metadata_job is None:
+            self._metadata_job = self.root.after(METADATA_POLL_MS, self._poll_metadata)
+
+    def _poll_metadata(self):
+        self._metadata_pending = [future for future in self._metadata_pending if not future.done()]
+        if self._metadata_pending:
+            self._metadata_job = self.root.after(METADATA_POLL_MS, self._poll_metadata)
+            return
+        self._metadata_job = None
+        self._metadata_wanted.clear()
+        self.file_list.render()
+
+    def build_plan(self):
+        """Compile the current rename options into a RenamePlan"""
+        try:
+            return RenamePlan.from_options(metadata=self.metadata, **self.current_options())
+        except ValueError as e:
+            self.status_var.set(f"Invalid rename options: {e}")
+            return None
 
     def update_preview(self, *args):
-        """Generate and update preview names for all selected files"""
-        self.preview_names.clear()
-        self.file_tree.delete(*self.file_tree.get_children())
-
-        for idx, file_path in enumerate(self.selected_files):
-            new_name = self.renamer.generate_new_name(
-                file_path=file_path,
-                index=idx,
-                use_sequential=self.use_sequential.get(),
-                base_name=self.base_name.get(),
-                start_number=self.start_number.get(),
-                number_padding=self.number_padding.get(),
-                use_prefix=self.use_prefix.get(),
-                prefix_text=self.prefix_text.get(),
-                use_suffix=self.use_suffix.get(),
-                suffix_text=self.suffix_text.get(),
-            )
-            self.preview_names.append(new_name)
-            self.file_tree.insert("", "end", values=(file_path.name, new_name))
+        """Schedule a preview refresh; bursts of keystrokes collapse into one refresh"""
+        if self._preview_job is not None:
+            self.root.after_cancel(self._preview_job)
+        self._preview_job = self.root.after(PREVIEW_DELAY_MS, self.refresh_preview, True)
+
+    def refresh_preview(self, report_matches=False):
+        """Recompile the rename options and redraw the visible rows
+
+        Preview names are generated on demand for the rows on screen; the full
+        list is only built when it is needed, e.g. right before renaming.
+        """
+        if self._preview_job is not None:
+            self.root.after_cancel(self._preview_job)
+            self._preview_job = None
+        plan = self.build_plan()
+        self.preview_plan = plan if plan is not None else RenamePlan()
+        self.preview_options = self.current_options() if plan is not None else None
+        # Reading metadata for every row is the slow part, so reuse names from an earlier session
+        self._cached_preview = None
+        if plan is not None and plan.fields:
+            self.load_cached_preview(self.preview_options)
+        self.update_file_list()
+
+        if report_matches and plan is not None:
+            self.count_matches(plan)
+
+    def count_matches(self, plan):
+        """Count search matches in the background and show them once done
+
+        Runs on the job thread but not through run_job, so nothing is
+        disabled while typing; a newer count replaces an unfinished one.
+        """
+        if self._count_job is not None:
+            self._count_job.cancel()
+            self._count_job = None
+        if plan.match_counts([]) is None or not self.selected_files:
+            return
+        files = self.selected_files.snapshot()
+        version = files.version
+
+        def work(job):
+            matched = total = 0
+            for start in range(0, len(files), MATCH_CHUNK):
+                if not job.checkpoint() or self.selected_files.version != version:
+                    return None
+                counts = plan.match_counts(files[start:start + MATCH_CHUNK])
+                matched += sum(1 for count in counts if count)
+                total += sum(counts)
+            return matched, total
+
+        job = self._count_job = self.jobs.submit(Job("Counting matches", work, total=len(files)))
+        self.root.after(JOB_POLL_MS, self._poll_count, job, version)
+
+    def _poll_count(self, job, version):
+        if job is not self._count_job:
+            return
+        if not job.is_finished:
+            self.root.after(JOB_POLL_MS, self._poll_count, job, version)
+            return
+        self._count_job = None
+        if job.result is None or version != self.selected_files.version or self.busy:
+            return
+        matched, total = job.result
+        self.status_var.set(f"Search matches {matched} of {len(self.selected_files)} files ({total} matches)")
 
     def rename_files(self):
         """Execute the file renaming operation"""
+        if self.busy:
+            return
         if not self.selected_files:
             messagebox.showwarning("No Files", "Please select files to rename first.")
             return
 
-        if not self.preview_names:
-            messagebox.showwarning("No Preview", "Please generate preview names first.")
+        # Apply any option change still waiting in the debounce timer
+        self.refresh_preview()
+        plan = self.preview_plan
+        options = self.preview_options
+
+        # Check the whole plan first; the rename itself then only runs renames known to be valid
+        files = list(self.selected_files)
+        files_key = self.known_fingerprint()
+        target_dir = self.move_folder.get().strip() if self.use_move.get() else None
+        if target_dir is not None and not os.path.isdir(target_dir):
+            messagebox.showwarning("No Folder", "Choose an existing folder to move the files to.")
             return
 
-        # Confirm with user
-        result = messagebox.askyesno(
-            "Confirm Rename", 
-            f"Are you sure you want to rename {len(self.selected_files)} files?"
-        )
-        if not result:
+        def check(job):
+            return self.renamer.preflight(files, self.plan_names(files, plan, options, files_key), target_dir)
+
+        def checked(job):
+            if job.cancelled:
+                self.status_var.set("Rename cancelled")
+                return
+            report = job.result
+            issues = [str(issue) for issue in report.issues]
+            problems = ""
+            if issues:
+                problems = f"\n\n{len(issues)} problems found ({report.summary()}):\n" + "\n".join(issues[:10])
+                if len(issues) > 10:
+                    problems += f"\n... and {len(issues) - 10} more"
+            if not report.files:
+                self.status_var.set("Nothing to rename")
+                messagebox.showinfo("Nothing to Rename", "No file needs a new name." + problems)
+                return
+
+            # Confirm with user
+            result = messagebox.askyesno(
+                "Confirm Rename",
+                f"Are you sure you want to rename {len(report.files)} files?" + problems
+            )
+            if result:
+                self.apply_renames(report, target_dir)
+            else:
+                self.status_var.set("Rename cancelled")
+
+        self.run_job(Job("Checking names", check, total=len(files)), checked)
+
+    def plan_names(self, files, plan, options, files_key=None):
+        """All new names of files; runs on the job thread, as templates may read every file's metadata"""
+        if options is None:
+            return plan.apply(files)
+        return self.renamer.planned_names(files, options, self.plan_cache, self.metadata, files_key)
+
+    def export_plan(self):
+        """Write the checked plan to a CSV or JSON-lines manifest for editing or applying later"""
+        if self.busy:
+            return
+        if not self.selected_files:
+            messagebox.showwarning("No Files", "Please select files to rename first.")
+            return
+        from tkinter import filedialog
+        path = filedialog.asksaveasfilename(title="Export rename plan", defaultextension=".csv",
+                                            filetypes=[("CSV", "*.csv"), ("JSON lines", "*.jsonl")])
+        if not path:
+            return
+        try:
+            manifest_format(path)
+        except ValueError as e:
+            messagebox.showerror("Export Plan", str(e))
             return
 
-        # Perform the renaming
-        self.status_var.set("Renaming files...")
-        self.root.update()
+        self.refresh_preview()
+        plan = self.preview_plan
+        options = self.preview_options
+        files = list(self.selected_files)
+        files_key = self.known_fingerprint()
+
+        def work(job):
+            report = self.renamer.preflight(files, self.plan_names(files, plan, options, files_key))
+            return write_manifest(path, zip(report.files, report.names)), len(report.skipped)
+
+        def done(job):
+            if job.cancelled or job.result is None:
+                self.status_var.set("Export stopped")
+                return
+            count, skipped = job.result
+            skipped_text = f", {skipped} skipped" if skipped else ""
+            self.status_var.set(f"Exported {count} renames to {os.path.basename(path)}{skipped_text}")
+
+        self.run_job(Job("Exporting plan", work, total=len(files)), done)
+
+    def apply_renames(self, report, target_dir=None):
+        """Run the renames of a preflight report on the job runner"""
+        # The selection is written back when it finishes
+        files = list(report.files)
+        skipped = len(report.skipped)
+        batch = self.journal.begin_batch() if self.journal is not None else None
+
+        def work(job):
+            return self.renamer.rename_files(files, report.names, workers=self.rename_workers,
+                                             journal=self.journal, batch=batch, job=job,
+                                             target_dir=target_dir)
+
+        def done(job):
+            success_count, error_count, errors, rename_history = job.result
+            for idx, file_path in zip(report.indices, files):
+                if file_path != self.selected_files[idx]:
+                    self.selected_files[idx] = file_path
+
+            if rename_history:
+                # With a journal the history stays on disk and undo streams it back
+                if batch is not None:
+                    self.undo_stack.append({'action': 'rename', 'batch': batch})
+                else:
+                    self.undo_stack.append({'action': 'history', 'steps': rename_history, 'pending': None})
+                self.redo_stack.clear()  # Optional: clear redo stack after new operation
+            self.update_action_buttons_state()
+
+            # Update status and show results
+            skipped_text = f", {skipped} skipped" if skipped else ""
+            if job.cancelled:
+                self.status_var.set(f"Stopped after renaming {success_count} of {len(files)} files, "
+                                    f"{error_count} errors{skipped_text}")
+            elif error_count == 0:
+                self.status_var.set(f"Successfully renamed {success_count} files{skipped_text}")
+                messagebox.showinfo("Success", f"Successfully renamed {success_count} files!")
+            else:
+                self.status_var.set(f"Renamed {success_count} files, {error_count} errors{skipped_text}")
+            if errors:
+                self.show_errors("Rename Errors", success_count, errors)
+
+            # Refresh the file list with updated names
+            self.refresh_preview()
+
+        self.run_job(Job("Renaming", work, total=len(files)), done)
+
+    def show_errors(self, title, success_count, errors):
+        error_message = f"Renamed {success_count} files successfully.\n{len(errors)} errors occurred:\n\n"
+        error_message += "\n".join(errors[:10])  # Show first 10 errors
+        if len(errors) > 10:
+            error_message += f"\n... and {len(errors) - 10} more errors"
+        messagebox.showerror(title, error_message)
+
+    def run_job(self, job, on_done):
+        """Submit job to the background runner and call on_done(job) on the Tk thread when it ends"""
+        # Their results would be stale by the time the job ends, and they would hold it up
+        for background in (self._count_job, self._cache_job):
+            if background is not None:
+                background.cancel()
+        self.busy = True
+        self.current_job = job
+        self.update_action_buttons_state()
+        self.status_var.set(f"{job.label}...")
+        self.renamer.stats.throughput()  # Start a fresh measuring window
+        self.jobs.submit(job)
+        self.root.after(JOB_POLL_MS, self._poll_job, job, on_done)
+
+    def _poll_job(self, job, on_done):
+        if not job.is_finished:
+            text = job.status_text()
+            rate = self.renamer.stats.throughput()
+            if rate:
+                text += f" | now {rate:.0f} renames/s"
+            self.status_var.set(text)
+            self.root.after(JOB_POLL_MS, self._poll_job, job, on_done)
+            return
 
-        success_count, error_count, errors, rename_history = self.renamer.rename_files(
-            self.selected_files, self.preview_names
-        )
-        if rename_history:
-            self.undo_stack.append(rename_history)
-            self.redo_stack.clear()  # Optional: clear redo stack after new operation
-
-        # Update status and show results
-        if error_count == 0:
-            self.status_var.set(f"Successfully renamed {success_count} files")
-            messagebox.showinfo("Success", f"Successfully renamed {success_count} files!")
+        self.busy = False
+        self.current_job = None
+        self.pause_button.config(text="Pause")
+        self.update_action_buttons_state()
+        if job.error is not None:
+            self.status_var.set(f"{job.label} failed: {job.error}")
+            messagebox.showerror("Error", str(job.error))
         else:
-            self.status_var.set(f"Renamed {success_count} files, {error_count} errors")
-            error_message = f"Renamed {success_count} files successfully.\n{error_count} errors occurred:\n\n"
-            error_message += "\n".join(errors[:10])  # Show first 10 errors
-            if len(errors) > 10:
-                error_message += f"\n... and {len(errors) - 10} more errors"
-            messagebox.showerror("Rename Errors", error_message)
-
-        # Refresh the file list with updated names
-        self.update_file_list()
-        self.update_preview()
+            on_done(job)
+
+    def toggle_pause_job(self):
+        job = self.current_job
+        if job is None:
+            return
+        if job.paused:
+            job.resume()
+            self.pause_button.config(text="Pause")
+        else:
+            job.pause()
+            self.pause_button.config(text="Resume")
+        self.status_var.set(job.status_text())
+
+    def cancel_job(self):
+        """Stop the running job at its next safe point"""
+        if self.current_job is not None:
+            self.current_job.cancel()
+            self.pause_button.config(text="Pause")
+            self.status_var.set(self.current_job.status_text())
+
+    def replay_in_background(self, operation, undo):
+        """Undo or redo a journaled rename off the Tk thread, reporting failed files"""
+        source, target = (self.undo_stack, self.redo_stack) if undo else (self.redo_stack, self.undo_stack)
+        label = "Undoing rename" if undo else "Redoing rename"
+
+        def work(job):
+            return self.renamer.replay_batch(self.journal, operation['batch'], undo=undo,
+                                             workers=self.rename_workers, job=job)
+
+        def done(job):
+            result = job.result
+            self.clear_files()
+            if job.cancelled:
+                # Keep the entry where it was: running it again picks up the remaining files
+                source.append(operation)
+                self.status_var.set(f"{label} stopped after {result.success_count} files. "
+                                    f"Press {'Undo' if undo else 'Redo'} again to continue.")
+            elif result.failed:
+                # Keep the entry where it was: running it again retries only the failed files
+                source.append(operation)
+                self.status_var.set(f"{label}: {result.success_count} files, {result.error_count} failed. "
+                                    f"Press {'Undo' if undo else 'Redo'} again to retry.")
+                self.show_errors("Undo Errors" if undo else "Redo Errors", result.success_count, result.errors)
+            else:
+                target.append(operation)
+                self.status_var.set("Last operation undone." if undo else "Last operation redone.")
+            self.update_action_buttons_state()
+
+        self.run_job(Job(label, work), done)
+
+    def replay_history_in_background(self, operation, undo):
+        """Undo or redo a rename kept in memory (no journal) off the Tk thread
+
+        Works like replay_in_background: failed or cancelled steps are kept in
+        operation['pending'] and the entry stays where it was, so running it
+        again retries just those.
+        """
+        source, target = (self.undo_stack, self.redo_stack) if undo else (self.redo_stack, self.undo_stack)
+        label = "Undoing rename" if undo else "Redoing rename"
+        steps = operation['steps']
+        pending = operation['pending']
+        if pending is None:
+            pending = list(range(len(steps) - 1, -1, -1) if undo else range(len(steps)))
+
+        def work(job):
+            remaining = []
+            errors = []
+            success_count = 0
+            for n, position in enumerate(pending):
+                if not job.checkpoint():
+                    remaining.extend(pending[n:])
+                    break
+                old_path, new_path = steps[position]
+                if undo:
+                    old_path, new_path = new_path, old_path
+                try:
+                    if new_path.exists():
+                        raise FileExistsError(f"'{new_path.name}' already exists")
+                    # move_file: a moved-and-renamed file may have to be copied back
+                    move_file(old_path, new_path)
+                    success_count += 1
+                    job.advance()
+                except Exception as e:
+                    remaining.append(position)
+                    errors.append(f"{old_path.name}: {str(e)}")
+                    job.advance(errors=1)
+            return success_count, remaining, errors
+
+        def done(job):
+            success_count, remaining, errors = job.result
+            self.clear_files()
+            if remaining:
+                operation['pending'] = remaining
+                source.append(operation)
+                if job.cancelled:
+                    self.status_var.set(f"{label} stopped after {success_count} files. "
+                                        f"Press {'Undo' if undo else 'Redo'} again to continue.")
+                else:
+                    self.status_var.set(f"{label}: {success_count} files, {len(errors)} failed. "
+                                        f"Press {'Undo' if undo else 'Redo'} again to retry.")
+                    self.show_errors("Undo Errors" if undo else "Redo Errors", success_count, errors)
+            else:
+                operation['pending'] = None
+                target.append(operation)
+                self.status_var.set("Last operation undone." if undo else "Last operation redone.")
+            self.update_action_buttons_state()
+
+        self.run_job(Job(label, work, total=len(pending)), done)
 
     def undo_rename(self):
-        if not self.undo_stack:
+        if not self.undo_stack or self.busy:
             return
 
         last_operation = self.undo_stack.pop()
 
-        if isinstance(last_operation, list):
-            redo_operation = []
-            for old_path, new_path in reversed(last_operation):
-                try:
-                    new_path.rename(old_path)
-                    redo_operation.append((old_path, new_path))
-                except Exception as e:
-                    print(f"Undo Error: {e}")
-            self.redo_stack.append(list(reversed(redo_operation)))
-            self.clear_files()
-            self.status_var.set("Last operation undone.")
+        if isinstance(last_operation, dict) and last_operation.get('action') == 'history':
+            self.replay_history_in_background(last_operation, undo=True)
+        elif isinstance(last_operation, dict) and last_operation.get('action') == 'rename':
+            self.replay_in_background(last_operation, undo=True)
         elif isinstance(last_operation, dict) and last_operation.get('action') == 'list_change':
-            self.redo_stack.append({
-                'selected_files': self.selected_files.copy(),
-                'preview_names': self.preview_names.copy(),
-                'action': 'list_change'
-            })
-            self.selected_files = last_operation['selected_files']
-            self.preview_names = last_operation['preview_names']
-            self.update_file_list()
-            self.update_preview()
-            self.status_var.set("List change undone...")
+            if self.apply_list_change(last_operation, undo=True):
+                self.redo_stack.append(last_operation)
+                self.status_var.set("List change undone...")
+            else:
+                self.status_var.set("The file list has changed since; that list change can no longer be undone")
         self.update_action_buttons_state()
 
     def redo_rename(self):
-        if not self.redo_stack:
+        if not self.redo_stack or self.busy:
             return
 
         last_operation = self.redo_stack.pop()
 
-        if isinstance(last_operation, list):
-            undo_operation = []
-            for old_path, new_path in last_operation:
-                try:
-                    old_path.rename(new_path)
-                    undo_operation.append((old_path, new_path))
-                except Exception as e:
-                    print(f"Redo Error: {e}")
-            self.undo_stack.append(undo_operation)
-            self.clear_files()
-            self.status_var.set("Last operation redone.")
+        if isinstance(last_operation, dict) and last_operation.get('action') == 'history':
+            self.replay_history_in_background(last_operation, undo=False)
+        elif isinstance(last_operation, dict) and last_operation.get('action') == 'rename':
+            self.replay_in_background(last_operation, undo=False)
         elif isinstance(last_operation, dict) and last_operation.get('action') == 'list_change':
-            self.undo_stack.append({
-                'selected_files': self.selected_files.copy(),
-                'preview_names': self.preview_names.copy(),
-                'action': 'list_change'
-            })
-            self.selected_files = last_operation['selected_files']
-            self.preview_names = last_operation['preview_names']
-            self.update_file_list()
-            self.update_preview()
-            self.status_var.set("List change redone...")
+            if self.apply_list_change(last_operation):
+                self.undo_stack.append(last_operation)
+                self.status_var.set("List change redone...")
+            else:
+                self.status_var.set("The file list has changed since; that list change can no longer be redone")
         self.update_action_buttons_state()
 
-    def move_item_up(self):
-        selected_items = self.file_tree.selection()
-        if not selected_items:
-            return
-
-        self.undo_stack.append({
-            'selected_files': self.selected_files.copy(),
-            'preview_names': self.preview_names.copy(),
-            'action': 'list_change'
-        })
+    def record_list_change(self, change):
+        """Push a list change that was just made onto the undo stack"""
+        change['version'] = self.selected_files.version
+        self.undo_stack.append(change)
         self.redo_stack.clear()
 
-        all_items = list(self.file_tree.get_children())
-        selected_indices = sorted([all_items.index(item) for item in selected_items])
-        for index in selected_indices:
-            item = all_items[index]
-            if index == 0:
-                self.file_tree.move(item, '', 'end')
-            else:
-                self.file_tree.move(item, '', index - 1)
-        self.file_tree.selection_set(selected_items)
-        for item in selected_items:
-            self.file_tree.see(item)
+    def drop_list_changes(self):
+        """Forget list changes on both stacks, once the list changed some other way"""
+        for stack in (self.undo_stack, self.redo_stack):
+            stack[:] = [operation for operation in stack
+                        if not (isinstance(operation, dict) and operation.get('action') == 'list_change')]
         self.update_action_buttons_state()
-        self.status_var.set("Moved selected item(s) up")
 
-    def move_item_down(self):
-        selected_items = self.file_tree.selection()
-        if not selected_items:
-            return
+    def apply_list_change(self, change, undo=False):
+        """Replay or revert a recorded list change; False if the list has changed since
+
+        Entries only hold what changed, as positions in the list at the
+        selection version they were recorded against, so they are applied
+        only while the list is still at that version.
+        """
+        files = self.selected_files
+        if change.get('version') != files.version:
+            return False
+        if 'order' in change:
+            files.reorder(change['order'], undo=undo)
+        elif 'removed' in change:
+            if undo:
+                files.restore(change['removed'])
+            else:
+                files.remove_indices(change['removed'].indices)
+        elif undo:
+            for index, target in reversed(change['moves']):
+                files.move(target, index)
+        else:
+            for index, target in change['moves']:
+                files.move(index, target)
+        change['version'] = files.version
+        self.file_list.set_selection(())
+        self.refresh_preview()
+        return True
 
-        self.undo_stack.append({
-            'selected_files': self.selected_files.copy(),
-            'preview_names': self.preview_names.copy(),
-            'action': 'list_change'
-        })
-        self.redo_stack.clear()
+    def move_item_up(self):
+        if self._move_selected(-1):
+            self.status_var.set("Moved selected item(s) up")
 
-        all_items = list(self.file_tree.get_children())
-        selected_indices = sorted([all_items.index(item) for item in selected_items], reverse=True)
-        for index in selected_indices:
-            item = all_items[index]
-            if index == len(all_items) - 1:
-                self.file_tree.move(item, '', 0)
-            else:
-                self.file_tree.move(item, '', index + 1)
-        self.file_tree.selection_set(selected_items)
-        for item in selected_items:
-            self.file_tree.see(item)
+    def move_item_down(self):
+        if self._move_selected(1):
+            self.status_var.set("Moved selected item(s) down")
+
+    def _move_selected(self, step):
+        """Move the selected files one position (wrapping at the ends) and renumber the preview"""
+        selected_items = self.file_list.selection()
+        if not selected_items or self.busy:
+            return False
+
+        count = len(self.selected_files)
+        if len(selected_items) == 1:
+            index = selected_items[0]
+            target = (index + step) % count
+            self.selected_files.move(index, target)
+            change = {'action': 'list_change', 'moves': [(index, target)]}
+            moved = [target]
+        else:
+            # Every selected file takes the next slot, the others fill the rest in order
+            targets = {(index + step) % count: index for index in selected_items}
+            chosen = set(selected_items)
+            others = (index for index in range(count) if index not in chosen)
+            order = array('I', (targets[position] if position in targets else next(others)
+                                for position in range(count)))
+            self.selected_files.reorder(order)
+            change = {'action': 'list_change', 'order': order}
+            moved = sorted(targets)
+
+        self.record_list_change(change)
+
+        self.file_list.set_selection(moved)
+        self.file_list.see(moved[0] if step < 0 else moved[-1])
+        self.refresh_preview()
         self.update_action_buttons_state()
-        self.status_var.set("Moved selected item(s) down")
+        return True
+
+    def sort_files(self):
+        """Reorder the whole selection by the keys in the Sort by box"""
+        if self.busy or not self.selected_files:
+            return
+        try:
+            keys = parse_sort_keys(self.sort_text.get())
+        except ValueError as e:
+            messagebox.showerror("Sort", str(e))
+            return
+        files = list(self.selected_files)
+        version = self.selected_files.version
+
+        def work(job):
+            return self.sort_keys.sort_order(files, keys, job=job)
+
+        def done(job):
+            order = job.result
+            if order is None:
+                self.status_var.set("Sort stopped")
+                return
+            if version != self.selected_files.version:
+                # The order holds positions in the list as it was when the sort started
+                self.status_var.set("The file list changed while sorting; sort again")
+                return
+            if order == list(range(len(order))):
+                self.status_var.set("Already in that order")
+                return
+            order = array('I', order)
+            self.selected_files.reorder(order)
+            self.record_list_change({'action': 'list_change', 'order': order})
+            self.file_list.set_selection(())
+            self.refresh_preview()
+            self.update_action_buttons_state()
+            self.status_var.set(f"Sorted {len(order)} files by {self.sort_text.get()}")
+
+        self.run_job(Job("Sorting", work, total=len(files)), done)
+
+    def find_duplicates(self):
+        """Select every copy after the first of files with identical content"""
+        if self.busy or not self.selected_files:
+            return
+        files = list(self.selected_files)
+
+        def work(job):
+            return self.renamer.find_duplicates(files, job=job)
+
+        def done(job):
+            groups = job.result
+            if groups is None:
+                self.status_var.set("Duplicate check stopped")
+                return
+            extra = {file_path for group in groups for file_path in group[1:]}
+            indices = [idx for idx, file_path in enumerate(self.selected_files) if file_path in extra]
+            self.file_list.set_selection(indices)
+            if indices:
+                self.file_list.see(indices[0])
+                self.status_var.set(f"Selected {len(indices)} duplicate files in {len(groups)} groups; "
+                                    f"click Remove to drop them")
+            else:
+                self.status_var.set("No duplicate files found")
+
+        self.run_job(Job("Checking for duplicates", work, total=len(files)), done)
 
     def remove_selected(self):
-        selected_items = self.file_tree.selection()
+        if self.busy:
+            return
+        selected_items = self.file_list.selection()
         if not selected_items:
             messagebox.showwarning("No Selection", "Please select a file to remove.")
             return
 
-        self.undo_stack.append({
-            'selected_files': self.selected_files.copy(),
-            'preview_names': self.preview_names.copy(),
-            'action': 'list_change'
-        })
-        self.redo_stack.clear()
+        removed = self.selected_files.remove_indices(selected_items)
+        self.record_list_change({'action': 'list_change', 'removed': removed})
 
-        indices_to_remove = sorted([self.file_tree.index(item) for item in selected_items], reverse=True)
-        for index in indices_to_remove:
-            self.selected_files.pop(index)
-        self.update_preview()
-        self.status_var.set(f"Removed {len(indices_to_remove)} files. Total: {len(self.selected_files)} files")
+        self.file_list.set_selection(())
+        self.refresh_preview()
+        self.status_var.set(f"Removed {len(removed)} files. Total: {len(self.selected_files)} files")
         self.update_action_buttons_state()
 
     def update_action_buttons_state(self):
         # Enable/disable Undo and Redo ----
         try:
             if hasattr(self, 'undo_button'):
-                state = tk.NORMAL if self.undo_stack else tk.DISABLED
+                state = tk.NORMAL if self.undo_stack and not self.busy else tk.DISABLED
                 self.undo_button.config(state=state)
             if hasattr(self, 'redo_button'):
-                state = tk.NORMAL if self.redo_stack else tk.DISABLED
+                state = tk.NORMAL if self.redo_stack and not self.busy else tk.DISABLED
                 self.redo_button.config(state=state)
+            if hasattr(self, 'stop_button'):
+                state = tk.NORMAL if self.current_job is not None else tk.DISABLED
+                self.pause_button.config(state=state)
+                self.stop_button.config(state=state)
         except Exception as e:
             print(f"Button state update error: {e}")
 
     def run(self):
         """Start the application"""
-        self.root.mainloop()
\ No newline at end of file
+        self.root.mainloop()
+        # Let a running job stop at its next safe point before the process exits
+        if self.current_job is not None:
+            self.current_job.cancel()
+        self.jobs.shutdown()
+        self.metadata.shutdown()
+        if self.presets is not None:
+            try:
+                self.presets.save(LAST_USED, self.current_options())
+            except OSError as e:
+                print(f"Could not save the options. ({e})")
\ No newline at end of file
@@ -0,0 +1,88 @@
+import fnmatch
+import os
+import queue
+import threading
+from pathlib import Path
+
+
+def parse_patterns(text):
+    """Split a filter such as "*.jpg; *.png" into a list of glob patterns"""
+    return [pattern.strip() for pattern in text.replace(",", ";").split(";") if pattern.strip()]
+
+
+def _matches(name, patterns):
+    return not patterns or any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def iter_files(paths, recursive=False, patterns=None, cancelled=None):
+    """Yield the files behind paths, expanding folders with os.scandir
+
+    Files given directly are always yielded; files found inside folders are
+    filtered by the glob patterns. Subfolders are only entered when recursive
+    is set. Entries of each folder come out in name order.
+    """
+    for path in paths:
+        if cancelled is not None and cancelled.is_set():
+            return
+        path = os.fspath(path)
+        if os.path.isfile(path):
+            yield Path(path)
+            continue
+
+        pending = [path]
+        while pending:
+            if cancelled is not None and cancelled.is_set():
+                return
+            directory = pending.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError:
+                continue
+
+            subfolders = []
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        if _matches(entry.name, patterns):
+                            yield Path(entry.path)
+                    elif recursive and entry.is_dir(follow_symlinks=False):
+                        subfolders.append(entry.path)
+                except OSError:
+                    continue
+            # Reversed so the stack visits subfolders in name order
+            pending.extend(reversed(subfolders))
+
+
+class FileIngestor(threading.Thread):
+    """Expands paths into files on a worker thread
+
+    Found files are put on `batches` in lists of up to batch_size paths,
+    followed by None once the scan is finished or cancelled. The UI drains
+    the queue from the Tk thread, so slow shares never block the window.
+    """
+
+    def __init__(self, paths, recursive=False, patterns=None, batch_size=500):
+        super().__init__(daemon=True)
+        self.paths = list(paths)
+        self.recursive = recursive
+        self.patterns = patterns
+        self.batch_size = batch_size
+        self.batches = queue.Queue()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        batch = []
+        try:
+            for path in iter_files(self.paths, self.recursive, self.patterns, self.cancelled):
+                batch.append(path)
+                if len(batch) >= self.batch_size:
+                    self.batches.put(batch)
+                    batch = []
+        finally:
+            if batch:
+                self.batches.put(batch)
+            self.batches.put(None)
@@ -0,0 +1,149 @@
+import threading
+import time
+
+
+class Job:
+    """A unit of background work with progress, pause and cancel
+
+    work(job) runs on the runner thread. It reports progress through
+    advance()/report() and calls checkpoint() between safe points: that
+    blocks while the job is paused and returns False once it is cancelled,
+    at which point the work should stop and return what it has done so far.
+    """
+
+    def __init__(self, label, work, total=0):
+        self.label = label
+        self.work = work
+        self.total = total
+        self.done = 0
+        self.errors = 0
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._paused_at = None
+        self._paused_total = 0.0
+        self._lock = threading.Lock()
+        self._resume = threading.Event()
+        self._resume.set()
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+
+    # ---------------- Control ----------------
+
+    def pause(self):
+        with self._lock:
+            if self._resume.is_set():
+                self._resume.clear()
+                self._paused_at = time.monotonic()
+
+    def resume(self):
+        with self._lock:
+            if not self._resume.is_set():
+                self._paused_total += time.monotonic() - self._paused_at
+                self._paused_at = None
+                self._resume.set()
+
+    def cancel(self):
+        self._cancel.set()
+        self.resume()
+
+    @property
+    def paused(self):
+        return not self._resume.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def is_finished(self):
+        return self._finished.is_set()
+
+    # ---------------- Called by the work ----------------
+
+    def checkpoint(self):
+        """Wait while paused; returns False if the job has been cancelled"""
+        self._resume.wait()
+        return not self._cancel.is_set()
+
+    def advance(self, done=1, errors=0):
+        with self._lock:
+            self.done += done
+            self.errors += errors
+
+    def report(self, done, total=None, errors=None):
+        with self._lock:
+            self.done = done
+            if total is not None:
+                self.total = total
+            if errors is not None:
+                self.errors = errors
+
+    def run(self):
+        self.started = time.monotonic()
+        try:
+            self.result = self.work(self)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = time.monotonic()
+            self._finished.set()
+
+    # ---------------- Reporting ----------------
+
+    def elapsed(self):
+        """Seconds spent running, not counting time spent paused"""
+        if self.started is None:
+            return 0.0
+        end = self.finished or time.monotonic()
+        paused = self._paused_total
+        if self._paused_at is not None:
+            paused += end - self._paused_at
+        return max(0.0, end - self.started - paused)
+
+    def rate(self):
+        elapsed = self.elapsed()
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """Estimated seconds left, or None before there is a rate to go on"""
+        rate = self.rate()
+        if not rate or not self.total:
+            return None
+        return max(0.0, (self.total - self.done) / rate)
+
+    def status_text(self):
+        text = f"{self.label}: {self.done}/{self.total} files"
+        rate = self.rate()
+        if rate:
+            text += f", {rate:.0f} files/s"
+        eta = self.eta()
+        if eta is not None:
+            minutes, seconds = divmod(int(eta), 60)
+            text += f", ETA {minutes}:{seconds:02d}"
+        if self.errors:
+            text += f", {self.errors} errors"
+        if self.paused:
+            text += " (paused)"
+        elif self.cancelled:
+            text += " (stopping)"
+        return text
+
+
+class JobRunner:
+    """Runs submitted jobs one after another on a background thread"""
+
+    def __init__(self):
+        self._executor = None
+
+    def submit(self, job):
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quickrenamer-job")
+        self._executor.submit(job.run)
+        return job
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+PLANNED = "planned"
+DONE = "done"
+FAILED = "failed"
+UNDONE = "undone"
+CANCELLED = "cancelled"
+
+RUNNING = "running"
+FINISHED = "finished"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    batch INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    src TEXT NOT NULL,
+    dst TEXT NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (batch, seq)
+) WITHOUT ROWID;
+"""
+
+
+class RenameJournal:
+    """Append-only SQLite log of rename batches, used for crash recovery and undo/redo
+
+    Every rename is written as "planned" (and committed) before it touches the
+    disk, so a crash can never leave an unrecorded rename behind. Completion is
+    marked afterwards in batched commits; a step still marked "planned" after
+    a crash is resolved by looking at which of its two paths exists.
+    """
+
+    def __init__(self, path, flush_every=1000):
+        self.path = str(path)
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._pending = []
+        self._next_seq = {}
+        import sqlite3  # Imported here so the GUI can show its window before the journal loads
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    # ---------------- Writing ----------------
+
+    def begin_batch(self):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO batches (created, state) VALUES (?, ?)", (time.time(), RUNNING))
+            self._conn.commit()
+            self._next_seq[cursor.lastrowid] = 0
+            return cursor.lastrowid
+
+    def log_planned(self, batch, steps):
+        """Durably record (src, dst) renames before they run; returns their sequence numbers"""
+        with self._lock:
+            first = self._next_seq.get(batch)
+            if first is None:
+                row = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq) + 1, 0) FROM steps WHERE batch = ?", (batch,)).fetchone()
+                first = row[0]
+            seqs = list(range(first, first + len(steps)))
+            self._next_seq[batch] = first + len(steps)
+            self._flush_locked()
+            self._conn.executemany(
+                "INSERT INTO steps (batch, seq, src, dst, status) VALUES (?, ?, ?, ?, ?)",
+                [(batch, seq, os.path.abspath(src), os.path.abspath(dst), PLANNED)
+                 for seq, (src, dst) in zip(seqs, steps)])
+            self._conn.commit()
+            return seqs
+
+    def mark(self, batch, seq, status):
+        """Record a step's outcome; written out every flush_every marks"""
+        with self._lock:
+            self._pending.append((status, batch, seq))
+            if len(self._pending) >= self.flush_every:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._pending:
+            self._conn.executemany("UPDATE steps SET status = ? WHERE batch = ? AND seq = ?", self._pending)
+            self._conn.commit()
+            self._pending = []
+
+    def finish_batch(self, batch):
+        with self._lock:
+            self._flush_locked()
+            self._conn.execute("UPDATE batches SET state = ? WHERE id = ?", (FINISHED, batch))
+            self._conn.commit()
+            self._next_seq.pop(batch, None)
+
+    # ---------------- Reading ----------------
+
+    def interrupted_batches(self):
+        """Ids of batches that never finished, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM batches WHERE state = ? ORDER BY id", (RUNNING,)).fetchall()
+        return [row[0] for row in rows]
+
+    def count_steps(self, batch, statuses=None, skip_suffix=None):
+        """Steps of a batch, optionally only those in statuses
+
+        skip_suffix leaves out steps whose destination ends with it, such as
+        the hop of a cycle into a temporary name, so every file counts once.
+        """
+        query = "SELECT COUNT(*) FROM steps WHERE batch = ?"
+        params = [batch]
+        if statuses:
+            query += f" AND status IN ({', '.join('?' * len(statuses))})"
+            params.extend(statuses)
+        if skip_suffix:
+            query += " AND substr(dst, -?) != ?"
+            params.extend((len(skip_suffix), skip_suffix))
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def iter_steps(self, batch, statuses=None, reverse=False, chunk_size=1000):
+        """Yield (seq, src, dst, status) for a batch in execution order (or reversed)
+
+        Rows are fetched a chunk at a time by sequence number, so even a huge
+        batch is never held in memory at once.
+        """
+        order = "DESC" if reverse else "ASC"
+        compare = "<" if reverse else ">"
+        status_filter = ""
+        if statuses:
+            status_filter = f" AND status IN ({', '.join('?' * len(statuses))})"
+        last = None
+        while True:
+            query = "SELECT seq, src, dst, status FROM steps WHERE batch = ?" + status_filter
+            params = [batch] + list(statuses or [])
+            if last is not None:
+                query += f" AND seq {compare} ?"
+                params.append(last)
+            query += f" ORDER BY seq {order} LIMIT ?"
+            params.append(chunk_size)
+            with self._lock:
+                self._flush_locked()
+                rows = self._conn.execute(query, params).fetchall()
+            if not rows:
+                return
+            for seq, src, dst, status in rows:
+                yield seq, Path(src), Path(dst), status
+            last = rows[-1][0]
+
+    def prune(self, keep=100):
+        """Forget all but the newest `keep` finished batches"""
+        with self._lock:
+            self._flush_locked()
+            rows = self._conn.execute(
+                "SELECT id FROM batches WHERE state = ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+                (FINISHED, keep)).fetchall()
+            old = [(row[0],) for row in rows]
+            if old:
+                self._conn.executemany("DELETE FROM steps WHERE batch = ?", old)
+                self._conn.executemany("DELETE FROM batches WHERE id = ?", old)
+                self._conn.commit()
+            return len(old)
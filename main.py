@@ -1,8 +1,20 @@
-from gui import BatchRenamer
+import sys
+import time
+
 
 def main():
-    app = BatchRenamer() 
+    started = time.perf_counter()
+    # Any command-line arguments run the headless CLI, which never imports tkinter
+    if len(sys.argv) > 1:
+        from cli import main as cli_main
+        sys.exit(cli_main())
+
+    from gui import BatchRenamer
+    app = BatchRenamer(started=started)
     app.run()
 
 if __name__ == "__main__":
+    # Lets process-pool workers (used for hashing) start in the frozen Windows build
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
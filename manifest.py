@@ -0,0 +1,234 @@
+"""Rename plans as CSV or JSON-lines manifests
+
+A manifest lists one rename per row: the file's path and its new name. It
+can be exported from a checked plan, edited by hand or by another tool, and
+applied later. Both reading and applying stream the file in chunks, so a
+manifest with millions of rows never has to fit in memory.
+
+    path,new_name
+    /photos/IMG_0001.jpg,holiday_001.jpg
+
+    {"path": "/photos/IMG_0001.jpg", "new_name": "holiday_001.jpg"}
+"""
+import csv
+import itertools
+import json
+import os
+from pathlib import Path
+
+from dirindex import DirectoryIndex
+from preflight import unclaim
+from selection import FileSelection
+
+COLUMNS = ("path", "new_name")
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+CHUNK_ROWS = 20000
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+
+def manifest_format(path):
+    """'csv' or 'jsonl', from the file extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unknown manifest type '{extension}', use .csv or .jsonl")
+    return FORMATS[extension]
+
+
+def write_manifest(path, rows, fmt=None):
+    """Write (old_path, new_name) rows as they come and return how many there were
+
+    Paths are written absolute so the manifest can be applied from any
+    folder. The file is written next to path and swapped in at the end.
+    """
+    fmt = fmt or manifest_format(path)
+    temp_path = f"{path}.tmp"
+    count = 0
+    with open(temp_path, "w", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            for old_path, new_name in rows:
+                writer.writerow((os.path.abspath(old_path), new_name))
+                count += 1
+        else:
+            for old_path, new_name in rows:
+                f.write(json.dumps({"path": os.path.abspath(old_path), "new_name": new_name},
+                                   ensure_ascii=False) + "\n")
+                count += 1
+    os.replace(temp_path, path)
+    return count
+
+
+def _csv_rows(f):
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [column.strip().lower() for column in header]
+    missing = [column for column in COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"line 1: manifest has no {', '.join(missing)} column")
+    path_at = header.index("path")
+    name_at = header.index("new_name")
+    line = reader.line_num
+    for row in reader:
+        if row:
+            if len(row) <= max(path_at, name_at):
+                raise ValueError(f"line {line + 1}: expected {len(header)} columns, found {len(row)}")
+            yield line + 1, row[path_at], row[name_at]
+        line = reader.line_num
+
+
+def _jsonl_rows(f):
+    for line, text in enumerate(f, 1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+            old_path, new_name = row["path"], row["new_name"]
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f"line {line}: expected an object with "
+                             f"\"path\" and \"new_name\" strings") from None
+        yield line, old_path, new_name
+
+
+def read_manifest(path, fmt=None):
+    """Yield (line, old_path, new_name) for each row, reading one row at a time
+
+    Raises ValueError naming the line of the first malformed row. A UTF-8
+    byte order mark, as left by spreadsheet programs, is ignored.
+    """
+    fmt = fmt or manifest_format(path)
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        rows = _csv_rows(f) if fmt == "csv" else _jsonl_rows(f)
+        for line, old_path, new_name in rows:
+            if not isinstance(old_path, str) or not isinstance(new_name, str) or not old_path:
+                raise ValueError(f"line {line}: path and new_name must be text")
+            yield line, Path(old_path), new_name
+
+
+def _signature(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def load_checkpoint(path):
+    """Rows of the manifest at path already applied by an interrupted run; 0 if none
+
+    A checkpoint left by a different version of the manifest is ignored.
+    """
+    try:
+        with open(path + CHECKPOINT_SUFFIX, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if data.get("manifest") != _signature(path):
+        return 0
+    return data.get("rows", 0)
+
+
+def save_checkpoint(path, rows):
+    data = {"manifest": _signature(path), "rows": rows}
+    checkpoint = path + CHECKPOINT_SUFFIX
+    temp_path = f"{checkpoint}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, checkpoint)
+
+
+def clear_checkpoint(path):
+    try:
+        os.remove(path + CHECKPOINT_SUFFIX)
+    except FileNotFoundError:
+        pass
+
+
+class ManifestChunk:
+    """One chunk of a manifest: its preflight report and, once applied, the rename outcome
+
+    lines and files hold the rows that were checked; the report's indices
+    point into them. repeated lists (line, path) of rows naming a file that
+    an earlier row of the manifest already renames. result is rename_files'
+    (success_count, error_count, errors, rename_history), or None on a dry
+    run.
+    """
+
+    def __init__(self, lines, files, report, repeated):
+        self.lines = lines
+        self.files = files
+        self.report = report
+        self.repeated = repeated
+        self.result = None
+
+    @property
+    def skipped(self):
+        return len(self.report.skipped) + len(self.repeated)
+
+    def issues(self):
+        """(line, message) for every problem found in this chunk, in manifest order"""
+        issues = [(self.lines[issue.index], str(issue)) for issue in self.report.issues]
+        issues.extend((line, f"{path.name}: is listed more than once; will be skipped")
+                      for line, path in self.repeated)
+        issues.sort(key=lambda issue: issue[0])
+        return issues
+
+
+def _check_chunk(renamer, rows, index, target_dir, seen):
+    lines = []
+    files = []
+    names = []
+    repeated = []
+    for line, old_path, new_name in rows:
+        # The file behind a second row would already be gone, so only the first one counts
+        if not seen.add(old_path):
+            repeated.append((line, old_path))
+            continue
+        lines.append(line)
+        files.append(old_path)
+        names.append(new_name)
+    report = renamer.preflight(files, names, target_dir, index)
+    return ManifestChunk(lines, files, report, repeated)
+
+
+def apply_manifest(renamer, path, apply=False, target_dir=None, workers=1, journal=None,
+                   resume=True, chunk_rows=CHUNK_ROWS):
+    """Check, and with apply=True rename, the files in a manifest one chunk at a time
+
+    Yields a ManifestChunk per chunk of rows. Every chunk is validated like
+    a plan from the GUI (renamer.preflight) against one DirectoryIndex kept
+    for the whole manifest, and renamed through renamer.rename_files with
+    that same index, so each folder is listed only once and a name taken by
+    an earlier chunk counts as taken in later ones. The files already named
+    are kept in a FileSelection, so a file listed again in a later chunk is
+    skipped as repeated.
+
+    When applying, a checkpoint next to the manifest records how many rows
+    are done after every chunk, and a new run skips those rows (unless
+    resume=False). If a run stops inside a chunk, the files of that chunk
+    already renamed show up as missing on the next run; with a journal,
+    renamer.recover_batch can finish or roll back the chunk first. The
+    checkpoint is removed once the whole manifest has been applied.
+    """
+    done = load_checkpoint(path) if apply and resume else 0
+    rows = read_manifest(path)
+    if done:
+        rows = itertools.islice(rows, done, None)
+    index = DirectoryIndex()
+    seen = FileSelection()
+    while True:
+        chunk_rows_read = list(itertools.islice(rows, chunk_rows))
+        if not chunk_rows_read:
+            break
+        chunk = _check_chunk(renamer, chunk_rows_read, index, target_dir, seen)
+        if apply:
+            report = chunk.report
+            unclaim(report, index, target_dir)
+            chunk.result = renamer.rename_files(report.files, report.names, workers=workers,
+                                                journal=journal, target_dir=target_dir, index=index)
+            done += len(chunk_rows_read)
+            save_checkpoint(path, done)
+        yield chunk
+    if apply:
+        clear_checkpoint(path)
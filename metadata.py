@@ -0,0 +1,125 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from dedupe import file_hash
+
+
+def read_exif_date(path):
+    """DateTimeOriginal (or DateTime) of a photo, or None; needs Pillow"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(path) as image:
+            exif = image.getexif()
+            value = exif.get_ifd(0x8769).get(36867) or exif.get(306)
+    except Exception:
+        return None
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value).strip("\x00 "), "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def _read_hash(path):
+    try:
+        return file_hash(path)
+    except OSError:
+        return None
+
+
+EXTRACTORS = {
+    "exif_date": read_exif_date,
+    "hash": _read_hash,
+}
+
+
+class MetadataCache:
+    """Lazily read file metadata, cached by (path, mtime, size) with LRU eviction
+
+    get() only reads the fields it is asked for; stat fields cost nothing
+    extra, EXIF dates and hashes are read on first use. A file that changes
+    on disk gets a new key, so stale values are never returned.
+    """
+
+    def __init__(self, max_entries=10000, workers=4):
+        self.max_entries = max_entries
+        self.workers = workers
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _key(self, path):
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        return key, st
+
+    def get(self, path, fields):
+        """Return a dict with the requested fields of path (None where unreadable)"""
+        try:
+            key, st = self._key(path)
+        except OSError:
+            return dict.fromkeys(fields)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {
+                    "mtime": datetime.fromtimestamp(st.st_mtime),
+                    "ctime": datetime.fromtimestamp(st.st_ctime),
+                    "size": st.st_size,
+                }
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            missing = [field for field in fields if field not in entry]
+
+        # Slow reads happen outside the lock so workers can run side by side
+        for field in missing:
+            entry[field] = EXTRACTORS[field](path)
+        return {field: entry[field] for field in fields}
+
+    def has(self, path, fields):
+        """True if all fields of path are cached and still current"""
+        try:
+            key, _ = self._key(path)
+        except OSError:
+            return True
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and all(field in entry for field in fields)
+
+    def prefetch(self, paths, fields):
+        """Read fields for paths on the worker pool; returns the futures"""
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix="quickrenamer-metadata")
+        return [self._executor.submit(self.get, path, fields) for path in paths]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_shared = None
+
+
+def shared_cache():
+    """The process-wide cache used by templates that are not given their own"""
+    global _shared
+    if _shared is None:
+        _shared = MetadataCache()
+    return _shared
@@ -0,0 +1,151 @@
+import errno
+import os
+import shutil
+import sys
+
+from dedupe import file_hash
+
+COPY_CHUNK = 8 * 1024 * 1024
+COPY_WORKERS = 4
+
+# Errors meaning "this kernel or filesystem can't do that copy call", not a real I/O failure
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+
+def same_device(path, directory):
+    """True if path and directory are on the same filesystem, so a rename can move between them"""
+    try:
+        return os.stat(path).st_dev == os.stat(directory).st_dev
+    except OSError:
+        return False
+
+
+def _copy_data(src_fd, dst_fd, size):
+    """Copy size bytes, in kernel where possible: copy_file_range, then sendfile, then read/write"""
+    offset = 0
+    method = "copy_file_range" if hasattr(os, "copy_file_range") else "sendfile"
+    if method == "sendfile" and not (sys.platform.startswith("linux") and hasattr(os, "sendfile")):
+        method = "read"
+    while offset < size:
+        count = min(COPY_CHUNK, size - offset)
+        try:
+            if method == "copy_file_range":
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+            elif method == "sendfile":
+                copied = os.sendfile(dst_fd, src_fd, offset, count)
+            else:
+                os.lseek(src_fd, offset, os.SEEK_SET)
+                data = os.read(src_fd, count)
+                copied = 0
+                while copied < len(data):
+                    copied += os.write(dst_fd, data[copied:])
+        except OSError as e:
+            if method == "read" or e.errno not in _UNSUPPORTED:
+                raise
+            # Fall back one level and carry on from the same offset; copy_file_range
+            # with explicit offsets never moved the destination's file position
+            method = "sendfile" if method == "copy_file_range" and sys.platform.startswith("linux") \
+                else "read"
+            os.lseek(dst_fd, offset, os.SEEK_SET)
+            continue
+        if copied == 0:
+            break  # The source got shorter; verification reports it
+        offset += copied
+
+
+def _fsync_directory(directory):
+    if os.name == "nt":
+        return  # Windows cannot open folders for fsync; NTFS journals the entry anyway
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def copy_file(src, dst, verify=True):
+    """Copy src to a new file dst, flushed to disk and checked, then remove src
+
+    dst must not exist. The copy is fsynced and compared with the source
+    (size, and content hash with verify=True) before the source is deleted;
+    on any failure the partial copy is removed and src is left untouched.
+    """
+    binary = getattr(os, "O_BINARY", 0)
+    before = os.stat(src)
+    src_fd = os.open(src, os.O_RDONLY | binary)
+    try:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL | binary, 0o666)
+        try:
+            try:
+                _copy_data(src_fd, dst_fd, before.st_size)
+                os.fsync(dst_fd)
+            finally:
+                os.close(dst_fd)
+            shutil.copystat(src, dst)
+            after = os.stat(src)
+            if (after.st_size, after.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+                raise OSError(errno.EAGAIN, f"'{os.path.basename(src)}' changed while it was copied")
+            if os.stat(dst).st_size != before.st_size:
+                raise OSError(errno.EIO, f"copy of '{os.path.basename(src)}' is incomplete")
+            if verify and file_hash(src) != file_hash(dst):
+                raise OSError(errno.EIO, f"copy of '{os.path.basename(src)}' does not match the original")
+            _fsync_directory(os.path.dirname(os.path.abspath(dst)))
+        except BaseException:
+            try:
+                os.remove(dst)
+            except OSError:
+                pass
+            raise
+    finally:
+        os.close(src_fd)
+    os.remove(src)
+
+
+def rename_no_replace(src, dst):
+    """Rename src to dst, raising FileExistsError rather than replacing an existing dst
+
+    Windows refuses to replace by itself. Elsewhere src is hard-linked to
+    dst, which fails if dst exists, and then unlinked; on filesystems
+    without hard links dst is checked right before a plain rename.
+    """
+    if os.name == "nt":
+        os.rename(src, dst)
+        return
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno in (errno.EEXIST, errno.EXDEV, errno.ENOENT):
+            raise
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, f"'{os.path.basename(dst)}' already exists", dst) from None
+        os.rename(src, dst)
+        return
+    os.unlink(src)
+
+
+def half_moved(src, dst):
+    """True if src and dst are hard links of one file, as rename_no_replace leaves them when stopped midway"""
+    try:
+        st = os.stat(src)
+        return st.st_nlink > 1 and os.path.samestat(st, os.stat(dst))
+    except OSError:
+        return False
+
+
+def move_file(src, dst, try_rename=True, verify=True):
+    """Move src to dst: a rename on one filesystem, else copy_file
+
+    An existing dst is never replaced; FileExistsError is raised instead.
+    Pass try_rename=False when the devices are known to differ. Returns True
+    if the file had to be copied. A rename that fails with EXDEV (a bind
+    mount, say) falls back to copying as well.
+    """
+    if try_rename:
+        try:
+            rename_no_replace(src, dst)
+            return False
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+    copy_file(src, dst, verify)
+    return True
@@ -0,0 +1,90 @@
+# Suffix of the temporary names used to break rename cycles
+TEMP_SUFFIX = ".qr-tmp"
+
+
+class RenameStep:
+    """One rename syscall: move src to dst once the file `after` has moved away"""
+
+    __slots__ = ("index", "src", "dst", "after", "final", "seq")
+
+    def __init__(self, index, src, dst, after=None, final=True):
+        self.index = index
+        self.src = src
+        self.dst = dst
+        self.after = after
+        self.final = final
+        self.seq = None
+
+
+def plan_directory(directory, items, index):
+    """Plan the renames that end up in one folder
+
+    items is a list of (i, old_path, new_name) tuples whose targets all live in
+    directory. Returns a list of units; each unit is a chain or a cycle of
+    RenameStep objects that must run in order. Chains are ordered so every
+    target is free when its rename runs. Cycles (swaps, rotations) move one
+    file to a temporary name first, so each file costs at most one extra rename.
+    """
+    # Files already in this folder give up their names; everything else
+    # (including files outside the batch) keeps its name reserved.
+    source_at = {}
+    for pos, (i, old_path, new_name) in enumerate(items):
+        if old_path.parent == directory:
+            index.release(directory, old_path.name)
+            source_at[index.key(directory, old_path.name)] = pos
+
+    targets = []
+    next_pos = {}
+    for pos, (i, old_path, new_name) in enumerate(items):
+        final_name = index.claim(directory, new_name)
+        targets.append(directory / final_name)
+        occupant = source_at.get(index.key(directory, final_name))
+        if occupant is not None and occupant != pos:
+            next_pos[pos] = occupant
+
+    has_pred = set(next_pos.values())
+    visited = set()
+    units = []
+
+    # Chains: start at files nobody is waiting on and run from the free end
+    for pos in range(len(items)):
+        if pos in has_pred:
+            continue
+        chain = []
+        current = pos
+        while current is not None:
+            chain.append(current)
+            visited.add(current)
+            current = next_pos.get(current)
+        steps = []
+        for current in reversed(chain):
+            waits_for = next_pos.get(current)
+            steps.append(RenameStep(
+                items[current][0], items[current][1], targets[current],
+                items[waits_for][0] if waits_for is not None else None))
+        units.append(steps)
+
+    # Whatever is left sits on a cycle
+    for pos in range(len(items)):
+        if pos in visited:
+            continue
+        cycle = []
+        current = pos
+        while current not in visited:
+            cycle.append(current)
+            visited.add(current)
+            current = next_pos[current]
+
+        first = cycle[0]
+        first_i, first_path, _ = items[first]
+        temp_path = directory / index.claim(directory, first_path.name + TEMP_SUFFIX)
+        steps = [RenameStep(first_i, first_path, temp_path, final=False)]
+        for current in reversed(cycle[1:]):
+            steps.append(RenameStep(
+                items[current][0], items[current][1], targets[current],
+                items[next_pos[current]][0]))
+        steps.append(RenameStep(first_i, temp_path, targets[first],
+                                items[next_pos[first]][0]))
+        units.append(steps)
+
+    return units
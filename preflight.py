@@ -0,0 +1,243 @@
+import os
+import re
+import stat
+from pathlib import Path
+
+from dirindex import DirectoryIndex
+
+MISSING = "missing"
+PERMISSION = "permission"
+INVALID = "invalid"
+TOO_LONG = "too long"
+CONFLICT = "conflict"
+
+WINDOWS = os.name == "nt"
+NAME_MAX = 255
+PATH_MAX = 259 if WINDOWS else 4095
+
+# Characters the filesystem refuses in a name
+BAD_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]' if WINDOWS else r"[/\x00]")
+_WINDOWS_RESERVED = {"CON", "PRN", "AUX", "NUL"} | {f"COM{n}" for n in range(1, 10)} \
+    | {f"LPT{n}" for n in range(1, 10)}
+
+
+class PreflightIssue:
+    """A problem found before renaming; resolution is the name that will be used, or None to skip"""
+
+    __slots__ = ("index", "path", "kind", "message", "resolution")
+
+    def __init__(self, index, path, kind, message, resolution=None):
+        self.index = index
+        self.path = path
+        self.kind = kind
+        self.message = message
+        self.resolution = resolution
+
+    def __str__(self):
+        action = f"will be named '{self.resolution}'" if self.resolution else "will be skipped"
+        return f"{self.path.name}: {self.message}; {action}"
+
+
+class PreflightReport:
+    """Outcome of checking a whole rename plan
+
+    indices, files and names list only the renames that will run, with every
+    fix already applied, so they can be passed straight to rename_files.
+    """
+
+    def __init__(self):
+        self.indices = []
+        self.files = []
+        self.names = []
+        self.issues = []
+        self.skipped = []
+
+    @property
+    def ok(self):
+        return not self.issues
+
+    def summary(self):
+        counts = {}
+        for issue in self.issues:
+            counts[issue.kind] = counts.get(issue.kind, 0) + 1
+        return ", ".join(f"{count} {kind}" for kind, count in counts.items())
+
+
+def sanitize_name(name):
+    """Return (fixed_name, problem) for a single name; problem is None if it was fine"""
+    fixed = BAD_CHARS.sub("_", name)
+    problem = "contains characters that are not allowed" if fixed != name else None
+    if WINDOWS:
+        stripped = fixed.rstrip(" .")
+        if stripped != fixed:
+            fixed = stripped
+            problem = problem or "ends with a space or dot"
+        if fixed.split(".")[0].upper() in _WINDOWS_RESERVED:
+            fixed = "_" + fixed
+            problem = problem or "is a reserved device name"
+    if not fixed.strip() or fixed in (".", ".."):
+        return None, "is empty"
+    return fixed, problem
+
+
+def _name_length(name):
+    return len(name.encode("utf-16-le")) // 2 if WINDOWS else len(os.fsencode(name))
+
+
+def fit_name(directory, name):
+    """Shorten the stem of name until the name and the full path fit; None if impossible"""
+    stem, extension = os.path.splitext(name)
+    room = min(NAME_MAX, PATH_MAX - len(os.path.join(os.path.abspath(directory), "")))
+    while stem and _name_length(stem + extension) > room:
+        stem = stem[:-1]
+    if not stem:
+        return None
+    return stem + extension
+
+
+def _writable(directory):
+    return os.access(directory, os.W_OK if WINDOWS else os.W_OK | os.X_OK)
+
+
+def _sticky(directory):
+    """Owner of a sticky folder such as /tmp, where only owners may rename files; else None"""
+    if WINDOWS or not hasattr(os, "geteuid") or os.geteuid() == 0:
+        return None
+    try:
+        dir_stat = os.stat(directory)
+    except OSError:
+        return None
+    return dir_stat.st_uid if dir_stat.st_mode & stat.S_ISVTX else None
+
+
+def _owned_by_other(path, dir_owner):
+    uid = os.geteuid()
+    try:
+        return dir_owner != uid and os.lstat(path).st_uid != uid
+    except OSError:
+        return False
+
+
+def unclaim(report, index, target_dir=None):
+    """Undo the claims check_plan made in index for report's renames
+
+    check_plan leaves index holding the names as they will be once the
+    renames ran. This puts it back to the names on disk now, so the same
+    index can be passed to rename_files instead of listing every folder
+    again.
+    """
+    target_key = os.path.abspath(target_dir) if target_dir is not None else None
+    returned = []
+    # All targets first: in a swap one file's target is the other's source
+    for old_path, name in zip(report.files, report.names):
+        directory = old_path.parent
+        if target_key is not None and os.path.abspath(directory) != target_key:
+            index.release(Path(target_dir), name)
+        else:
+            index.release(directory, name)
+            returned.append(old_path)
+    for old_path in returned:
+        index.add(old_path.parent, old_path.name)
+
+
+def check_plan(selected_files, preview_names, index=None, target_dir=None):
+    """Check every planned rename before any of them runs
+
+    Each parent folder is listed once (through a DirectoryIndex) and checked
+    for write access once. Reports files that no longer exist, folders we
+    cannot write to, names the filesystem would reject, names or paths that
+    are too long, and targets that clash with each other or with existing
+    files. Clashes get the same name_N resolution the renamer would pick.
+    With target_dir the names are checked against that folder instead, as
+    the files will be moved there.
+    """
+    index = index or DirectoryIndex()
+    report = PreflightReport()
+    if target_dir is not None:
+        target = Path(target_dir)
+        target_key = os.path.abspath(target)
+        # A target that does not exist yet will be created inside its nearest existing parent
+        existing = os.path.abspath(target)
+        while not os.path.isdir(existing) and os.path.dirname(existing) != existing:
+            existing = os.path.dirname(existing)
+        target_writable = _writable(existing)
+
+    groups = {}
+    for i, (old_path, new_name) in enumerate(zip(selected_files, preview_names)):
+        groups.setdefault(old_path.parent, []).append((i, old_path, new_name))
+
+    def skip(i, old_path, kind, message):
+        report.issues.append(PreflightIssue(i, old_path, kind, message))
+        report.skipped.append(i)
+
+    # rename_files renames in place first and moves into target_dir after, so the
+    # target's own files give up their names before moved files claim theirs
+    order = [(target_dir is not None and os.path.abspath(directory) != target_key, directory, items)
+             for directory, items in groups.items()]
+    order.sort(key=lambda group: group[0])
+
+    resolved = {}
+    for moving, directory, items in order:
+        dest = directory
+        blocked = None if _writable(directory) else directory
+        if moving:
+            dest = target
+            if blocked is None and not target_writable:
+                blocked = target
+        dir_owner = _sticky(directory)
+
+        renames = []
+        for i, old_path, new_name in items:
+            if not index.contains(directory, old_path.name):
+                skip(i, old_path, MISSING, "no longer exists")
+            elif new_name == old_path.name and not moving:
+                continue
+            elif blocked is not None:
+                skip(i, old_path, PERMISSION, f"no permission to rename files in '{blocked}'")
+            elif dir_owner is not None and _owned_by_other(old_path, dir_owner):
+                skip(i, old_path, PERMISSION, "belongs to another user")
+            else:
+                renames.append((i, old_path, new_name))
+
+        # Same bookkeeping as the planner: files being renamed give up their names first
+        if not moving:
+            for i, old_path, _ in renames:
+                index.release(directory, old_path.name)
+
+        for i, old_path, new_name in renames:
+            kind = None
+            problem = None
+            name, bad = sanitize_name(new_name)
+            if name is None:
+                skip(i, old_path, INVALID, f"new name {bad}")
+                if not moving:
+                    index.add(directory, old_path.name)
+                continue
+            if bad is not None:
+                kind, problem = INVALID, f"new name {bad}"
+
+            fitted = fit_name(dest, name)
+            if fitted is None:
+                skip(i, old_path, TOO_LONG, "folder path is too long for any new name")
+                if not moving:
+                    index.add(directory, old_path.name)
+                continue
+            if fitted != name:
+                if kind is None:
+                    kind, problem = TOO_LONG, "new name is too long"
+                name = fitted
+
+            final = index.claim(dest, name)
+            if final != name and kind is None:
+                kind, problem = CONFLICT, f"'{name}' is already taken"
+            if kind is not None:
+                report.issues.append(PreflightIssue(i, old_path, kind, problem, final))
+            resolved[i] = final
+
+    for i in sorted(resolved):
+        report.indices.append(i)
+        report.files.append(selected_files[i])
+        report.names.append(resolved[i])
+    report.issues.sort(key=lambda issue: issue.index)
+    report.skipped.sort()
+    return report
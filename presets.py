@@ -0,0 +1,182 @@
+"""Named rename presets and a cache of computed plans
+
+A preset is the set of RenamePlan.from_options arguments, stored by name in
+a JSON file. PlanCache keeps the names a plan produced for a file list on
+disk, keyed by a hash of the options and a fingerprint of the list, so the
+same job opened again does not have to work its names out again.
+"""
+import hashlib
+import json
+import os
+
+from utils import app_data_dir
+
+PRESETS_FILE = "presets.json"
+PLAN_CACHE_DIR = "plans"
+PLAN_CACHE_ENTRIES = 8
+# Saved when the GUI closes and loaded when it starts
+LAST_USED = "Last used"
+
+
+def _write_json(path, data):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def options_hash(options):
+    """Stable hash of a set of rename options"""
+    text = json.dumps(options, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class ListFingerprint:
+    """Running fingerprint of a file list that only grows at the end
+
+    update() hashes just the paths added since the last call; copy() lets
+    one fingerprint be extended without changing the other.
+    """
+
+    def __init__(self):
+        self._digest = hashlib.sha1()
+        self.count = 0
+
+    def update(self, paths):
+        digest = self._digest
+        for path in paths:
+            digest.update(os.fsencode(str(path)))
+            digest.update(b"\0")
+            self.count += 1
+
+    def copy(self):
+        other = ListFingerprint()
+        other._digest = self._digest.copy()
+        other.count = self.count
+        return other
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+def fingerprint(paths):
+    """Hash of the file list in order; paths only, so no file is touched"""
+    running = ListFingerprint()
+    running.update(paths)
+    return running.hexdigest()
+
+
+def file_signatures(paths):
+    """(size, mtime_ns) of each file, or None for files that cannot be read"""
+    signatures = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            signatures.append((st.st_size, st.st_mtime_ns))
+        except OSError:
+            signatures.append(None)
+    return signatures
+
+
+class PresetStore:
+    """Named rename options kept in a JSON file"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(app_data_dir(), PRESETS_FILE)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._presets = json.load(f).get("presets", {})
+        except FileNotFoundError:
+            self._presets = {}
+
+    def names(self):
+        return sorted(name for name in self._presets if name != LAST_USED)
+
+    def __contains__(self, name):
+        return name in self._presets
+
+    def get(self, name):
+        """Options of the named preset; raises KeyError if there is none"""
+        return dict(self._presets[name])
+
+    def save(self, name, options):
+        self._presets[name] = dict(options)
+        _write_json(self.path, {"presets": self._presets})
+
+    def delete(self, name):
+        if self._presets.pop(name, None) is not None:
+            _write_json(self.path, {"presets": self._presets})
+
+
+class PlanCache:
+    """Computed names on disk, one JSON-lines file per (options hash, list fingerprint)
+
+    For plans that read file metadata the file's (size, mtime_ns) is stored
+    next to each name, so a cached name can be checked with a stat instead
+    of reading the file again. Only the newest max_entries plans are kept.
+    """
+
+    def __init__(self, directory=None, max_entries=PLAN_CACHE_ENTRIES):
+        self.directory = directory or os.path.join(app_data_dir(), PLAN_CACHE_DIR)
+        self.max_entries = max_entries
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, options_key, files_key):
+        return os.path.join(self.directory, f"{options_key[:20]}-{files_key[:20]}.jsonl")
+
+    def get(self, options_key, files_key, count):
+        """(names, signatures) cached for this plan and list, or None; signatures may be None"""
+        path = self._path(options_key, files_key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                if header.get("options") != options_key or header.get("files") != files_key \
+                        or header.get("count") != count:
+                    return None
+                names = []
+                signatures = [] if header.get("signatures") else None
+                for line in f:
+                    row = json.loads(line)
+                    names.append(row[0])
+                    if signatures is not None:
+                        signatures.append(tuple(row[1]) if row[1] is not None else None)
+        except (OSError, ValueError, IndexError):
+            return None
+        if len(names) != count:
+            return None
+        os.utime(path)  # Keeps recently used plans from being pruned
+        return names, signatures
+
+    def put(self, options_key, files_key, names, signatures=None):
+        path = self._path(options_key, files_key)
+        temp_path = f"{path}.tmp"
+        header = {"options": options_key, "files": files_key, "count": len(names),
+                  "signatures": signatures is not None}
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            if signatures is None:
+                f.writelines(json.dumps([name]) + "\n" for name in names)
+            else:
+                f.writelines(json.dumps([name, signature]) + "\n"
+                             for name, signature in zip(names, signatures))
+        os.replace(temp_path, path)
+        self.prune()
+
+    def prune(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".jsonl"):
+                    entries.append((entry.stat().st_mtime, entry.path))
+        entries.sort(reverse=True)
+        for _, path in entries[self.max_entries:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".jsonl"):
+                    os.remove(entry.path)
@@ -1,36 +1,169 @@
+import os
+import threading
+import time
 from pathlib import Path
 
+from dedupe import find_duplicates, hash_files
+from dirindex import DirectoryIndex
+from journal import CANCELLED, DONE, FAILED, PLANNED, UNDONE
+from mover import COPY_WORKERS, half_moved, move_file, same_device
+from planner import plan_directory
+from preflight import check_plan
+from presets import PresetStore, file_signatures, fingerprint, options_hash
+from rules import RenamePlan
+from stats import LatencyHistogram
+
+
+class ReplayResult:
+    """Outcome of undoing or redoing a journaled batch
+
+    failed lists (seq, old_path, new_path, error) for every step that did not
+    move. Those steps keep their journal status, so they can be retried by
+    replaying the batch again.
+    """
+
+    def __init__(self, batch, undo):
+        self.batch = batch
+        self.undo = undo
+        self.success_count = 0
+        self.failed = []
+        self._lock = threading.Lock()
+
+    def add_success(self):
+        with self._lock:
+            self.success_count += 1
+
+    def add_failure(self, seq, old_path, new_path, error):
+        with self._lock:
+            self.failed.append((seq, old_path, new_path, error))
+
+    @property
+    def error_count(self):
+        return len(self.failed)
+
+    @property
+    def done_count(self):
+        return self.success_count + len(self.failed)
+
+    @property
+    def errors(self):
+        return [f"{old_path.name}: {str(error)}" for _, old_path, _, error in self.failed]
+
 
 class FileRenamer:
-    """Handles file renaming logic"""
+    """Handles file renaming logic
+
+    Attach a stats.RenameStats as `stats` to record phase timers, syscall
+    counts and per-folder rename latencies; without one nothing is measured.
+    """
+
+    def __init__(self, stats=None):
+        self.stats = stats
 
     def generate_new_name(self, file_path, index, use_sequential, base_name, start_number,
                           number_padding, use_prefix, prefix_text, use_suffix, suffix_text):
-        original_name = file_path.stem
-        extension = file_path.suffix
-        new_name = ""
+        """Name a single file; use RenamePlan.apply for whole lists"""
+        stats = self.stats
+        start = time.perf_counter() if stats is not None else None
+        plan = RenamePlan.from_options(use_sequential, base_name, start_number, number_padding,
+                                       use_prefix, prefix_text, use_suffix, suffix_text)
+        name = plan.name_for(file_path, index)
+        if stats is not None:
+            stats.add_phase("generate", start, time.perf_counter())
+        return name
 
-        if use_sequential:
-            try:
-                start_num = int(start_number)
-                padding = int(number_padding)
-                number = start_num + index
-                new_name = f"{base_name}{number:0{padding}d}"
-            except ValueError:
-                new_name = f"{base_name}{index + 1}"
-        else:
-            new_name = original_name
+    def hash_names(self, selected_files, length=16, workers=None, job=None):
+        """Name every file after its content hash, keeping the extension
+
+        Identical files get the same name, so in one folder the copies end up
+        as name_1, name_2... Unreadable files keep their name. Returns None if
+        the job was cancelled.
+        """
+        hashes = hash_files(selected_files, workers, job)
+        if hashes is None:
+            return None
+        return [file_path.name if digest is None else digest[:length] + file_path.suffix
+                for file_path, digest in zip(selected_files, hashes)]
+
+    def load_preset(self, name, store=None):
+        """Rename options saved under name (see presets.PresetStore); KeyError if unknown"""
+        return (store or PresetStore()).get(name)
+
+    def planned_names(self, selected_files, options, cache=None, metadata=None, files_key=None):
+        """New names for selected_files under the RenamePlan.from_options options
+
+        With a presets.PlanCache, names computed earlier for the same options
+        and file list are reused. Only plans that read file metadata use the
+        cache; the others are cheaper to compute again than to read back. The
+        files are only stat'ed, and just the ones that changed are named
+        again. files_key is the list's fingerprint, if already known.
+        """
+        plan = RenamePlan.from_options(metadata=metadata, **options)
+        if cache is None or not plan.fields:
+            return plan.apply(selected_files)
+
+        files = list(selected_files)
+        options_key = options_hash(options)
+        files_key = files_key or fingerprint(files)
+        cached = cache.get(options_key, files_key, len(files))
+        if cached is not None and cached[1] is not None:
+            names, signatures = cached
+            changed = 0
+            for i, (before, now) in enumerate(zip(signatures, file_signatures(files))):
+                if before != now:
+                    names[i] = plan.name_for(files[i], i)
+                    signatures[i] = now
+                    changed += 1
+            if changed:
+                cache.put(options_key, files_key, names, signatures)
+            return names
 
-        if use_prefix and prefix_text:
-            new_name = prefix_text + new_name
+        names = plan.apply(files)
+        cache.put(options_key, files_key, names, file_signatures(files))
+        return names
 
-        if use_suffix and suffix_text:
-            new_name = new_name + suffix_text
+    def preflight(self, selected_files, preview_names, target_dir=None, index=None):
+        """Check the whole plan before renaming anything, see preflight.check_plan
 
-        return new_name + extension
+        The report's files and names hold only renames known to be valid, with
+        fixes for clashes, bad characters and overlong names already applied.
+        Pass a DirectoryIndex to check a plan in parts (see manifest.py); it
+        then already holds the names claimed by the earlier parts.
+        """
+        stats = self.stats
+        if stats is None:
+            return check_plan(selected_files, preview_names, index, target_dir)
+        start = time.perf_counter()
+        index = index or DirectoryIndex()
+        listings = index.listings
+        report = check_plan(selected_files, preview_names, index, target_dir)
+        stats.add_phase("preflight", start, time.perf_counter())
+        stats.count("scandir", index.listings - listings)
+        return report
+
+    def find_duplicates(self, selected_files, workers=None, job=None):
+        """Groups of selected files with identical content, see dedupe.find_duplicates"""
+        return find_duplicates(selected_files, workers, job)
+
+    def get_safe_filename(self, directory, desired_name, index=None):
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+            probes = [0]
+            safe_name = self._safe_filename(directory, desired_name, index, probes)
+            stats.add_phase("collision", start, time.perf_counter())
+            if probes[0]:
+                stats.count("stat", probes[0])
+            return safe_name
+        return self._safe_filename(directory, desired_name, index)
+
+    def _safe_filename(self, directory, desired_name, index, probes=None):
+        if index is not None:
+            return index.claim(directory, desired_name)
 
-    def get_safe_filename(self, directory, desired_name):
         full_path = directory / desired_name
+        if probes is not None:
+            probes[0] += 1
         if not full_path.exists():
             return desired_name
 
@@ -41,26 +174,462 @@ class FileRenamer:
         while True:
             safe_name = f"{name_stem}_{counter}{extension}"
             safe_path = directory / safe_name
+            if probes is not None:
+                probes[0] += 1
             if not safe_path.exists():
                 return safe_name
             counter += 1
 
-    def rename_files(self, selected_files, preview_names):
+    def _rename_group(self, directory, items, index, journal=None, batch=None, job=None):
+        """Plan and run the renames of one folder
+
+        Returns (outcomes, steps): one (i, old_path, new_path, error) tuple per
+        file that was processed and the (src, dst) renames that actually
+        happened, in order.
+        """
+        current = {i: old_path for i, old_path, _ in items}
+        failed = {}
+        temps = set()
+        steps_done = []
+        skipped = set()
+        stats = self.stats
+        clock = time.perf_counter
+        if stats is not None:
+            group_start = clock()
+            latencies = LatencyHistogram()
+
+        units = plan_directory(directory, items, index)
+        if stats is not None:
+            stats.add_phase("plan", group_start, clock(), directory)
+        if journal is not None:
+            # The whole folder's plan is on disk before the first rename runs
+            journal_start = clock() if stats is not None else None
+            planned = [step for unit in units for step in unit if step.src != step.dst]
+            seqs = journal.log_planned(batch, [(step.src, step.dst) for step in planned])
+            for step, seq in zip(planned, seqs):
+                step.seq = seq
+            if stats is not None:
+                stats.add_phase("journal", journal_start, clock(), directory)
+        rename_start = clock() if stats is not None else None
+
+        for position, unit in enumerate(units):
+            # Units are the safe points: stopping between them never strands a temporary name
+            if job is not None and not job.checkpoint():
+                for remaining in units[position:]:
+                    for step in remaining:
+                        skipped.add(step.index)
+                        if step.seq is not None:
+                            journal.mark(batch, step.seq, CANCELLED)
+                break
+
+            failed_before = len(failed)
+            for step in unit:
+                if step.index in failed:
+                    if step.seq is not None:
+                        journal.mark(batch, step.seq, FAILED)
+                    continue
+                if step.after in failed:
+                    # The target still holds the file that failed to move away
+                    index.add(step.src.parent, step.src.name)
+                    failed[step.index] = FileExistsError(f"'{step.dst.name}' is still in use")
+                    if step.seq is not None:
+                        journal.mark(batch, step.seq, FAILED)
+                    continue
+
+                error = None
+                if step.src != step.dst:
+                    try:
+                        if stats is None:
+                            step.src.rename(step.dst)
+                        else:
+                            started = clock()
+                            try:
+                                step.src.rename(step.dst)
+                            finally:
+                                latencies.add(clock() - started)
+                    except Exception as e:
+                        error = e
+
+                if step.seq is not None:
+                    journal.mark(batch, step.seq, FAILED if error is not None else DONE)
+
+                if error is None:
+                    if step.src in temps:
+                        index.release(directory, step.src.name)
+                    if not step.final:
+                        temps.add(step.dst)
+                    if step.src != step.dst:
+                        steps_done.append((step.src, step.dst))
+                    current[step.index] = step.dst
+                else:
+                    index.release(step.dst.parent, step.dst.name)
+                    index.add(step.src.parent, step.src.name)
+                    failed[step.index] = error
+
+            if job is not None:
+                job.advance(sum(1 for step in unit if step.final), len(failed) - failed_before)
+
+        if stats is not None:
+            stats.add_phase("rename", rename_start, clock(), directory)
+            stats.add_directory(directory, latencies, {"rename": latencies.count})
+
+        # Files left out by a cancel get no outcome: neither renamed nor failed
+        outcomes = []
+        for i, old_path, _ in items:
+            if i not in skipped:
+                outcomes.append((i, old_path, current[i], failed.get(i)))
+        return outcomes, steps_done
+
+    def _move_files(self, target, items, index, journal=None, batch=None, job=None,
+                    copy_workers=COPY_WORKERS):
+        """Move files from other folders into target under their new names
+
+        Files already on target's filesystem (checked once per source folder)
+        are moved with a rename that never replaces an existing file. The rest are copied, verified and
+        then deleted on a pool of copy_workers threads, which bounds how many
+        copies read and write at once. Returns (outcomes, steps) like
+        _rename_group.
+        """
+        stats = self.stats
+        clock = time.perf_counter
+        if stats is not None:
+            move_start = clock()
+            latencies = LatencyHistogram()
+
+        fast = {}
+        moves = []
+        for i, old_path, new_name in items:
+            parent = old_path.parent
+            if parent not in fast:
+                fast[parent] = same_device(parent, target)
+            moves.append((i, old_path, target / index.claim(target, new_name), fast[parent]))
+        seqs = [None] * len(moves)
+        if journal is not None:
+            seqs = journal.log_planned(batch, [(old_path, new_path) for _, old_path, new_path, _ in moves])
+
+        outcomes = []
+        steps_done = []
+        copies = 0
+
+        def timed_move(old_path, new_path, try_rename):
+            started = clock()
+            copied = move_file(old_path, new_path, try_rename)
+            return copied, clock() - started
+
+        def finish(i, old_path, new_path, seq, error, copied=False, elapsed=0.0):
+            nonlocal copies
+            if seq is not None:
+                journal.mark(batch, seq, FAILED if error is not None else DONE)
+            if error is None:
+                copies += copied
+                if stats is not None:
+                    latencies.add(elapsed)
+                steps_done.append((old_path, new_path))
+                outcomes.append((i, old_path, new_path, None))
+            else:
+                index.release(target, new_path.name)
+                outcomes.append((i, old_path, old_path, error))
+            if job is not None:
+                job.advance(1, 0 if error is None else 1)
+
+        def finish_future(future):
+            error = future.exception()
+            if error is None:
+                finish(*running.pop(future), None, *future.result())
+            else:
+                finish(*running.pop(future), error)
+
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+        running = {}
+        with ThreadPoolExecutor(max_workers=copy_workers) as executor:
+            for position, ((i, old_path, new_path, rename), seq) in enumerate(zip(moves, seqs)):
+                if job is not None and not job.checkpoint():
+                    for _, _, new_path, _ in moves[position:]:
+                        index.release(target, new_path.name)
+                    if journal is not None:
+                        for seq in seqs[position:]:
+                            journal.mark(batch, seq, CANCELLED)
+                    break
+                # Keep a few copies queued per worker, not the whole batch
+                while len(running) >= copy_workers * 2:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        finish_future(future)
+                if rename:
+                    # Same filesystem: a single rename, no point queueing it behind copies
+                    try:
+                        result = timed_move(old_path, new_path, True)
+                    except Exception as e:
+                        finish(i, old_path, new_path, seq, e)
+                    else:
+                        finish(i, old_path, new_path, seq, None, *result)
+                else:
+                    running[executor.submit(timed_move, old_path, new_path, False)] = (i, old_path, new_path, seq)
+            for future in list(running):
+                finish_future(future)
+
+        if stats is not None:
+            stats.add_phase("move", move_start, clock(), target)
+            stats.add_directory(target, latencies,
+                                {"rename": latencies.count - copies, "copy": copies})
+        return outcomes, steps_done
+
+    def rename_files(self, selected_files, preview_names, workers=1, journal=None, batch=None, job=None,
+                     target_dir=None, copy_workers=COPY_WORKERS, index=None):
+        """Rename selected_files to preview_names
+
+        Renames are grouped by parent folder. With workers > 1 the folders are
+        processed concurrently on a thread pool; files inside one folder are
+        always renamed in order so collision handling stays the same.
+
+        Names that are swapped or shifted within the batch (renumbering
+        file01..file99 from a new start number) are renamed in dependency
+        order, going through a temporary name only to break cycles.
+        rename_history lists every rename performed, temporary hops
+        included, so replaying it backwards restores the original names.
+
+        With a RenameJournal every rename is also logged to disk under
+        `batch` (a new batch if none is given), so an interrupted run can be
+        finished or rolled back with recover_batch after a restart.
+
+        A jobs.Job can be passed to report progress and to pause or cancel the
+        run. Cancelling stops between chains/cycles, so files are only ever
+        left on their old or new names and the history stays undoable.
+
+        With target_dir the files are moved into that (existing) folder under
+        their new names, see _move_files; files already in it are renamed
+        in place as usual.
+
+        index is a DirectoryIndex that already holds the folders as they are
+        now, such as one a plan was checked with and then handed back with
+        preflight.unclaim; folders it has listed are not listed again.
+        """
         success_count = 0
         error_count = 0
         errors = []
-        rename_history = []  
+        rename_history = []
+        index = index or DirectoryIndex()
+        listings = index.listings
+        stats = self.stats
+        if stats is not None:
+            started = time.perf_counter()
+        if journal is not None and batch is None:
+            batch = journal.begin_batch()
 
+        groups = {}
         for i, (old_path, new_name) in enumerate(zip(selected_files, preview_names)):
+            groups.setdefault(old_path.parent, []).append((i, old_path, new_name))
+
+        moves = []
+        if target_dir is not None:
+            target = Path(target_dir)
+            target_key = os.path.abspath(target)
+            for directory in list(groups):
+                if os.path.abspath(directory) != target_key:
+                    moves.extend(groups.pop(directory))
+            moves.sort(key=lambda item: item[0])
+
+        if workers > 1 and len(groups) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                group_results = list(executor.map(
+                    lambda group: self._rename_group(group[0], group[1], index, journal, batch, job),
+                    groups.items()))
+        else:
+            group_results = [self._rename_group(directory, items, index, journal, batch, job)
+                             for directory, items in groups.items()]
+        if moves:
+            group_results.append(self._move_files(target, moves, index, journal, batch, job, copy_workers))
+        if journal is not None:
+            journal.finish_batch(batch)
+        if stats is not None:
+            stats.add_phase("rename_files", started, time.perf_counter())
+            stats.count("scandir", index.listings - listings)
+
+        outcomes = [None] * len(preview_names)
+        for results, steps_done in group_results:
+            rename_history.extend(steps_done)
+            for outcome in results:
+                outcomes[outcome[0]] = outcome
+
+        for outcome in outcomes:
+            if outcome is None:
+                continue
+            i, old_path, new_path, error = outcome
+            # A file that failed halfway through a cycle is left on its temporary name
+            selected_files[i] = new_path
+            if error is None:
+                success_count += 1
+            else:
+                error_count += 1
+                errors.append(f"{old_path.name}: {str(error)}")
+
+        return success_count, error_count, errors, rename_history
+
+    def _replay_group(self, journal, batch, steps, undo, result, job=None):
+        new_status = UNDONE if undo else DONE
+        stats = self.stats
+        if stats is not None:
+            group_start = time.perf_counter()
+            latencies = LatencyHistogram()
+        checked = 0
+        try:
+            for seq, src, dst in steps:
+                if job is not None and not job.checkpoint():
+                    return
+                old_path, new_path = (dst, src) if undo else (src, dst)
+                checked += 1
+                try:
+                    if new_path.exists():
+                        raise FileExistsError(f"'{new_path.name}' already exists")
+                    # move_file: a moved-and-renamed file may have to be copied back
+                    if stats is None:
+                        move_file(old_path, new_path)
+                    else:
+                        started = time.perf_counter()
+                        try:
+                            move_file(old_path, new_path)
+                        finally:
+                            latencies.add(time.perf_counter() - started)
+                    journal.mark(batch, seq, new_status)
+                    result.add_success()
+                except Exception as e:
+                    result.add_failure(seq, old_path, new_path, e)
+        finally:
+            if stats is not None:
+                directory = steps[0][1].parent
+                stats.add_phase("undo" if undo else "redo", group_start, time.perf_counter(), directory)
+                stats.add_directory(directory, latencies, {"rename": latencies.count, "stat": checked})
+
+    def replay_batch(self, journal, batch, undo=True, workers=1, job=None, chunk_size=5000):
+        """Undo (or redo) a journaled batch, streaming its steps from the journal
+
+        Undo walks the completed renames backwards; redo walks the undone ones
+        forwards. Steps are read a chunk at a time and grouped by folder; with
+        workers > 1 the folders of a chunk are replayed concurrently, each in
+        order. Every step's new status is written back, so failed steps keep
+        their old status and replaying the batch again retries just those,
+        which is also how a cancelled job is picked up again.
+        Progress goes to the optional jobs.Job. Returns a ReplayResult.
+        """
+        statuses = [DONE] if undo else [UNDONE]
+        total = journal.count_steps(batch, statuses)
+        result = ReplayResult(batch, undo)
+        if job is not None:
+            job.report(0, total)
+
+        executor = None
+        if workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            executor = ThreadPoolExecutor(max_workers=workers)
+
+        try:
+            chunk = []
+            steps = journal.iter_steps(batch, statuses, reverse=undo, chunk_size=chunk_size)
+            for seq, src, dst, status in steps:
+                chunk.append((seq, src, dst))
+                if len(chunk) >= chunk_size:
+                    self._replay_chunk(journal, batch, chunk, undo, result, executor, job)
+                    chunk = []
+                    if job is not None and job.cancelled:
+                        break
+            if chunk and not (job is not None and job.cancelled):
+                self._replay_chunk(journal, batch, chunk, undo, result, executor, job)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            journal.flush()
+        return result
+
+    def _replay_chunk(self, journal, batch, chunk, undo, result, executor, job):
+        # A move touches two folders, so folders linked by one are replayed as one
+        # group; otherwise T/a -> T/b and X/c -> T/a could run out of order
+        root = {}
+
+        def find(directory):
+            while directory in root:
+                directory = root[directory]
+            return directory
+
+        for _, src, dst in chunk:
+            a, b = find(src.parent), find(dst.parent)
+            if a != b:
+                root[b] = a
+        groups = {}
+        for step in chunk:
+            groups.setdefault(find(step[1].parent), []).append(step)
+
+        if executor is None or len(groups) == 1:
+            for steps in groups.values():
+                self._replay_group(journal, batch, steps, undo, result, job)
+                if job is not None:
+                    job.report(result.done_count, errors=result.error_count)
+            return
+
+        from concurrent.futures import as_completed
+        futures = [executor.submit(self._replay_group, journal, batch, steps, undo, result, job)
+                   for steps in groups.values()]
+        for future in as_completed(futures):
+            future.result()
+            if job is not None:
+                job.report(result.done_count, errors=result.error_count)
+
+    def recover_batch(self, journal, batch, rollback=False):
+        """Finish (or roll back) a batch that was interrupted by a crash
+
+        Steps still marked planned are settled by looking at the disk, last
+        step first: if only the target exists the rename happened, if only the
+        source exists it did not. In chains and cycles both often exist; the
+        step happened exactly when a later completed step moved another file
+        onto its source. Resuming then runs the steps that did not happen, in
+        order; rolling back undoes every completed step. Returns
+        (success_count, error_count, errors).
+        """
+        success_count = 0
+        error_count = 0
+        errors = []
+
+        refilled = set()   # Paths a completed later step moved a file onto
+        for seq, src, dst, status in journal.iter_steps(batch, reverse=True):
+            if status == DONE:
+                refilled.add(dst)
+            if status != PLANNED:
+                continue
+            src_exists = src.exists()
+            dst_exists = dst.exists()
+            if src_exists and dst_exists and half_moved(src, dst):
+                # A move stopped between linking the target and unlinking the source
+                src.unlink()
+                src_exists = False
+            if dst_exists and (not src_exists or src in refilled):
+                journal.mark(batch, seq, DONE)
+                refilled.add(dst)
+            elif not src_exists:
+                journal.mark(batch, seq, FAILED)
+                error_count += 1
+                errors.append(f"{src.name}: cannot tell whether it was renamed to {dst.name}")
+        journal.flush()
+
+        # What is still planned never happened
+        for seq, src, dst, status in journal.iter_steps(batch, [PLANNED]):
+            if rollback:
+                journal.mark(batch, seq, FAILED)
+                continue
             try:
-                safe_name = self.get_safe_filename(old_path.parent, new_name)
-                new_path = old_path.parent / safe_name
-                old_path.rename(new_path)
-                rename_history.append((old_path, new_path))
-                selected_files[i] = new_path
+                if dst.exists():
+                    raise FileExistsError(f"'{dst.name}' already exists")
+                move_file(src, dst)
+                journal.mark(batch, seq, DONE)
                 success_count += 1
             except Exception as e:
+                journal.mark(batch, seq, FAILED)
                 error_count += 1
-                errors.append(f"{old_path.name}: {str(e)}")
+                errors.append(f"{src.name}: {str(e)}")
 
-        return success_count, error_count, errors, rename_history
\ No newline at end of file
+        if rollback:
+            result = self.replay_batch(journal, batch, undo=True)
+            success_count = result.success_count
+            error_count += result.error_count
+            errors.extend(result.errors)
+        journal.finish_batch(batch)
+        return success_count, error_count, errors
@@ -0,0 +1,443 @@
+import datetime
+import re
+import string
+
+from metadata import shared_cache
+
+
+class SequenceStep:
+    """Replace the name with base_name followed by a padded sequence number"""
+
+    def __init__(self, base_name, start_number, number_padding):
+        self.base_name = base_name
+        try:
+            self.start = int(start_number)
+            self.spec = f"0{int(number_padding)}d"
+            format(self.start, self.spec)
+        except ValueError:
+            # Same fallback as before: plain numbering from 1
+            self.start = 1
+            self.spec = "d"
+
+    def __call__(self, name, index, file_path):
+        return self.base_name + format(self.start + index, self.spec)
+
+
+class PrefixStep:
+    def __init__(self, text):
+        self.text = text
+
+    def __call__(self, name, index, file_path):
+        return self.text + name
+
+    def apply_many(self, names):
+        text = self.text
+        return [text + name for name in names]
+
+
+class SuffixStep:
+    def __init__(self, text):
+        self.text = text
+
+    def __call__(self, name, index, file_path):
+        return name + self.text
+
+    def apply_many(self, names):
+        text = self.text
+        return [name + text for name in names]
+
+
+def _required_literal(pattern):
+    """Longest run of plain characters every match of pattern must contain
+
+    Only looks outside groups and character classes, and gives up ("") on
+    alternation or inline flags, so the answer is never wrong, just sometimes
+    shorter than it could be.
+    """
+    if "|" in pattern or "(?" in pattern:
+        return ""
+    best = ""
+    run = ""
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        literal = None
+        if char == "\\":
+            escaped = pattern[i:i + 1]
+            i += 1
+            if escaped in ("x", "u", "U", "N") or escaped.isdigit():
+                # Hex, Unicode, octal escapes and backreferences take the characters
+                # after them too; not worth parsing, so no prefilter
+                return ""
+            if escaped and not escaped.isalnum():
+                literal = escaped
+        elif char == "[":
+            # Skip the class; a leading ] or ^] belongs to it
+            if pattern[i:i + 1] == "^":
+                i += 1
+            if pattern[i:i + 1] == "]":
+                i += 1
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+            i += 1
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char in "?*{":
+            # The previous character is optional
+            run = run[:-1]
+            if char == "{":
+                end = pattern.find("}", i)
+                i = len(pattern) if end < 0 else end + 1
+        elif char not in ".^$+":
+            literal = char
+
+        if literal is not None and depth == 0:
+            run += literal
+            continue
+        # Anything else ends the run (a character before + is still required)
+        if len(run) > len(best):
+            best = run
+        run = ""
+    return max(best, run, key=len)
+
+
+_DIGITS = "0123456789"
+_OCTDIGITS = "01234567"
+_ESCAPES = {"a": "\a", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v", "\\": "\\"}
+
+
+def _compile_replacement(pattern, template):
+    """Turn a re.sub replacement template into a plain string or a callable
+
+    Accepts the same syntax as re.sub (\\1, \\g<name>, escapes). re would
+    parse the template again on every call, which costs more than the
+    substitution itself, so it is parsed once here. The template must
+    already have been validated against the pattern.
+    """
+    if "\\" not in template:
+        return template
+    parts = []
+    literal = []
+    i = 0
+    while i < len(template):
+        char = template[i]
+        i += 1
+        if char != "\\":
+            literal.append(char)
+            continue
+        char = template[i]
+        i += 1
+        group = None
+        if char == "g":
+            end = template.index(">", i)
+            name = template[i + 1:end]
+            i = end + 1
+            group = int(name) if name.isdigit() else pattern.groupindex[name]
+        elif char == "0":
+            number = "0"
+            while len(number) < 3 and template[i:i + 1] and template[i] in _OCTDIGITS:
+                number += template[i]
+                i += 1
+            literal.append(chr(int(number, 8) & 0xff))
+        elif char in _DIGITS:
+            number = char
+            if template[i:i + 1] and template[i] in _DIGITS:
+                number += template[i]
+                i += 1
+                if (char in _OCTDIGITS and number[1] in _OCTDIGITS
+                        and template[i:i + 1] and template[i] in _OCTDIGITS):
+                    literal.append(chr(int(number + template[i], 8)))
+                    i += 1
+                    continue
+            group = int(number)
+        else:
+            literal.append(_ESCAPES.get(char, "\\" + char))
+
+        if group is not None:
+            if literal:
+                parts.append("".join(literal))
+                literal = []
+            parts.append(group)
+    if literal:
+        parts.append("".join(literal))
+
+    if not any(isinstance(part, int) for part in parts):
+        text = "".join(parts)
+        return lambda match: text
+    if len(parts) == 1:
+        group = parts[0]
+        return lambda match: match.group(group) or ""
+
+    def expand(match):
+        get = match.group
+        return "".join([part if isinstance(part, str) else get(part) or "" for part in parts])
+    return expand
+
+
+class ReplaceStep:
+    """Search and replace in the name, as plain text or as a regular expression
+
+    The pattern is compiled once per plan. Names that cannot contain a
+    match are skipped with a substring test before the regex engine runs,
+    and plain case-sensitive text skips the regex engine altogether.
+    Regex replacements may refer to groups as \\1 or \\g<name>.
+    """
+
+    def __init__(self, find, replace="", use_regex=False, ignore_case=False):
+        if not find:
+            raise ValueError("Nothing to search for")
+        self.find = find
+        self.replace = replace
+        self.use_regex = use_regex
+        self.ignore_case = ignore_case
+        self.plain = not use_regex and not ignore_case
+
+        self.literal = _required_literal(find) if use_regex else find
+        if ignore_case and not self.literal.isascii():
+            self.literal = ""
+        self.folded = self.literal.casefold()
+
+        self.pattern = None
+        self.template = replace
+        if self.plain:
+            return
+        try:
+            self.pattern = re.compile(find if use_regex else re.escape(find),
+                                      re.IGNORECASE if ignore_case else 0)
+            if use_regex:
+                self.pattern.sub(replace, "")  # Reject bad group references now, not per file
+        except re.error as e:
+            raise ValueError(f"Invalid pattern: {e}") from None
+        if use_regex:
+            self.template = _compile_replacement(self.pattern, replace)
+        elif "\\" in replace:
+            # Backslashes are plain text when not using regex
+            self.template = lambda match: replace
+
+    def _may_match(self, name):
+        if not self.literal:
+            return True
+        if self.ignore_case:
+            # re also matches i to dotless i and to dotted capital I, which
+            # casefold keeps apart (the latter folds to i + combining dot)
+            return self.folded in name.casefold().replace("\u0131", "i").replace("\u0307", "")
+        return self.literal in name
+
+    def __call__(self, name, index, file_path):
+        if self.plain:
+            return name.replace(self.find, self.replace)
+        if not self._may_match(name):
+            return name
+        return self.pattern.sub(self.template, name)
+
+    def apply_many(self, names):
+        """Replace in a whole list of names in one pass"""
+        if self.plain:
+            find = self.find
+            replace = self.replace
+            return [name.replace(find, replace) for name in names]
+        may_match = self._may_match
+        sub = self.pattern.sub
+        template = self.template
+        return [sub(template, name) if may_match(name) else name for name in names]
+
+    def match_counts(self, names):
+        """Number of matches in each name"""
+        if self.plain:
+            find = self.find
+            return [name.count(find) for name in names]
+        may_match = self._may_match
+        findall = self.pattern.findall
+        return [len(findall(name)) if may_match(name) else 0 for name in names]
+
+
+class TemplateStep:
+    """Build the name from a token template such as "{date:%Y%m%d}_{seq:04}"
+
+    Tokens: {name} (the name so far), {seq} (start_number + index),
+    {date} (EXIF date taken, else modification time), {mtime}, {ctime},
+    {size} and {hash} ({hash:8} keeps the first 8 hex digits). Only the
+    metadata the template uses is read, through a MetadataCache.
+    """
+
+    # Token -> metadata fields it needs, in the order they are tried
+    TOKENS = {
+        "name": (),
+        "seq": (),
+        "date": ("exif_date", "mtime"),
+        "mtime": ("mtime",),
+        "ctime": ("ctime",),
+        "size": ("size",),
+        "hash": ("hash",),
+    }
+    DATE_FORMAT = "%Y%m%d"
+
+    def __init__(self, template, start_number="1", metadata=None):
+        self.template = template
+        try:
+            self.start = int(start_number)
+        except ValueError:
+            self.start = 1
+        self.metadata = metadata or shared_cache()
+
+        self.parts = []
+        fields = []
+        for literal, token, spec, _ in string.Formatter().parse(template):
+            if literal:
+                self.parts.append((literal, None, None))
+            if token is None:
+                continue
+            if token not in self.TOKENS:
+                raise ValueError(f"Unknown token {{{token}}} in template")
+            self._check_spec(token, spec or "")
+            self.parts.append((None, token, spec or ""))
+            fields.extend(field for field in self.TOKENS[token] if field not in fields)
+        self.fields = tuple(fields)
+
+    def _check_spec(self, token, spec):
+        """Format a sample value with spec, so a bad spec fails here and not halfway through a rename"""
+        try:
+            if token == "name":
+                format("", spec)
+            elif token in ("seq", "size"):
+                format(self.start, spec)
+            elif token == "hash":
+                if spec and not spec.isdigit():
+                    raise ValueError("expected a number of digits")
+            else:
+                datetime.datetime(2000, 1, 1).strftime(spec or self.DATE_FORMAT)
+        except ValueError as e:
+            raise ValueError(f"Invalid format '{spec}' for {{{token}}}: {e}") from None
+
+    def _render(self, token, spec, name, index, values):
+        if token == "name":
+            return format(name, spec)
+        if token == "seq":
+            return format(self.start + index, spec)
+        if token == "hash":
+            value = values["hash"] or ""
+            return value[:int(spec)] if spec.isdigit() else value
+        if token == "size":
+            return format(values["size"] or 0, spec)
+
+        if token == "date":
+            value = values["exif_date"] or values["mtime"]
+        else:
+            value = values[token]
+        return value.strftime(spec or self.DATE_FORMAT) if value else ""
+
+    def __call__(self, name, index, file_path):
+        values = self.metadata.get(file_path, self.fields) if self.fields else None
+        out = []
+        for literal, token, spec in self.parts:
+            if token is None:
+                out.append(literal)
+            else:
+                out.append(self._render(token, spec, name, index, values))
+        return "".join(out)
+
+
+class RenamePlan:
+    """Rename options validated and compiled once into a pipeline of steps
+
+    Each step is a callable taking (name, index, file_path) and returning the
+    new name without its extension. Steps run in order and the original
+    extension is added back at the end. Steps that only look at the name may
+    also offer apply_many(names), which apply() uses to run them over the
+    whole list at once.
+    """
+
+    def __init__(self, steps=None):
+        self.steps = list(steps or [])
+
+    @classmethod
+    def from_options(cls, use_sequential=False, base_name="file", start_number="1",
+                     number_padding="2", use_prefix=False, prefix_text="",
+                     use_suffix=False, suffix_text="", use_template=False,
+                     template_text="", metadata=None, use_replace=False, find_text="",
+                     replace_text="", use_regex=False, ignore_case=False):
+        plan = cls()
+        # Replace runs first so it always sees the original name
+        if use_replace and find_text:
+            plan.add_step(ReplaceStep(find_text, replace_text, use_regex, ignore_case))
+        if use_sequential:
+            plan.add_step(SequenceStep(base_name, start_number, number_padding))
+        if use_template and template_text:
+            plan.add_step(TemplateStep(template_text, start_number, metadata))
+        if use_prefix and prefix_text:
+            plan.add_step(PrefixStep(prefix_text))
+        if use_suffix and suffix_text:
+            plan.add_step(SuffixStep(suffix_text))
+        return plan
+
+    def add_step(self, step):
+        self.steps.append(step)
+        return self
+
+    @property
+    def fields(self):
+        """Metadata fields the steps read, empty when names need no file access"""
+        fields = []
+        for step in self.steps:
+            fields.extend(field for field in getattr(step, "fields", ()) if field not in fields)
+        return tuple(fields)
+
+    @property
+    def metadata(self):
+        for step in self.steps:
+            if getattr(step, "fields", None):
+                return step.metadata
+        return None
+
+    def match_counts(self, file_paths):
+        """Matches of the plan's search pattern in each original name, or None without one"""
+        for step in self.steps[:1]:
+            if isinstance(step, ReplaceStep):
+                return step.match_counts([file_path.stem for file_path in file_paths])
+        return None
+
+    def name_for(self, file_path, index):
+        name = file_path.stem
+        for step in self.steps:
+            name = step(name, index, file_path)
+        return name + file_path.suffix
+
+    def apply(self, file_paths, start_index=0):
+        """Return the new names for file_paths, numbered from start_index"""
+        steps = self.steps
+        if not steps:
+            return [file_path.name for file_path in file_paths]
+
+        metadata = self.metadata
+        if metadata is not None:
+            return self._apply_prefetched(file_paths, start_index, metadata)
+
+        file_paths = list(file_paths)
+        names = [file_path.stem for file_path in file_paths]
+        for step in steps:
+            apply_many = getattr(step, "apply_many", None)
+            if apply_many is not None:
+                names = apply_many(names)
+            else:
+                names = [step(name, index, file_path) for index, (name, file_path)
+                         in enumerate(zip(names, file_paths), start_index)]
+        return [name + file_path.suffix for name, file_path in zip(names, file_paths)]
+
+    def _apply_prefetched(self, file_paths, start_index, metadata):
+        # Read each chunk's metadata in parallel on the worker pool, then name it;
+        # chunks stay well under the cache size so nothing is evicted before use
+        fields = self.fields
+        chunk_size = max(1, min(1024, metadata.max_entries // 2))
+        file_paths = list(file_paths)
+        names = []
+        for start in range(0, len(file_paths), chunk_size):
+            chunk = file_paths[start:start + chunk_size]
+            for future in metadata.prefetch(chunk, fields):
+                future.result()
+            for offset, file_path in enumerate(chunk):
+                names.append(self.name_for(file_path, start_index + start + offset))
+        return names
@@ -0,0 +1,367 @@
+import os
+import sys
+from array import array
+from pathlib import Path
+
+_EMPTY = 0xFFFFFFFF
+_DELETED = 0xFFFFFFFE
+
+
+def path_key(path):
+    """Normalized identity of a path: symlinks resolved, and case-folded where the OS ignores case"""
+    key = os.path.normcase(os.path.realpath(path))
+    if sys.platform == "darwin":
+        key = key.casefold()
+    return key
+
+
+def _name_key(name):
+    key = os.path.normcase(name)
+    if sys.platform == "darwin":
+        key = key.casefold()
+    return key
+
+
+class NameTable:
+    """Append-only list of strings packed into one buffer
+
+    Costs the string's UTF-8 bytes plus 8 bytes of offset per entry, instead
+    of a full str object each. Undecodable file name characters (lone
+    surrogates) round-trip through surrogatepass.
+    """
+
+    def __init__(self, strings=()):
+        self._data = bytearray()
+        self._ends = array("Q")
+        self.extend(strings)
+
+    def __len__(self):
+        return len(self._ends)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self._ends)
+        start = self._ends[i - 1] if i else 0
+        return self._data[start:self._ends[i]].decode("utf-8", "surrogatepass")
+
+    def append(self, text):
+        """Add text and return its position"""
+        self._data += text.encode("utf-8", "surrogatepass")
+        self._ends.append(len(self._data))
+        return len(self._ends) - 1
+
+    def extend(self, strings):
+        for text in strings:
+            self.append(text)
+
+
+class _Names:
+    """Interned folders and the file names in them; ids stay valid for the object's life"""
+
+    def __init__(self):
+        self.dirs = []            # folder id -> Path, as first seen
+        self.dir_ids = {}         # folder spelling -> folder id
+        self.dir_keys = {}        # path_key(folder) -> folder id
+        self.names = NameTable()
+        self.dir_of = array("I")  # name id -> folder id
+
+    def dir_id(self, directory):
+        dir_id = self.dir_ids.get(directory)
+        if dir_id is None:
+            # Another spelling of a known folder ("./a", "/home/me/a" or a symlink to it) shares its id
+            key = path_key(directory or ".")
+            dir_id = self.dir_keys.get(key)
+            if dir_id is None:
+                dir_id = self.dir_keys[key] = len(self.dirs)
+                self.dirs.append(Path(directory or "."))
+            self.dir_ids[directory] = dir_id
+        return dir_id
+
+    def add(self, dir_id, name):
+        self.dir_of.append(dir_id)
+        return self.names.append(name)
+
+    def path(self, name_id):
+        return self.dirs[self.dir_of[name_id]] / self.names[name_id]
+
+
+class _KeyIndex:
+    """Open-addressing hash set of name ids, kept in two flat arrays
+
+    Slots hold the key hash and the name id; a lookup compares hashes first
+    and only asks `match` to confirm a candidate, so no key strings are kept.
+    """
+
+    def __init__(self, capacity=1024):
+        self._reset(capacity)
+
+    def _reset(self, capacity):
+        self._hashes = array("q", [0]) * capacity
+        self._ids = array("I", [_EMPTY]) * capacity
+        self._mask = capacity - 1
+        self._used = 0   # live and deleted slots
+        self.count = 0
+
+    def find(self, key_hash, match):
+        ids = self._ids
+        hashes = self._hashes
+        mask = self._mask
+        i = key_hash & mask
+        while True:
+            name_id = ids[i]
+            if name_id == _EMPTY:
+                return None
+            if name_id != _DELETED and hashes[i] == key_hash and match(name_id):
+                return name_id
+            i = (i + 1) & mask
+
+    def add(self, key_hash, name_id):
+        if (self._used + 1) * 3 > len(self._ids) * 2:
+            self._resize()
+        ids = self._ids
+        mask = self._mask
+        i = key_hash & mask
+        while ids[i] != _EMPTY and ids[i] != _DELETED:
+            i = (i + 1) & mask
+        if ids[i] == _EMPTY:
+            self._used += 1
+        ids[i] = name_id
+        self._hashes[i] = key_hash
+        self.count += 1
+
+    def discard(self, key_hash, name_id):
+        ids = self._ids
+        mask = self._mask
+        i = key_hash & mask
+        while ids[i] != _EMPTY:
+            if ids[i] == name_id:
+                ids[i] = _DELETED
+                self.count -= 1
+                return
+            i = (i + 1) & mask
+
+    def _resize(self):
+        # Grow when mostly live, otherwise just sweep out the deleted slots
+        capacity = len(self._ids)
+        if self.count * 3 > capacity:
+            capacity *= 2
+        live = [(key_hash, name_id) for key_hash, name_id in zip(self._hashes, self._ids)
+                if name_id != _EMPTY and name_id != _DELETED]
+        self._reset(capacity)
+        for key_hash, name_id in live:
+            self.add(key_hash, name_id)
+
+    def clear(self):
+        self._reset(1024)
+
+
+class RemovedFiles:
+    """Files taken out by FileSelection.remove_indices, for undo
+
+    Iterates as (index, path) pairs like a list would, but only keeps two
+    integer arrays and a reference to the interned names.
+    """
+
+    def __init__(self, names, indices, name_ids):
+        self._names = names
+        self.indices = indices
+        self.name_ids = name_ids
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        path = self._names.path
+        for index, name_id in zip(self.indices, self.name_ids):
+            yield index, path(name_id)
+
+
+class FileSelection:
+    """Ordered list of selected files, stored compactly
+
+    Folders are interned once, names are packed into a NameTable and the
+    order is an array of name ids, so a file costs a few dozen bytes instead
+    of a Path object and a key string; Path objects are built when a file is
+    read. A flat hash index of (folder, normalized name) keeps membership,
+    add and dedupe O(1). Removing any number of files is one compaction
+    pass and moves are done in place; remove_indices and move return just
+    what they changed, which is all an undo entry has to keep. version goes
+    up on every change, so derived values such as a fingerprint of the list
+    can be cached; edits only goes up on changes other than appending, so
+    such a value can be extended with just the new files while it stays
+    the same.
+    """
+
+    def __init__(self, paths=()):
+        self._names = _Names()
+        self._order = array("I")
+        self._index = _KeyIndex()
+        self.version = 0
+        self.edits = 0
+        self.extend(paths)
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        path = self._names.path
+        for name_id in self._order:
+            yield path(name_id)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            path = self._names.path
+            return [path(name_id) for name_id in self._order[index]]
+        return self._names.path(self._order[index])
+
+    def __setitem__(self, index, path):
+        # Used after a rename: the file keeps its place under its new name
+        old_id = self._order[index]
+        self._index.discard(self._hash(old_id), old_id)
+        dir_id, name = self._split(path)
+        name_id = self._names.add(dir_id, name)
+        self._index.add(hash((dir_id, _name_key(name))), name_id)
+        self._order[index] = name_id
+        self.version += 1
+        self.edits += 1
+
+    def _split(self, path):
+        directory, name = os.path.split(os.fspath(path))
+        return self._names.dir_id(directory), name
+
+    def _hash(self, name_id):
+        names = self._names
+        return hash((names.dir_of[name_id], _name_key(names.names[name_id])))
+
+    def _find(self, dir_id, key):
+        names = self._names
+        return self._index.find(
+            hash((dir_id, key)),
+            lambda name_id: names.dir_of[name_id] == dir_id and _name_key(names.names[name_id]) == key)
+
+    def __contains__(self, path):
+        dir_id, name = self._split(path)
+        return self._find(dir_id, _name_key(name)) is not None
+
+    def add(self, path):
+        """Append path unless it is already selected; returns True if it was added"""
+        dir_id, name = self._split(path)
+        key = _name_key(name)
+        if self._find(dir_id, key) is not None:
+            return False
+        name_id = self._names.add(dir_id, name)
+        self._index.add(hash((dir_id, key)), name_id)
+        self._order.append(name_id)
+        self.version += 1
+        return True
+
+    def extend(self, paths):
+        """Append the paths that are not selected yet and return them"""
+        return [path for path in paths if self.add(path)]
+
+    def snapshot(self):
+        """A read-only copy of the list as it is now, for reading on another thread
+
+        Only the order array is copied; the name store is shared, since
+        names are only ever added to it and clear() starts a new one.
+        """
+        copy = FileSelection.__new__(FileSelection)
+        copy._names = self._names
+        copy._order = array("I", self._order)
+        copy._index = None
+        copy.version = self.version
+        copy.edits = self.edits
+        return copy
+
+    def clear(self):
+        # A fresh name store; RemovedFiles from before keep the old one alive
+        self._names = _Names()
+        self._order = array("I")
+        self._index.clear()
+        self.version += 1
+        self.edits += 1
+
+    def remove_indices(self, indices):
+        """Remove the files at indices; returns them as RemovedFiles, in index order"""
+        doomed = set(indices)
+        removed_at = array("I")
+        removed_ids = array("I")
+        kept = array("I")
+        for index, name_id in enumerate(self._order):
+            if index in doomed:
+                removed_at.append(index)
+                removed_ids.append(name_id)
+                self._index.discard(self._hash(name_id), name_id)
+            else:
+                kept.append(name_id)
+        self._order = kept
+        self.version += 1
+        self.edits += 1
+        return RemovedFiles(self._names, removed_at, removed_ids)
+
+    def restore(self, removed):
+        """Put back files returned by remove_indices
+
+        Files that are selected again by now are skipped, and indices past
+        the end of the list put the file at the end.
+        """
+        if not removed:
+            return
+        if isinstance(removed, RemovedFiles) and removed._names is self._names:
+            pairs = zip(removed.indices, removed.name_ids)
+        else:
+            # Removed before a clear(), or a plain list of (index, path) pairs
+            pairs = ((index, self._names.add(*self._split(path))) for index, path in removed)
+        names = self._names
+        pending = []
+        for index, name_id in pairs:
+            dir_id, key = names.dir_of[name_id], _name_key(names.names[name_id])
+            if self._find(dir_id, key) is None:
+                self._index.add(hash((dir_id, key)), name_id)
+                pending.append((index, name_id))
+        if not pending:
+            return
+
+        pending = iter(pending)
+        next_index, next_id = next(pending)
+        order = array("I")
+        for name_id in self._order:
+            while next_index is not None and len(order) >= next_index:
+                order.append(next_id)
+                next_index, next_id = next(pending, (None, None))
+            order.append(name_id)
+        while next_index is not None:
+            order.append(next_id)
+            next_index, next_id = next(pending, (None, None))
+        self._order = order
+        self.version += 1
+        self.edits += 1
+
+    def reorder(self, order, undo=False):
+        """Rearrange so that position i holds the file that was at order[i]
+
+        With undo=True the same order is taken back out. order must cover
+        every file; one computed before files were added raises ValueError.
+        """
+        current = self._order
+        if len(order) != len(current):
+            raise ValueError(f"order has {len(order)} entries for {len(current)} files")
+        if undo:
+            restored = array("I", [0]) * len(current)
+            for position, index in enumerate(order):
+                restored[index] = current[position]
+            self._order = restored
+        else:
+            self._order = array("I", [current[index] for index in order])
+        self.version += 1
+        self.edits += 1
+
+    def move(self, index, target):
+        """Move the file at index to target; adjacent moves are a plain swap"""
+        order = self._order
+        if abs(target - index) == 1:
+            order[index], order[target] = order[target], order[index]
+        else:
+            order.insert(target, order.pop(index))
+        self.version += 1
+        self.edits += 1
@@ -0,0 +1,107 @@
+import os
+import re
+
+from metadata import read_exif_date
+
+SORT_FIELDS = ("name", "path", "mtime", "ctime", "size", "date")
+
+_NUMBERS = re.compile(r"(\d+)")
+
+
+def natural_key(text):
+    """Key that orders "img2" before "img10" and ignores case"""
+    parts = _NUMBERS.split(text.casefold())
+    parts[1::2] = map(int, parts[1::2])
+    return parts
+
+
+def parse_sort_keys(text):
+    """Parse "date, -size" into [("date", False), ("size", True)]; "-" sorts descending"""
+    keys = []
+    for part in text.replace(";", ",").split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        reverse = part.startswith("-")
+        field = part.lstrip("+-").strip()
+        if field not in SORT_FIELDS:
+            raise ValueError(f"Unknown sort key '{field}', use one of: {', '.join(SORT_FIELDS)}")
+        keys.append((field, reverse))
+    if not keys:
+        raise ValueError("No sort key given")
+    return keys
+
+
+class SortKeyCache:
+    """Sort keys computed once per file and kept for later sorts
+
+    Stat fields for a file come from a single os.stat, and EXIF dates are
+    only read when sorting by date, so sorting the same selection again by
+    any combination of keys touches the disk only for files not seen yet.
+    Renamed files are new paths and get fresh keys.
+    """
+
+    def __init__(self):
+        self._names = {}
+        self._stats = {}
+        self._dates = {}
+
+    def clear(self):
+        self._names.clear()
+        self._stats.clear()
+        self._dates.clear()
+
+    def _stat(self, path):
+        values = self._stats.get(path)
+        if values is None:
+            try:
+                st = os.stat(path)
+                values = (st.st_mtime, st.st_ctime, st.st_size)
+            except OSError:
+                values = (0.0, 0.0, 0)
+            self._stats[path] = values
+        return values
+
+    def key(self, path, field):
+        if field == "name" or field == "path":
+            text = path.name if field == "name" else str(path)
+            key = self._names.get(text)
+            if key is None:
+                key = self._names[text] = natural_key(text)
+            return key
+        if field == "mtime":
+            return self._stat(path)[0]
+        if field == "ctime":
+            return self._stat(path)[1]
+        if field == "size":
+            return self._stat(path)[2]
+
+        date = self._dates.get(path, False)
+        if date is False:
+            exif_date = read_exif_date(path)
+            date = self._dates[path] = exif_date.timestamp() if exif_date else None
+        return self._stat(path)[0] if date is None else date
+
+    def sort_order(self, files, keys, job=None):
+        """Indices of files in sorted order, or None if the job was cancelled
+
+        keys is a list of (field, reverse) pairs, most significant first.
+        Ties keep their current order.
+        """
+        files = list(files)
+        order = list(range(len(files)))
+        if job is not None:
+            job.report(0, len(files) * len(keys))
+
+        # Stable sorts from the least significant key up give the multi-key order
+        for field, reverse in reversed(keys):
+            values = []
+            for start in range(0, len(files), 1000):
+                if job is not None and not job.checkpoint():
+                    return None
+                chunk = files[start:start + 1000]
+                values.extend([self.key(path, field) for path in chunk])
+                if job is not None:
+                    job.advance(len(chunk))
+            order.sort(key=values.__getitem__, reverse=reverse)
+        return order
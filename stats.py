@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+
+HISTOGRAM_BUCKETS = 32
+
+
+class LatencyHistogram:
+    """Latencies in power-of-two microsecond buckets: bucket n holds [2**(n-1), 2**n) us"""
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for bucket, count in enumerate(other.buckets):
+            self.buckets[bucket] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction):
+        """Upper bound in seconds of the bucket holding the given fraction of samples"""
+        if not self.count:
+            return 0.0
+        wanted = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= wanted:
+                return min((1 << bucket) / 1e6, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.5) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "buckets_us": {str(1 << bucket): count for bucket, count in enumerate(self.buckets) if count},
+        }
+
+
+class RenameStats:
+    """Timers, syscall counters and per-folder rename latencies for a FileRenamer
+
+    FileRenamer only records into this when one is attached, so without
+    stats the hot paths cost a single None check. Workers collect into
+    local objects and merge them once per folder, so the lock is not on the
+    per-file path. With trace=True, spans are also kept for a Chrome/Perfetto
+    trace-event dump.
+    """
+
+    def __init__(self, trace=False):
+        self._lock = threading.Lock()
+        self.trace = trace
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.perf_counter()
+            self.phases = {}        # name -> [calls, seconds]
+            self.calls = {}         # syscall name -> count
+            self.directories = {}   # folder -> LatencyHistogram of its renames
+            self.renames = 0
+            self.events = []
+            self._last_poll = (self.started, 0)
+
+    # ---------------- Recording ----------------
+
+    def add_phase(self, name, start, end, directory=None):
+        with self._lock:
+            entry = self.phases.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += end - start
+            if self.trace:
+                self._add_event(name, start, end, directory)
+
+    def count(self, call, n=1):
+        with self._lock:
+            self.calls[call] = self.calls.get(call, 0) + n
+
+    def add_directory(self, directory, histogram, calls):
+        """Merge one folder's rename latencies and syscall counts"""
+        with self._lock:
+            key = os.path.abspath(directory)
+            existing = self.directories.get(key)
+            if existing is None:
+                existing = self.directories[key] = LatencyHistogram()
+            existing.merge(histogram)
+            self.renames += histogram.count
+            for call, n in calls.items():
+                self.calls[call] = self.calls.get(call, 0) + n
+
+    def _add_event(self, name, start, end, directory):
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": round((start - self.started) * 1e6, 1),
+            "dur": round((end - start) * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if directory is not None:
+            event["args"] = {"directory": str(directory)}
+        self.events.append(event)
+
+    # ---------------- Reporting ----------------
+
+    def throughput(self):
+        """Renames per second since the previous call, for live display"""
+        now = time.perf_counter()
+        with self._lock:
+            last_time, last_renames = self._last_poll
+            self._last_poll = (now, self.renames)
+            renames = self.renames - last_renames
+        return renames / (now - last_time) if now > last_time else 0.0
+
+    def latency(self):
+        """All rename latencies merged into one histogram"""
+        total = LatencyHistogram()
+        with self._lock:
+            for histogram in self.directories.values():
+                total.merge(histogram)
+        return total
+
+    def snapshot(self):
+        with self._lock:
+            phases = {name: {"calls": calls, "seconds": round(seconds, 6)}
+                      for name, (calls, seconds) in self.phases.items()}
+            calls = dict(self.calls)
+            directories = {key: histogram.to_dict() for key, histogram in self.directories.items()}
+            renames = self.renames
+        return {
+            "elapsed": round(time.perf_counter() - self.started, 6),
+            "renames": renames,
+            "phases": phases,
+            "syscalls": calls,
+            "rename_latency": self.latency().to_dict(),
+            "directories": directories,
+        }
+
+    # json is only needed for dumps, so it is imported there and not at startup
+    def dump_json(self, path):
+        import json
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def dump_trace(self, path):
+        """Write recorded spans in Chrome trace-event format (chrome://tracing, Perfetto)"""
+        import json
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,229 @@
+"""Undo and redo of list changes (remove, move, sort) after the list changed some other way
+
+Run with: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gui  # noqa: E402
+from selection import FileSelection  # noqa: E402
+from sorting import SortKeyCache  # noqa: E402
+
+FILES = [Path("/photos") / name for name in ("a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg")]
+
+
+def run_now(job, done):
+    job.result = job.work(job)
+    done(job)
+
+
+def make_app(files=FILES):
+    """The window's list handling without a Tk root: widgets are mocks"""
+    app = gui.BatchRenamer.__new__(gui.BatchRenamer)
+    app.selected_files = FileSelection(files)
+    app.undo_stack = []
+    app.redo_stack = []
+    app.busy = False
+    app.file_list = mock.Mock()
+    app.file_list.selection.return_value = []
+    app.status_var = mock.Mock()
+    app.refresh_preview = mock.Mock()
+    app.sort_text = mock.Mock()
+    app.sort_text.get.return_value = "-name"
+    app.sort_keys = SortKeyCache()
+    app.run_job = run_now
+    app.root = mock.Mock()
+    app.cancel_button = mock.Mock()
+    app.ingestors = []
+    app._ingest_job = None
+    app.cancel_ingest = mock.Mock()
+    return app
+
+
+def select(app, *indices):
+    app.file_list.selection.return_value = list(indices)
+
+
+class ListUndoTest(unittest.TestCase):
+
+    def names(self, app):
+        return [path.name for path in app.selected_files]
+
+    def assert_refused(self, app, action):
+        before = self.names(app)
+        action()
+        self.assertEqual(self.names(app), before)
+        self.assertEqual(app.undo_stack, [])
+        self.assertIn("can no longer", app.status_var.set.call_args[0][0])
+
+    def test_remove_undo_redo(self):
+        app = make_app()
+        select(app, 1, 3)
+        app.remove_selected()
+        self.assertEqual(self.names(app), ["a.jpg", "c.jpg", "e.jpg"])
+        app.undo_rename()
+        self.assertEqual(self.names(app), [path.name for path in FILES])
+        app.redo_rename()
+        self.assertEqual(self.names(app), ["a.jpg", "c.jpg", "e.jpg"])
+        app.undo_rename()
+        self.assertEqual(self.names(app), [path.name for path in FILES])
+
+    def test_move_several_undo(self):
+        app = make_app()
+        select(app, 0, 1)
+        app.move_item_up()
+        self.assertEqual(self.names(app), ["b.jpg", "c.jpg", "d.jpg", "e.jpg", "a.jpg"])
+        app.undo_rename()
+        self.assertEqual(self.names(app), [path.name for path in FILES])
+
+    def test_sort_undo_redo(self):
+        app = make_app()
+        app.sort_files()
+        app.undo_rename()
+        self.assertEqual(self.names(app), [path.name for path in FILES])
+        app.redo_rename()
+        self.assertEqual(self.names(app), ["e.jpg", "d.jpg", "c.jpg", "b.jpg", "a.jpg"])
+
+    def test_list_changed_while_sorting(self):
+        app = make_app()
+
+        def add_then_finish(job, done):
+            job.result = job.work(job)
+            app.selected_files.add(Path("/photos/f.jpg"))
+            done(job)
+
+        app.run_job = add_then_finish
+        app.sort_files()
+        self.assertEqual(self.names(app), [path.name for path in FILES] + ["f.jpg"])
+        self.assertEqual(app.undo_stack, [])
+
+    def test_sort_undo_after_add(self):
+        app = make_app()
+        app.sort_files()
+        self.assertEqual(self.names(app), ["e.jpg", "d.jpg", "c.jpg", "b.jpg", "a.jpg"])
+        app.selected_files.add(Path("/photos/f.jpg"))
+        self.assert_refused(app, app.undo_rename)
+
+    def test_move_one_undo_redo(self):
+        app = make_app()
+        select(app, 0)
+        app.move_item_up()
+        self.assertEqual(self.names(app), ["b.jpg", "c.jpg", "d.jpg", "e.jpg", "a.jpg"])
+        app.undo_rename()
+        self.assertEqual(self.names(app), [path.name for path in FILES])
+        app.redo_rename()
+        self.assertEqual(self.names(app), ["b.jpg", "c.jpg", "d.jpg", "e.jpg", "a.jpg"])
+
+    def test_move_several_undo_after_add(self):
+        app = make_app()
+        select(app, 2, 3)
+        app.move_item_down()
+        app.selected_files.add(Path("/photos/f.jpg"))
+        self.assert_refused(app, app.undo_rename)
+
+    def test_move_undo_after_clear(self):
+        app = make_app()
+        select(app, 2)
+        app.move_item_up()
+        app.selected_files.clear()
+        self.assert_refused(app, app.undo_rename)
+
+    def test_remove_undo_after_clear(self):
+        app = make_app()
+        select(app, 0, 4)
+        app.remove_selected()
+        app.selected_files.clear()
+        self.assert_refused(app, app.undo_rename)
+
+    def test_remove_undo_after_clear_and_add_again(self):
+        app = make_app()
+        select(app, 1)
+        app.remove_selected()
+        app.selected_files.clear()
+        app.selected_files.extend(FILES)
+        self.assert_refused(app, app.undo_rename)
+        self.assertEqual(len(app.selected_files), len(FILES))
+
+    def test_redo_after_add(self):
+        app = make_app()
+        select(app, 1)
+        app.remove_selected()
+        app.undo_rename()
+        app.selected_files.add(Path("/photos/f.jpg"))
+        self.assert_refused(app, app.redo_rename)
+        self.assertEqual(app.redo_stack, [])
+
+    def test_clear_files_drops_list_changes(self):
+        app = make_app()
+        rename = {'action': 'history', 'steps': [], 'pending': None}
+        select(app, 1)
+        app.remove_selected()
+        app.undo_stack.append(rename)
+        app.clear_files()
+        self.assertEqual(app.undo_stack, [rename])
+
+    def test_ingest_drops_list_changes(self):
+        app = make_app()
+        select(app, 1)
+        app.remove_selected()
+        app.undo_rename()
+        ingestor = mock.Mock()
+        ingestor.batches.get_nowait.side_effect = [[Path("/photos/f.jpg")], None]
+        app.ingestors = [ingestor]
+        app._ingest_added = 0
+        app._ingest_cancelled = False
+        app.file_list.set_count = mock.Mock()
+        app._poll_ingest()
+        self.assertEqual(app.undo_stack, [])
+        self.assertEqual(app.redo_stack, [])
+        self.assertEqual(len(app.selected_files), len(FILES) + 1)
+
+    def test_remove_then_rename(self):
+        app = make_app()
+        select(app, 0)
+        app.remove_selected()
+        app.selected_files[0] = Path("/photos/renamed.jpg")
+        self.assert_refused(app, app.undo_rename)
+
+    def test_remove_then_undo_rename(self):
+        # Undoing a rename clears the list, so the remove below it is gone too
+        app = make_app()
+        select(app, 0)
+        app.remove_selected()
+        app.selected_files[0] = Path("/photos/renamed.jpg")
+        app.clear_files()
+        self.assertEqual(app.undo_stack, [])
+
+
+class RestoreTest(unittest.TestCase):
+
+    def test_restore_skips_files_selected_again(self):
+        files = FileSelection(FILES)
+        removed = files.remove_indices([1, 3])
+        files.add(FILES[1])
+        files.restore(removed)
+        self.assertEqual(len(files), len(FILES))
+        self.assertEqual(sorted(files), sorted(FILES))
+
+    def test_restore_past_the_end(self):
+        files = FileSelection(FILES)
+        removed = files.remove_indices([3, 4])
+        files.remove_indices([0, 1, 2])
+        files.restore(removed)
+        self.assertEqual(list(files), FILES[3:])
+
+    def test_restore_after_clear(self):
+        files = FileSelection(FILES)
+        removed = files.remove_indices([0, 2])
+        files.clear()
+        files.restore(removed)
+        self.assertEqual(list(files), [FILES[0], FILES[2]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Applying manifests in chunks, with checkpoints
+
+Run with: python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from manifest import (CHECKPOINT_SUFFIX, apply_manifest, load_checkpoint, read_manifest,  # noqa: E402
+                      write_manifest)
+from renamer import FileRenamer  # noqa: E402
+
+
+class ApplyManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._temp.name) / "photos"
+        self.folder.mkdir()
+        self.files = []
+        for n in range(25):
+            path = self.folder / f"IMG_{n:04d}.jpg"
+            path.write_text(str(n))
+            self.files.append(path)
+        self.manifest = os.path.join(self._temp.name, "plan.csv")
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def write(self, rows):
+        write_manifest(self.manifest, rows)
+
+    def names(self):
+        return sorted(path.name for path in self.folder.iterdir())
+
+    def test_round_trip(self):
+        rows = [(path, f"new_{n}.jpg") for n, path in enumerate(self.files)]
+        self.write(rows)
+        self.assertEqual([(old_path, new_name) for _, old_path, new_name in read_manifest(self.manifest)],
+                         rows)
+
+    def test_resume_from_checkpoint(self):
+        self.write((path, f"new_{n:02d}.jpg") for n, path in enumerate(self.files))
+        run = apply_manifest(FileRenamer(), self.manifest, apply=True, chunk_rows=10)
+        next(run)
+        run.close()  # Stopped after the first chunk
+        self.assertEqual(load_checkpoint(self.manifest), 10)
+
+        chunks = list(apply_manifest(FileRenamer(), self.manifest, apply=True, chunk_rows=10))
+        self.assertEqual([len(chunk.files) for chunk in chunks], [10, 5])
+        self.assertEqual(sum(chunk.skipped for chunk in chunks), 0)
+        self.assertEqual(self.names(), [f"new_{n:02d}.jpg" for n in range(25)])
+        self.assertFalse(os.path.exists(self.manifest + CHECKPOINT_SUFFIX))
+
+    def test_checkpoint_of_another_manifest_is_ignored(self):
+        self.write((path, f"new_{n:02d}.jpg") for n, path in enumerate(self.files))
+        run = apply_manifest(FileRenamer(), self.manifest, apply=True, chunk_rows=10)
+        next(run)
+        run.close()
+        self.write([(self.files[20], "other.jpg")])
+        self.assertEqual(load_checkpoint(self.manifest), 0)
+
+    def test_repeated_rows_across_chunks(self):
+        rows = [(path, f"new_{n:02d}.jpg") for n, path in enumerate(self.files[:12])]
+        rows.append((self.files[2], "again.jpg"))
+        self.write(rows)
+        chunks = list(apply_manifest(FileRenamer(), self.manifest, apply=True, chunk_rows=5,
+                                     target_dir=self.folder.parent))
+        repeated = [line for chunk in chunks for line, _ in chunk.repeated]
+        self.assertEqual(repeated, [14])
+        self.assertFalse((self.folder.parent / "again.jpg").exists())
+
+    def test_folders_listed_once(self):
+        self.write((path, f"new_{n:02d}.jpg") for n, path in enumerate(self.files))
+        scandir = os.scandir
+        listed = []
+
+        def counting_scandir(path="."):
+            listed.append(os.fspath(path))
+            return scandir(path)
+
+        with mock.patch("os.scandir", counting_scandir):
+            chunks = list(apply_manifest(FileRenamer(), self.manifest, apply=True, chunk_rows=5))
+        self.assertEqual(sum(chunk.result[0] for chunk in chunks), 25)
+        self.assertEqual(listed, [os.fspath(self.folder)])
+
+
+if __name__ == "__main__":
+    unittest.main()
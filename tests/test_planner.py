@@ -0,0 +1,128 @@
+"""Rename planning inside one folder: chains, swaps and rotations
+
+Run with: python -m unittest discover tests
+"""
+import os
+import random
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dirindex import DirectoryIndex  # noqa: E402
+from planner import TEMP_SUFFIX, plan_directory  # noqa: E402
+from renamer import FileRenamer  # noqa: E402
+
+
+class PlanDirectoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._temp.name)
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def plan(self, renames, others=()):
+        """Plan renames {old: new} with the other files also in the folder
+
+        Runs the steps on a simulated folder, checking each one moves an
+        existing file onto a free name, and returns (steps, folder after).
+        """
+        for name in list(renames) + list(others):
+            (self.folder / name).write_text(name)
+        items = [(i, self.folder / old, new) for i, (old, new) in enumerate(renames.items())]
+        units = plan_directory(self.folder, items, DirectoryIndex(case_insensitive=False))
+
+        disk = {name: name for name in list(renames) + list(others)}
+        steps = [step for unit in units for step in unit]
+        for step in steps:
+            self.assertEqual(step.src.parent, self.folder)
+            self.assertIn(step.src.name, disk, f"{step.src.name} is not there to rename")
+            self.assertNotIn(step.dst.name, disk, f"{step.dst.name} would be overwritten")
+            disk[step.dst.name] = disk.pop(step.src.name)
+        return steps, disk
+
+    def temp_steps(self, steps):
+        return [step for step in steps if not step.final]
+
+    def test_shift_is_a_chain(self):
+        renames = {f"file{n:02d}.txt": f"file{n + 1:02d}.txt" for n in range(1, 6)}
+        steps, disk = self.plan(renames)
+        self.assertEqual(len(steps), 5)
+        self.assertEqual(self.temp_steps(steps), [])
+        self.assertEqual(disk, {new: old for old, new in renames.items()})
+
+    def test_swap_goes_through_one_temporary_name(self):
+        steps, disk = self.plan({"a.txt": "b.txt", "b.txt": "a.txt"})
+        self.assertEqual(len(steps), 3)
+        self.assertEqual(len(self.temp_steps(steps)), 1)
+        self.assertTrue(self.temp_steps(steps)[0].dst.name.endswith(TEMP_SUFFIX))
+        self.assertEqual(disk, {"a.txt": "b.txt", "b.txt": "a.txt"})
+
+    def test_rotation(self):
+        renames = {"a": "b", "b": "c", "c": "d", "d": "a"}
+        steps, disk = self.plan(renames)
+        self.assertEqual(len(steps), 5)
+        self.assertEqual(disk, {new: old for old, new in renames.items()})
+
+    def test_chain_feeding_a_cycle_and_a_separate_cycle(self):
+        renames = {"x": "y", "y": "x", "p": "q", "q": "r", "r": "p", "m": "n"}
+        steps, disk = self.plan(renames)
+        self.assertEqual(len(self.temp_steps(steps)), 2)
+        self.assertEqual(disk, {new: old for old, new in renames.items()})
+
+    def test_temporary_name_already_taken(self):
+        taken = "a.txt" + TEMP_SUFFIX
+        steps, disk = self.plan({"a.txt": "b.txt", "b.txt": "a.txt"}, others=[taken])
+        self.assertNotEqual(self.temp_steps(steps)[0].dst.name, taken)
+        self.assertEqual(disk[taken], taken)
+        self.assertEqual(disk["a.txt"], "b.txt")
+
+    def test_target_taken_by_file_outside_the_batch(self):
+        steps, disk = self.plan({"a.txt": "keep.txt"}, others=["keep.txt"])
+        self.assertEqual(disk, {"keep.txt": "keep.txt", "keep_1.txt": "a.txt"})
+
+    def test_random_permutations(self):
+        rng = random.Random(7)
+        for n in (2, 3, 10, 50):
+            names = [f"f{k}" for k in range(n)]
+            for _ in range(20):
+                targets = names[:]
+                rng.shuffle(targets)
+                renames = {old: new for old, new in zip(names, targets) if old != new}
+                with self.subTest(n=n, renames=renames):
+                    for path in self.folder.iterdir():
+                        path.unlink()
+                    steps, disk = self.plan(renames)
+                    self.assertLessEqual(len(steps), len(renames) + len(renames) // 2)
+                    self.assertEqual(disk, {new: old for old, new in renames.items()})
+
+
+class RenameCyclesTest(unittest.TestCase):
+    """rename_files runs the planned cycles on disk and its history undoes them"""
+
+    def test_rotation_and_undo(self):
+        with tempfile.TemporaryDirectory() as temp:
+            folder = Path(temp)
+            names = ["a.txt", "b.txt", "c.txt", "d.txt"]
+            for name in names:
+                (folder / name).write_text(name)
+            files = [folder / name for name in names]
+            new_names = names[1:] + names[:1]
+
+            success_count, error_count, errors, history = FileRenamer().rename_files(files, new_names)
+            self.assertEqual((success_count, error_count), (4, 0), errors)
+            self.assertEqual({path.name: path.read_text() for path in folder.iterdir()},
+                             dict(zip(new_names, names)))
+
+            for old_path, new_path in reversed(history):
+                new_path.rename(old_path)
+            self.assertEqual({path.name: path.read_text() for path in folder.iterdir()},
+                             {name: name for name in names})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Preflight checks agree with what rename_files actually does
+
+Run with: python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preflight import CONFLICT, MISSING, check_plan  # noqa: E402
+from renamer import FileRenamer  # noqa: E402
+
+
+class CheckPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._temp.name)
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def make(self, *names, folder=None):
+        folder = folder or self.folder
+        folder.mkdir(exist_ok=True)
+        for name in names:
+            (folder / name).write_text(name)
+        return [folder / name for name in names]
+
+    def test_shift_needs_no_suffix(self):
+        files = self.make("a1.txt", "a2.txt", "a3.txt")
+        report = check_plan(files, ["a2.txt", "a3.txt", "a4.txt"])
+        self.assertEqual(report.issues, [])
+        self.assertEqual(report.names, ["a2.txt", "a3.txt", "a4.txt"])
+
+    def test_clash_with_existing_file(self):
+        files = self.make("a.txt", "b.txt")
+        report = check_plan(files[:1], ["b.txt"])
+        self.assertEqual([issue.kind for issue in report.issues], [CONFLICT])
+        self.assertEqual(report.names, ["b_1.txt"])
+
+    def test_missing_file(self):
+        report = check_plan([self.folder / "gone.txt"], ["new.txt"])
+        self.assertEqual([issue.kind for issue in report.issues], [MISSING])
+        self.assertEqual(report.files, [])
+
+    def test_move_into_folder_renaming_its_own_files(self):
+        # The target's own file gives up b.txt before the moved file claims it
+        moved = self.make("a.txt", folder=self.folder / "src")
+        target = self.folder / "out"
+        own = self.make("b.txt", folder=target)
+        files = moved + own
+        names = ["b.txt", "c.txt"]
+        report = check_plan(files, names, target_dir=target)
+        self.assertEqual(report.issues, [])
+        self.assertEqual(report.names, names)
+
+        FileRenamer().rename_files(list(report.files), report.names, target_dir=target)
+        self.assertEqual({path.name: path.read_text() for path in target.iterdir()},
+                         {"b.txt": "a.txt", "c.txt": "b.txt"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+"""Crash recovery of journaled batches
+
+Run with: python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import RenameJournal  # noqa: E402
+from renamer import FileRenamer  # noqa: E402
+
+
+class Crash(BaseException):
+    pass
+
+
+class RecoverShiftTest(unittest.TestCase):
+    """A renumbering shift (file01..05 -> file02..06) interrupted after some of its renames
+
+    The journal only writes done marks every 1000 steps, so after the crash
+    every step of the shift is still marked planned.
+    """
+
+    def crash_after(self, folder, renames):
+        for n in range(1, 6):
+            (folder / f"file{n:02d}.txt").write_text(str(n))
+        files = [folder / f"file{n:02d}.txt" for n in range(1, 6)]
+        names = [f"file{n:02d}.txt" for n in range(2, 7)]
+        journal_path = folder / "journal.db"
+        journal = RenameJournal(journal_path)
+        rename = Path.rename
+        done = []
+
+        def crashing_rename(path, target):
+            if len(done) == renames:
+                raise Crash()
+            done.append(path)
+            return rename(path, target)
+
+        with mock.patch.object(Path, "rename", crashing_rename):
+            with self.assertRaises(Crash):
+                FileRenamer().rename_files(files, names, journal=journal)
+        journal._conn.close()  # Unflushed marks are lost, as in a real crash
+        return RenameJournal(journal_path)
+
+    def recover(self, rollback):
+        for renames in range(5):
+            with self.subTest(renames=renames), tempfile.TemporaryDirectory() as temp:
+                folder = Path(temp)
+                journal = self.crash_after(folder, renames)
+                batches = journal.interrupted_batches()
+                self.assertEqual(len(batches), 1)
+                _, error_count, errors = FileRenamer().recover_batch(journal, batches[0], rollback)
+                self.assertEqual(error_count, 0, errors)
+                self.assertEqual(journal.interrupted_batches(), [])
+                journal.close()
+                contents = {path.name: path.read_text() for path in folder.glob("file*.txt")}
+                shift = 0 if rollback else 1
+                self.assertEqual(contents, {f"file{n + shift:02d}.txt": str(n) for n in range(1, 6)})
+
+    def test_rollback(self):
+        self.recover(rollback=True)
+
+    def test_resume(self):
+        self.recover(rollback=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
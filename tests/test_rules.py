@@ -0,0 +1,52 @@
+"""Search and replace gives the same names as re.sub, prefilter or not
+
+Run with: python -m unittest discover tests
+"""
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rules import ReplaceStep  # noqa: E402
+
+NAMES = ["IMG_0001.jpg", "img_0002.JPG", "holiday A.png", "Aardvark.txt", "report-2024-01.pdf",
+         "İstanbul.jpg", "ıi.txt", "a\\b.txt", "x.y.z", "", "AAA"]
+
+PATTERNS = [r"IMG_(\d+)", r"\x41", r"Aa", r"\N{LATIN CAPITAL LETTER A}", r"(a)\1",
+            r"\d{4}-\d{2}", r"\.jpg$", r"abc|IMG", r"(?i)img", r"[A-Z]+", r"\\", r"i"]
+
+
+class ReplaceStepTest(unittest.TestCase):
+
+    def test_regex_matches_re_sub(self):
+        for pattern in PATTERNS:
+            for ignore_case in (False, True):
+                flags = re.IGNORECASE if ignore_case else 0
+                step = ReplaceStep(pattern, "<\\g<0>>", use_regex=True, ignore_case=ignore_case)
+                expected = [re.sub(pattern, "<\\g<0>>", name, flags=flags) for name in NAMES]
+                with self.subTest(pattern=pattern, ignore_case=ignore_case):
+                    self.assertEqual(step.apply_many(NAMES), expected)
+                    self.assertEqual([step(name, 0, None) for name in NAMES], expected)
+                    self.assertEqual(step.match_counts(NAMES),
+                                     [len(re.findall(pattern, name, flags)) for name in NAMES])
+
+    def test_group_reference(self):
+        step = ReplaceStep(r"IMG_(\d+)", r"photo_\1", use_regex=True)
+        self.assertEqual(step("IMG_0001.jpg", 0, None), "photo_0001.jpg")
+
+    def test_plain_text_keeps_backslashes(self):
+        step = ReplaceStep("IMG", r"a\1", ignore_case=True)
+        self.assertEqual(step("img_1.jpg", 0, None), r"a\1_1.jpg")
+        self.assertEqual(ReplaceStep(".", "_")("a.b.c", 0, None), "a_b_c")
+
+    def test_bad_pattern(self):
+        with self.assertRaises(ValueError):
+            ReplaceStep("(", use_regex=True)
+        with self.assertRaises(ValueError):
+            ReplaceStep("a", r"\2", use_regex=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Watch daemon batching, driven by a scripted watcher instead of real events
+
+Run with: python -m unittest discover tests
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from renamer import FileRenamer  # noqa: E402
+from watch import WatchConfig, WatchDaemon  # noqa: E402
+
+
+class ScriptedWatcher:
+    """Returns the paths it is given, one wait() at a time"""
+
+    def __init__(self):
+        self.overflowed = False
+        self.removed = []
+        self.events = []
+
+    def wait(self, timeout):
+        events, self.events = self.events, []
+        return events
+
+    def close(self):
+        pass
+
+
+class WatchDaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.folder = Path(self._temp.name) / "inbox"
+        self.folder.mkdir()
+        (self.folder / "already_here.jpg").write_text("old")
+        config = WatchConfig(os.path.join(self._temp.name, "watch.json"), [self.folder],
+                             {"use_sequential": True, "base_name": "pic", "number_padding": "3"})
+        self.watcher = ScriptedWatcher()
+        self.daemon = WatchDaemon(FileRenamer(), config, watcher=self.watcher, settle=0, out=io.StringIO())
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def drop(self, *names):
+        for name in names:
+            (self.folder / name).write_text(name)
+        self.watcher.events.extend(self.folder / name for name in names)
+
+    def step(self, now):
+        for path in self.watcher.wait(0):
+            self.daemon.arrived(path, now)
+        if self.watcher.overflowed:
+            self.daemon._rescan(now)
+        self.daemon.process(self.daemon.ready(now))
+
+    def names(self):
+        return sorted(path.name for path in self.folder.iterdir())
+
+    def test_batches_carry_the_numbering_on(self):
+        self.drop("b.jpg", "a.jpg")
+        self.step(1.0)
+        self.drop("c.jpg")
+        self.step(2.0)
+        self.assertEqual(self.names(), ["already_here.jpg", "pic001.jpg", "pic002.jpg", "pic003.jpg"])
+        self.assertEqual((self.folder / "pic001.jpg").read_text(), "a.jpg")
+        self.assertEqual(self.daemon.config.next_index, 3)
+        self.assertEqual(self.daemon.index.listings, 1)
+
+    def test_own_renames_are_not_renamed_again(self):
+        self.drop("a.jpg")
+        self.step(1.0)
+        self.watcher.events.append(self.folder / "pic001.jpg")  # The event of the daemon's own rename
+        self.step(2.0)
+        self.assertEqual(self.names(), ["already_here.jpg", "pic001.jpg"])
+        self.assertEqual(self.daemon.produced, {})
+
+    def test_rescan_after_overflow_finds_copies_with_old_mtimes(self):
+        source = Path(self._temp.name) / "kept.jpg"
+        source.write_text("kept")
+        os.utime(source, (1, 1))
+        shutil.copy2(source, self.folder / "kept.jpg")  # Its event was lost
+        self.watcher.overflowed = True
+        with mock.patch("sys.stderr", io.StringIO()):
+            self.step(1.0)
+        self.assertEqual(self.names(), ["already_here.jpg", "pic001.jpg"])
+        self.assertEqual((self.folder / "pic001.jpg").read_text(), "kept")
+
+
+if __name__ == "__main__":
+    unittest.main()
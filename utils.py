@@ -1,13 +1,6 @@
 import os
 import sys
 
-try:
-    from tkinterdnd2 import DND_FILES
-    DRAG_DROP_AVAILABLE = True
-except ImportError:
-    DRAG_DROP_AVAILABLE = False
-    DND_FILES = None
-
 
 def resource_path(relative_path):
     """Get absolute path to resource, works for dev and for PyInstaller"""
@@ -18,8 +11,33 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 
-def check_drag_drop():
-    if not DRAG_DROP_AVAILABLE:
+def app_data_dir():
+    """Per-user folder for QuickRenamer's own files (rename journal, settings)"""
+    base = os.environ.get("APPDATA") or os.environ.get("XDG_DATA_HOME") \
+        or os.path.join(os.path.expanduser("~"), ".local", "share")
+    path = os.path.join(base, "QuickRenamer")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def load_drag_drop(root):
+    """Load tkinterdnd2 into an existing Tk root; returns DND_FILES, or None if unavailable
+
+    Importing tkinterdnd2 and loading its Tcl extension is one of the slower
+    parts of startup, so the GUI calls this after the window is on screen
+    instead of creating a TkinterDnD.Tk root up front.
+    """
+    try:
+        from tkinterdnd2 import DND_FILES, TkinterDnD
+    except ImportError:
         print("Warning: tkinterdnd2 not found. Drag-and-drop disabled.")
         print("Install with: pip install tkinterdnd2")
-    return DRAG_DROP_AVAILABLE
+        return None
+    # require is the public name; older tkinterdnd2 releases only have _require
+    require = getattr(TkinterDnD, "require", None) or TkinterDnD._require
+    try:
+        require(root)
+    except Exception as e:
+        print(f"Warning: could not load tkdnd, drag-and-drop disabled. ({e})")
+        return None
+    return DND_FILES
@@ -0,0 +1,370 @@
+"""Watch folders and rename files as they arrive
+
+A WatchDaemon waits for new files in a set of folders, lets them settle,
+and renames each batch with a saved rule set. Sequence numbers carry on
+from where the previous batch (or the previous run) stopped, because the
+number of files already named is stored with the rules.
+
+On Linux the folders are watched with inotify, so the daemon only ever
+touches the files that arrived. Elsewhere PollingWatcher stats each folder
+and lists it again only when its modification time changed. Either way the
+names in each folder are kept in one DirectoryIndex, listed once at start
+and then updated from the events and the daemon's own renames, so a batch
+costs as much as the files in it, not the folder.
+"""
+import fnmatch
+import json
+import os
+import select
+import stat
+import struct
+import sys
+import time
+from pathlib import Path
+
+from dirindex import DirectoryIndex
+from ingest import parse_patterns
+from planner import TEMP_SUFFIX
+from preflight import unclaim
+from rules import RenamePlan
+from sorting import natural_key
+
+SETTLE_SECONDS = 2.0
+POLL_SECONDS = 1.0
+MAX_BATCH = 5000
+MAX_WAIT = 1.0
+# How long the daemon waits for the event of one of its own renames
+PRODUCED_SECONDS = 60.0
+
+# Names that are still being written by a browser or a copy tool
+PARTIAL_SUFFIXES = (".part", ".partial", ".crdownload", ".download", ".tmp", TEMP_SUFFIX)
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")
+
+
+class WatchConfig:
+    """Folders, filter and rename options of a watch, plus how many files it has named
+
+    Stored as JSON so the daemon can be stopped and started again without
+    restarting the numbering. rules holds RenamePlan.from_options arguments.
+    """
+
+    def __init__(self, path, directories=(), rules=None, patterns="", next_index=0):
+        self.path = path
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.rules = dict(rules or {})
+        self.patterns = patterns
+        self.next_index = next_index
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(path, data.get("directories", ()), data.get("rules"),
+                   data.get("filter", ""), data.get("next_index", 0))
+
+    def save(self):
+        data = {
+            "directories": self.directories,
+            "filter": self.patterns,
+            "rules": self.rules,
+            "next_index": self.next_index,
+        }
+        # Write a new file and swap it in, so a crash never leaves half a config
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def plan(self):
+        return RenamePlan.from_options(**self.rules)
+
+
+class InotifyWatcher:
+    """Report files closed after writing or moved into the folders (Linux only)
+
+    Names deleted or moved out of the folders are collected in removed.
+    """
+
+    def __init__(self, directories):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        try:
+            for directory in directories:
+                wd = libc.inotify_add_watch(self._fd, os.fsencode(directory),
+                                            IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE)
+                if wd < 0:
+                    errno = ctypes.get_errno()
+                    raise OSError(errno, f"cannot watch '{directory}': {os.strerror(errno)}")
+                self.directories[wd] = Path(directory)
+        except OSError:
+            self.close()
+            raise
+        self.overflowed = False
+        self.removed = []
+
+    def wait(self, timeout):
+        """Paths that arrived, waiting up to timeout seconds for the first one"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        data = b""
+        while True:
+            try:
+                chunk = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            data += chunk
+
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+            elif wd in self.directories and name:
+                path = self.directories[wd] / os.fsdecode(name)
+                if mask & (IN_MOVED_FROM | IN_DELETE):
+                    self.removed.append(path)
+                else:
+                    paths.append(path)
+        return paths
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """Report new files by listing a folder again only when its mtime changed
+
+    Files already in the folders when watching starts are not reported;
+    names gone from a folder are collected in removed. A folder whose mtime
+    is within one interval of the scan is listed again on the next poll
+    too, since a file added in the same clock tick would not change it.
+    """
+
+    def __init__(self, directories, interval=POLL_SECONDS):
+        self.interval = interval
+        self.overflowed = False
+        self.removed = []
+        self._known = {}
+        self._mtimes = {}
+        for directory in directories:
+            directory = Path(directory)
+            self._mtimes[directory] = None
+            self._known[directory] = set()
+            self._scan(directory)
+
+    def _scan(self, directory):
+        """Update the listing of directory and return the names that are new"""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as entries:
+                names = {entry.name for entry in entries}
+        except OSError:
+            return []
+        racy = time.time_ns() - mtime < self.interval * 1e9
+        self._mtimes[directory] = None if racy else mtime
+        known = self._known[directory]
+        new = names - known
+        self.removed.extend(directory / name for name in known - names)
+        self._known[directory] = names
+        return sorted(new)
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + (timeout if timeout is not None else self.interval)
+        while True:
+            paths = []
+            for directory, known_mtime in self._mtimes.items():
+                try:
+                    if os.stat(directory).st_mtime_ns == known_mtime:
+                        continue
+                except OSError:
+                    continue
+                paths.extend(directory / name for name in self._scan(directory))
+            remaining = deadline - time.monotonic()
+            if paths or remaining <= 0:
+                return paths
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+def open_watcher(directories, poll=False):
+    """inotify where available, else (or with poll=True) a PollingWatcher"""
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable, polling instead. ({e})", file=sys.stderr)
+    return PollingWatcher(directories)
+
+
+def _wanted(name, patterns):
+    if name.startswith(".") or name.lower().endswith(PARTIAL_SUFFIXES):
+        return False
+    return not patterns or any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+class WatchDaemon:
+    """Rename files arriving in config.directories with config's rules
+
+    A file is renamed once it has gone settle seconds without a new event
+    and its size and mtime stopped changing. The path the daemon renames a
+    file to is remembered until its event comes in (or for
+    PRODUCED_SECONDS), so its own renames do not trigger it again but a new
+    file arriving later under the same name does. index holds the names in
+    the watched folders for collision checks.
+    """
+
+    def __init__(self, renamer, config, watcher=None, journal=None, settle=SETTLE_SECONDS,
+                 max_batch=MAX_BATCH, out=None):
+        self.renamer = renamer
+        self.config = config
+        self.watcher = watcher or open_watcher(config.directories)
+        self.journal = journal
+        self.settle = settle
+        self.max_batch = max_batch
+        self.out = out or sys.stdout
+        self.plan = config.plan()
+        self.patterns = parse_patterns(config.patterns)
+        self.pending = {}     # path -> [(size, mtime_ns), monotonic time of the last change]
+        self.produced = {}    # path -> monotonic time it was renamed to
+        self.index = DirectoryIndex()
+        for directory in config.directories:
+            self.index.relist(Path(directory))
+        self.renamed = 0
+
+    def arrived(self, path, now):
+        self.index.add(path.parent, path.name)
+        if self.produced.pop(path, None) is not None or not _wanted(path.name, self.patterns):
+            return
+        entry = self.pending.get(path)
+        if entry is not None:
+            entry[1] = now
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        if stat.S_ISREG(st.st_mode):
+            self.pending[path] = [(st.st_size, st.st_mtime_ns), now]
+
+    def gone(self, paths):
+        for path in paths:
+            # A new file may already have taken the name again
+            if not os.path.lexists(path):
+                self.index.release(path.parent, path.name)
+
+    def _rescan(self, now):
+        """After an inotify queue overflow, pick up the names the index has not seen yet
+
+        Compared by name rather than mtime, since copies that keep the
+        original mtime (cp -p, unzip) would otherwise be missed.
+        """
+        print("Too many events at once, listing the watched folders again", file=sys.stderr)
+        self.watcher.overflowed = False
+        for directory in self.config.directories:
+            directory = Path(directory)
+            try:
+                new = self.index.relist(directory)
+            except OSError:
+                continue
+            for name in new:
+                self.arrived(directory / name, now)
+
+    def ready(self, now):
+        """Pending files that have settled, sorted by folder and natural name"""
+        ready = []
+        for path, entry in list(self.pending.items()):
+            if now - entry[1] < self.settle:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            signature = (st.st_size, st.st_mtime_ns)
+            if signature != entry[0]:
+                entry[0] = signature
+                entry[1] = now
+                continue
+            del self.pending[path]
+            ready.append(path)
+        ready.sort(key=lambda path: (str(path.parent), natural_key(path.name)))
+        return ready
+
+    def process(self, files):
+        """Rename one settled batch and save where the numbering got to"""
+        for start in range(0, len(files), self.max_batch):
+            chunk = files[start:start + self.max_batch]
+            names = self.plan.apply(chunk, start_index=self.config.next_index)
+            report = self.renamer.preflight(chunk, names, index=self.index)
+            for issue in report.issues:
+                print(f"Warning: {issue}", file=sys.stderr)
+            unclaim(report, self.index)
+            renamed = list(report.files)
+            success_count, error_count, errors, history = self.renamer.rename_files(
+                renamed, report.names, journal=self.journal, index=self.index)
+            now = time.monotonic()
+            self.produced.update((new_path, now) for _, new_path in history)
+            for old_path, new_path in zip(report.files, renamed):
+                if old_path != new_path:
+                    self.out.write(f"{old_path} -> {new_path.name}\n")
+            for error in errors:
+                print(f"Error: {error}", file=sys.stderr)
+            self.out.flush()
+            self.renamed += success_count
+            self.config.next_index += len(chunk)
+            self.config.save()
+
+    def run(self, stop=None):
+        """Watch until stop (a threading.Event) is set or the process is interrupted"""
+        try:
+            while stop is None or not stop.is_set():
+                timeout = MAX_WAIT
+                if self.pending:
+                    oldest = min(entry[1] for entry in self.pending.values())
+                    timeout = max(0.0, min(timeout, oldest + self.settle - time.monotonic()))
+                paths = self.watcher.wait(timeout)
+                now = time.monotonic()
+                for path in paths:
+                    self.arrived(path, now)
+                if self.watcher.removed:
+                    removed, self.watcher.removed = self.watcher.removed, []
+                    self.gone(removed)
+                if self.watcher.overflowed:
+                    self._rescan(now)
+                if self.produced:
+                    self.produced = {path: when for path, when in self.produced.items()
+                                     if now - when < PRODUCED_SECONDS}
+                ready = self.ready(now)
+                if ready:
+                    self.process(ready)
+        finally:
+            self.watcher.close()
+        return self.renamed